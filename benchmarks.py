@@ -0,0 +1,324 @@
+"""
+Benchmarks for the problem rendering path.
+
+Run the benchmarks and save the results::
+
+   $ python benchmarks.py run --output build/benchmarks.json
+
+Compare the results against a previous run and fail if any benchmark
+is more than 10% slower::
+
+   $ python benchmarks.py compare baseline.json build/benchmarks.json \\
+       --threshold 0.10
+
+Each benchmark isolates one layer of the rendering path:
+
+problem-*
+    constructing :class:`problemdetails.Problem` instances
+write-error-*
+    calling :meth:`problemdetails.ErrorWriter.write_error` directly
+    with and without an exception and with extension members of
+    various sizes
+round-trip-*
+    sending requests through a local HTTP server
+import-time
+    importing the package in a fresh interpreter after Tornado has
+    been imported.  The test suite fails if the fastest import takes
+    longer than ``IMPORT_TIME_BUDGET`` seconds.
+
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+import typing
+from unittest import mock
+
+from tornado import httpclient, httpserver, httputil, netutil, web
+import tornado
+
+import problemdetails
+
+EXTENSION_SIZES = {'tiny': 1, 'small': 10, 'large': 1_000, 'huge': 10_000}
+
+ROUND_TRIP_QUERIES = {
+    'round-trip-send-error': '',
+    'round-trip-tiny-extension': '?size=tiny',
+    'round-trip-large-extension': '?size=large',
+}
+"""Query strings of the round trip benchmarks by name."""
+
+IMPORT_TIME_BUDGET = 0.1
+"""Maximum number of seconds that importing the package may take."""
+
+IMPORT_TIME_SCRIPT = '''
+import sys, time
+import tornado.web
+start = time.perf_counter()
+import problemdetails
+sys.stdout.write(repr(time.perf_counter() - start))
+'''
+
+
+class Handler(problemdetails.ErrorWriter, web.RequestHandler):
+    def get(self) -> None:
+        size = self.get_query_argument('size', None)
+        if size is None:
+            self.send_error(404)
+        else:
+            raise problemdetails.Problem(
+                422,
+                title='Failed to process request',
+                failure=make_failures(EXTENSION_SIZES[size]))
+
+
+def make_failures(count: int) -> list[dict[str, typing.Any]]:
+    """Create a list resembling JSON schema validation failures."""
+    return [{
+        'absolute_path': ['address', idx],
+        'absolute_schema_path': ['properties', 'address', 'required'],
+        'context': [],
+        'message': f"'country' is a required property ({idx})",
+    } for idx in range(count)]
+
+
+def make_handler() -> Handler:
+    application = web.Application([web.url('/', Handler)])
+    request = httputil.HTTPServerRequest(
+        method='GET', uri='/', connection=mock.Mock())
+    return Handler(application, request)
+
+
+def render(handler: Handler, status_code: int,
+           **kwargs: typing.Any) -> typing.Callable[[], None]:
+    def benchmark() -> None:
+        handler.clear()
+        handler.write_error(status_code, **kwargs)
+
+    return benchmark
+
+
+def build_benchmarks() -> dict[str, typing.Callable[[], typing.Any]]:
+    catalog = problemdetails.ProblemCatalog(base_uri='/errors#')
+    throttled = catalog.register('throttled', 429, title='Slow down')
+    benchmarks: dict[str, typing.Callable[[], typing.Any]] = {
+        'problem-minimal':
+        lambda: problemdetails.Problem(404),
+        'problem-standard-members':
+        lambda: problemdetails.Problem(
+            429,
+            title='Slow down',
+            detail='Try again later',
+            instance='/requests/1234'),
+        'problem-catalog':
+        lambda: throttled(detail='Try again later'),
+    }
+
+    handler = make_handler()
+    benchmarks['write-error-without-exception'] = render(handler, 404)
+    problem = problemdetails.Problem(429, title='Slow down')
+    benchmarks['write-error-with-problem'] = render(
+        handler, 429, exc_info=(type(problem), problem, None))
+    problem = throttled(detail='Try again later')
+    benchmarks['write-error-with-catalog-problem'] = render(
+        handler, 429, exc_info=(type(problem), problem, None))
+    for name, count in EXTENSION_SIZES.items():
+        problem = problemdetails.Problem(422, failure=make_failures(count))
+        benchmarks[f'write-error-{name}-extension'] = render(
+            handler, 422, exc_info=(type(problem), problem, None))
+    return benchmarks
+
+
+def measure(benchmark: typing.Callable[[], typing.Any], repeat: int,
+            min_time: float) -> dict[str, float]:
+    """Time `benchmark` and return per-call statistics in seconds."""
+    timer = timeit.Timer(benchmark)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    samples = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'iterations': number,
+        'repeat': repeat,
+    }
+
+
+async def measure_round_trips(
+        repeat: int,
+        requests: int,
+        names: typing.Collection[str] = ROUND_TRIP_QUERIES
+) -> dict[str, dict[str, float]]:
+    sockets = netutil.bind_sockets(0, '127.0.0.1')
+    port = sockets[0].getsockname()[1]
+    application = web.Application([web.url('/', Handler)],
+                                  log_function=lambda handler: None)
+    server = httpserver.HTTPServer(application)
+    server.add_sockets(sockets)
+    client = httpclient.AsyncHTTPClient()
+    urls = {
+        name: f'http://127.0.0.1:{port}/{ROUND_TRIP_QUERIES[name]}'
+        for name in names
+    }
+
+    results = {}
+    try:
+        for name, url in urls.items():
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                for _ in range(requests):
+                    await client.fetch(url, raise_error=False)
+                samples.append((time.perf_counter() - start) / requests)
+            results[name] = {
+                'min': min(samples),
+                'median': statistics.median(samples),
+                'stdev': statistics.stdev(samples) if repeat > 1 else 0.0,
+                'iterations': requests,
+                'repeat': repeat,
+            }
+    finally:
+        server.stop()
+        await server.close_all_connections()
+    return results
+
+
+def measure_import_time(repeat: int) -> dict[str, float]:
+    """Time importing the package in `repeat` fresh interpreters."""
+    samples = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', IMPORT_TIME_SCRIPT],
+                                capture_output=True,
+                                check=True,
+                                text=True)
+        samples.append(float(result.stdout))
+    return {
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'stdev': statistics.stdev(samples) if repeat > 1 else 0.0,
+        'iterations': 1,
+        'repeat': repeat,
+    }
+
+
+def run(args: argparse.Namespace) -> int:
+    def selected(name: str) -> bool:
+        return not args.filter or args.filter in name
+
+    results: dict[str, dict[str, float]] = {}
+    for name, benchmark in build_benchmarks().items():
+        if not selected(name):
+            continue
+        results[name] = measure(benchmark, args.repeat, args.min_time)
+        report(name, results[name])
+    round_trip_names = [name for name in ROUND_TRIP_QUERIES if selected(name)]
+    if round_trip_names:
+        round_trips = asyncio.run(
+            measure_round_trips(args.repeat, args.requests, round_trip_names))
+        for name, result in round_trips.items():
+            results[name] = result
+            report(name, result)
+    if selected('import-time'):
+        results['import-time'] = measure_import_time(args.repeat)
+        report('import-time', results['import-time'])
+
+    document = {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'tornado': tornado.version,
+        'problemdetails': problemdetails.version,
+        'timestamp': time.time(),
+        'benchmarks': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(document, output, indent=2)
+    return 0
+
+
+def compare(args: argparse.Namespace) -> int:
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)['benchmarks']
+    with open(args.current) as current_file:
+        current = json.load(current_file)['benchmarks']
+
+    regressions = []
+    for name in sorted(set(baseline) & set(current)):
+        before, after = baseline[name][args.stat], current[name][args.stat]
+        change = (after - before) / before if before else 0.0
+        flag = ''
+        if change > args.threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        sys.stdout.write(f'{name:<40} {before * 1e6:12.3f}us '
+                         f'{after * 1e6:12.3f}us {change:+8.1%}{flag}\n')
+    for name in sorted(set(baseline) ^ set(current)):
+        sys.stdout.write(f'{name:<40} only present in one result set\n')
+
+    if regressions:
+        sys.stdout.write(f'{len(regressions)} benchmark(s) regressed by '
+                         f'more than {args.threshold:.0%}\n')
+        return 1
+    return 0
+
+
+def report(name: str, result: dict[str, float]) -> None:
+    sys.stdout.write(f'{name:<40} {result["median"] * 1e6:12.3f}us '
+                     f'(+/- {result["stdev"] * 1e6:.3f}us)\n')
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('-o', '--output', help='write results to OUTPUT')
+    run_parser.add_argument(
+        '-k', '--filter', help='only run benchmarks containing FILTER')
+    run_parser.add_argument(
+        '--repeat',
+        type=int,
+        default=5,
+        help='number of samples per benchmark')
+    run_parser.add_argument(
+        '--min-time',
+        type=float,
+        default=0.2,
+        help='minimum seconds per sample')
+    run_parser.add_argument(
+        '--requests',
+        type=int,
+        default=200,
+        help='requests per round-trip sample')
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser(
+        'compare', help='compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.10,
+        help='fail if a benchmark slows by more than this fraction')
+    compare_parser.add_argument(
+        '--stat',
+        choices=['min', 'median'],
+        default='median',
+        help='statistic to compare')
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,14 @@
 """
 Simple handler that invokes httpbin.org/status.
 
-This file contains a simple handler that sends a request to httpbin.org,
-receives an error response (from Tornado), and formats it into a problem
-document.  The example handler shows how to catch a HTTPError and
-transform it into a problemdetails.Problem.
+This file contains a simple handler that sends a request to httpbin.org
+using a problemdetails.ProblemClient.  Error responses are raised as
+problemdetails.Problem instances that wrap the upstream response in a
+502 Bad Gateway document.  The circuit for httpbin.org opens after
+repeated server errors and requests fail immediately with a 503
+Service Unavailable document until it closes again.  Client errors
+such as 404 Not Found are cached for a few seconds so repeated requests
+do not leave the process.
 
 """
 import asyncio
@@ -12,8 +16,13 @@ import logging
 import os
 import signal
 
-from tornado import httpclient, web
+from tornado import web
 import problemdetails
+from problemdetails import client
+
+upstream = problemdetails.ProblemClient(
+    propagate=False,
+    problem_cache=client.UpstreamProblemCache(default_ttl=5.0))
 
 
 class HttpBinHandler(problemdetails.ErrorWriter, web.RequestHandler):
@@ -23,15 +32,9 @@ class HttpBinHandler(problemdetails.ErrorWriter, web.RequestHandler):
             self.get_query_argument('status', '500'))
         logger.info('retrieving %s', url)
 
-        client = httpclient.AsyncHTTPClient()
-        try:
-            response = await client.fetch(url)
-            self.add_header('Content-Type', 'application/json')
-            self.write(response.body)
-        except httpclient.HTTPError as error:
-            raise problemdetails.Problem(
-                status_code=error.code,
-                httpbin_headers=dict(error.response.headers.items()))
+        response = await upstream.fetch(url)
+        self.add_header('Content-Type', 'application/json')
+        self.write(response.body)
 
 
 async def main():
@@ -7,6 +7,10 @@ import signal
 from tornado import web
 import problemdetails
 
+problems = problemdetails.ProblemCatalog(base_uri='https://example.com/probs/')
+out_of_credit = problems.register('out-of-credit', 403,
+                                  title='You do not have enough credit.')
+
 
 class AccountHandler(problemdetails.ErrorWriter, web.RequestHandler):
     def post(self, account):
@@ -17,15 +21,12 @@ class AccountHandler(problemdetails.ErrorWriter, web.RequestHandler):
     def verify_funds(self, account, price):
         balance = self.get_balance(account)
         if price > balance:
-            raise problemdetails.Problem(
-                status_code=403,
-                title='You do not have enough credit.',
+            raise out_of_credit(
                 detail=(f'Your current balance is {balance}, but that '
                         f'costs {price}'),
                 instance=self.reverse_url('account-handler', account),
                 balance=balance,
                 accounts=self.lookup_accounts(account),
-                type='https://example.com/probs/out-of-credit',
             )
 
     def get_balance(self, account):
@@ -91,7 +92,7 @@ async def main():
         web.url(r'/account/(?P<account>\d+)', AccountHandler,
                 name='account-handler'),
         web.url(r'/invalid-params', ValidationError),
-    ], debug=True)
+    ], debug=True, default_handler_class=problemdetails.NotFoundHandler)
 
     port = int(os.environ.get('PORT', '8000'))
     stem = 'http://127.0.0.1:{0}'.format(port)
@@ -17,10 +17,14 @@ GET /openapi.json
 
 The Open API specification is embedded as a long literal YAML string.  It
 is deserialized and stored in the application settings so handlers refer
-to it using ``self.settings['openapi']``.  The creation handler uses the
-JSON schema embedded in the API specification to validate the request
-entity and transforms JSON schema validation errors into a readable error
-document.
+to it using ``self.settings['openapi']``.  The creation handler validates
+the request entity against the JSON schema embedded in the API
+specification using a :class:`problemdetails.SchemaValidator` that is
+stored as ``self.settings['validator']``.  The validator compiles the
+schema once and reports validation failures as a 422 problem document.
+The problem responses declared in the specification are compiled into
+a :class:`problemdetails.OpenAPICatalog` that handlers refer to using
+``self.settings['problems']``.
 
 """
 import asyncio
@@ -33,7 +37,6 @@ import signal
 import uuid
 
 from tornado import web
-import jsonschema.exceptions
 import problemdetails
 import yaml
 
@@ -85,7 +88,7 @@ paths:
                 $ref: "#/components/schemas/ProblemDocument"
               example:
                 title: "Customer does not exist"
-                type: "/errors#customer-does-not-exist"
+                type: "/errors#error-customer-does-not-exist"
                 status_code: 404
                 instance: "/1234"
 components:
@@ -150,9 +153,18 @@ components:
         detail:
           description: Additional details about the failure
           type: string
-        failure:
-          description: Structured details about the failure
-          type: object
+        invalid-params:
+          description: Request values that failed validation
+          type: array
+          items:
+            type: object
+            properties:
+              name:
+                description: JSON pointer to the invalid value
+                type: string
+              reason:
+                description: Why the value is invalid
+                type: string
       required:
         - status_code
         - type
@@ -166,13 +178,6 @@ def jsonify(obj):
     """Transform `obj` into something that the JSON encoder can handle."""
     if isinstance(obj, uuid.UUID):
         return str(obj)
-    if isinstance(obj, jsonschema.ValidationError):
-        return {
-            'absolute_path': list(obj.absolute_path),
-            'absolute_schema_path': list(obj.absolute_schema_path),
-            'context': obj.context,
-            'message': obj.message,
-        }
     if isinstance(obj, Exception):
         return {
             'exception': obj.__class__.__name__,
@@ -228,19 +233,8 @@ class CreateHandler(problemdetails.ErrorWriter, web.RequestHandler):
                 failure=error,
             )
 
-        openapi = self.settings['openapi']
-        validator = jsonschema.Draft7Validator(
-            schema=openapi['components']['schemas']['CustomerDetails'])
-        all_errors = list(validator.iter_errors(body))
-        most_important = jsonschema.exceptions.best_match(all_errors)
-        if most_important is not None:
-            raise problemdetails.Problem(
-                status_code=422,
-                type='/errors#jsonschema-failure',
-                title='Failed to process request',
-                detail=most_important.message,
-                failure=all_errors,
-            )
+        self.settings['validator'].validate(
+            body, '#/components/schemas/CustomerDetails')
 
         record_id = self.settings['database'].insert(body)
         self.redirect(self.reverse_url('retrieve', record_id), status=303)
@@ -249,13 +243,13 @@ class CreateHandler(problemdetails.ErrorWriter, web.RequestHandler):
 class FetchHandler(problemdetails.ErrorWriter, web.RequestHandler):
     """Retrieve a customer."""
 
+    problem_cache_control = {404: 'public, max-age=60'}
+
     def get(self, record_id):
         record = self.settings['database'].fetch(record_id)
         if record is None:
-            raise problemdetails.Problem(
-                status_code=404,
-                type='/errors#error-customer-does-not-exist',
-                title='Customer {0} does not exist'.format(record_id),
+            raise self.settings['problems']['getCustomer:404'](
+                detail='Customer {0} does not exist'.format(record_id),
                 instance=self.reverse_url('retrieve', record_id),
             )
 
@@ -309,10 +303,19 @@ async def main():
     app.settings['debug'] = True
     app.settings['json-encoder'] = json.JSONEncoder(default=jsonify)
     app.settings['openapi'] = yaml.safe_load(OPENAPI_SCHEMA)
-
-    # Update the error writer's JSON encoder so that it knows
-    # how to handle validation errors
-    problemdetails.ErrorWriter.json_encoder.default = jsonify
+    app.settings['validator'] = problemdetails.SchemaValidator(
+        app.settings['openapi'],
+        type='/errors#jsonschema-failure',
+        title='Failed to process request',
+    )
+
+    # Update the error writer's serializer so that it knows
+    # how to handle decoding errors
+    problemdetails.ErrorWriter.serializer.register_default(jsonify)
+
+    # Compile the problem types after the serializer is configured
+    app.settings['problems'] = problemdetails.OpenAPICatalog(
+        app.settings['openapi'])
 
     port = int(os.environ.get('PORT', '8000'))
     app.listen(address='127.0.0.1', port=port)
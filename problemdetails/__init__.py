@@ -1,11 +1,67 @@
-from importlib import metadata
+import importlib
+import typing
 
+from problemdetails.budget import ProblemBudget
+from problemdetails.cache import ProblemCache
 from problemdetails.errors import Problem
-from problemdetails.handlers import ErrorWriter, type_link_map
+from problemdetails.events import ProblemEventRecorder
+from problemdetails.handlers import (ErrorWriter, NotFoundHandler,
+                                     type_link_map)
+from problemdetails.catalog import ProblemCatalog, ProblemType
+from problemdetails.compression import ProblemCompressor
+from problemdetails.counters import SharedProblemCounters
+from problemdetails.localization import ProblemTranslations
+from problemdetails.metrics import MetricsHandler, ProblemMetrics
+from problemdetails.sampling import ProblemLogSampler
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    from problemdetails.client import ProblemClient
+    from problemdetails.openapi import OpenAPICatalog
+    from problemdetails.shedding import LoadShedder, LoadSheddingMixin
+    from problemdetails.validation import SchemaValidator
+
+    version: str
+    version_info: list[int | str]
+
+# Exports that are imported when they are first accessed.  These
+# modules import optional or slow dependencies that short-lived
+# processes rarely need.
+_lazy_exports = {
+    'LoadShedder': 'problemdetails.shedding',
+    'LoadSheddingMixin': 'problemdetails.shedding',
+    'OpenAPICatalog': 'problemdetails.openapi',
+    'ProblemClient': 'problemdetails.client',
+    'SchemaValidator': 'problemdetails.validation',
+}
+
+
+def __getattr__(name: str) -> typing.Any:
+    if name in _lazy_exports:
+        value = getattr(importlib.import_module(_lazy_exports[name]), name)
+    elif name == 'version':
+        # importlib.metadata scans the installed distributions
+        from importlib import metadata
+        value = metadata.version('tornado-problem-details')
+    elif name == 'version_info':
+        value = [
+            int(c) if c.isdigit() else c
+            for c in __getattr__('version').split('.')
+        ]
+    else:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
 
-version = metadata.version('tornado-problem-details')
-version_info = [int(c) if c.isdigit() else c for c in version.split('.')]
 
 __all__ = [
-    'ErrorWriter', 'Problem', 'type_link_map', 'version', 'version_info'
+    'ErrorWriter', 'LoadShedder', 'LoadSheddingMixin', 'MetricsHandler',
+    'NotFoundHandler', 'OpenAPICatalog', 'Problem', 'ProblemBudget',
+    'ProblemCache', 'ProblemCatalog', 'ProblemClient', 'ProblemCompressor',
+    'ProblemEventRecorder', 'ProblemLogSampler', 'ProblemMetrics',
+    'ProblemTranslations', 'ProblemType', 'SchemaValidator',
+    'SharedProblemCounters', 'type_link_map', 'version', 'version_info'
 ]
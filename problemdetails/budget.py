@@ -0,0 +1,257 @@
+"""Size limits for problem documents.
+
+A :class:`ProblemBudget` installed as
+:attr:`problemdetails.ErrorWriter.problem_budget` limits how large a
+rendered problem document can be.  The document is encoded one value
+at a time, descending into nested objects and lists, and encoding stops
+as soon as the budget is exhausted, so an oversized extension never has
+to be encoded completely.
+
+Values are trimmed deterministically in document order at every depth:
+
+- lists and tuples keep their leading elements
+- objects keep the members that fit
+- strings keep their leading characters
+- other values are omitted if they do not fit
+
+The *type* and *status* members are never removed.  The trimmed
+members are described by an extension member that is named
+``truncated`` by default:
+
+.. code-block:: json
+
+   {
+      "type": "https://example.com/probs/invalid-input",
+      "status": 422,
+      "failure": [{"index": 0}, {"index": 1}],
+      "truncated": {
+         "failure": {"kept": 2, "total": 5000}
+      }
+   }
+
+Nested values are described by their path which joins the member name
+with the keys and indexes that lead to the value using ``/``, for
+example ``failure/0/detail``.  A ``/`` or ``~`` in a key is escaped as
+``~1`` or ``~0`` like a JSON pointer.
+
+"""
+from __future__ import annotations
+
+import json
+import sys
+import typing
+
+from problemdetails import serializers
+
+_REQUIRED_MEMBERS = frozenset(['type', 'status'])
+
+_Encoded = typing.Optional[typing.Tuple[bytes, typing.Any]]
+
+
+class ProblemBudget:
+    """Byte and element limits for problem documents.
+
+    :param max_bytes: maximum size of the encoded members.  The
+        truncation member is added after the budget is applied.
+    :param max_elements: maximum number of list elements across the
+        whole document including nested lists
+    :param max_string_length: maximum number of characters in a
+        string value at any depth
+    :param member: name of the extension member that describes the
+        trimmed members
+
+    Each limit is disabled when it is :data:`None`.  The sizes are
+    exact for JSON serializers and approximate for binary serializers
+    since their containers are measured by encoding the elements
+    individually.
+
+    """
+
+    def __init__(self,
+                 max_bytes: int | None = None,
+                 max_elements: int | None = None,
+                 max_string_length: int | None = None,
+                 member: str = 'truncated') -> None:
+        self.max_bytes = max_bytes
+        self.max_elements = max_elements
+        self.max_string_length = max_string_length
+        self.member = member
+
+    def fingerprint(self) -> typing.Hashable:
+        """Return a value that changes when the limits change."""
+        return (self.max_bytes, self.max_elements, self.max_string_length,
+                self.member)
+
+    def encode(self, document: dict[str, typing.Any],
+               serializer: serializers.Serializer) -> bytes:
+        """Encode `document` with `serializer` within the budget."""
+        dumps = serializer.dumps
+        is_json = serializers.produces_json(serializer)
+        encoder = _BudgetEncoder(
+            dumps,
+            (sys.maxsize if self.max_bytes is None else self.max_bytes) - 2,
+            sys.maxsize if self.max_elements is None else self.max_elements,
+            self.max_string_length)
+
+        fragments: list[bytes] = []
+        trimmed: dict[str, typing.Any] = {}
+        for name, value in document.items():
+            if name == self.member:
+                continue
+            prefix = dumps(name) + b':'
+            if fragments:
+                prefix = b',' + prefix
+            if name in _REQUIRED_MEMBERS:
+                encoded = dumps(value)
+                encoder.remaining -= len(prefix) + len(encoded)
+            else:
+                if len(prefix) > encoder.remaining:
+                    encoder.truncated[name] = {'omitted': True}
+                    continue
+                encoder.remaining -= len(prefix)
+                result = encoder.encode(value, name)
+                if result is None:
+                    encoder.remaining += len(prefix)
+                    encoder.truncated[name] = {'omitted': True}
+                    continue
+                encoded, value = result
+            fragments.append(prefix + encoded)
+            trimmed[name] = value
+
+        truncated = encoder.truncated
+        if truncated:
+            trimmed[self.member] = truncated
+            fragments.append((b',' if fragments else b'') +
+                             dumps(self.member) + b':' + dumps(truncated))
+        if not is_json:
+            return dumps(trimmed)
+        return b'{' + b''.join(fragments) + b'}'
+
+
+class _BudgetEncoder:
+    """Encode values one at a time while tracking the remaining budget."""
+
+    def __init__(self, dumps: typing.Callable[[typing.Any], bytes],
+                 remaining: int, elements: int,
+                 max_length: int | None) -> None:
+        self.dumps = dumps
+        self.remaining = remaining
+        self.elements = elements
+        self.max_length = max_length
+        self.truncated: dict[str, dict[str, typing.Any]] = {}
+
+    def encode(self, value: typing.Any, path: str) -> _Encoded:
+        """Encode `value` or return :data:`None` if nothing fits.
+
+        The size of the returned bytes is deducted from the remaining
+        budget.  Nothing is deducted when :data:`None` is returned.
+
+        """
+        if isinstance(value, str):
+            return self._encode_string(value, path)
+        if isinstance(value, (list, tuple)):
+            return self._encode_list(value, path)
+        if isinstance(value, dict):
+            return self._encode_dict(value, path)
+        encoded = self.dumps(value)
+        if len(encoded) > self.remaining:
+            return None
+        self.remaining -= len(encoded)
+        return encoded, value
+
+    def _encode_string(self, value: str, path: str) -> _Encoded:
+        total = len(value)
+        if self.max_length is not None and total > self.max_length:
+            value = value[:self.max_length]
+        # every character encodes into at least one byte so there is no
+        # reason to encode more characters than the remaining budget
+        value = value[:max(self.remaining, 0)]
+        encoded = self.dumps(value)
+        if len(encoded) > self.remaining:
+            shortened = _shorten(value, self.remaining, self.dumps)
+            if shortened is None:
+                return None
+            value = shortened
+            encoded = self.dumps(value)
+        if len(value) < total:
+            self.truncated[path] = {'kept': len(value), 'total': total}
+        self.remaining -= len(encoded)
+        return encoded, value
+
+    def _encode_list(self, value: typing.Sequence[typing.Any],
+                     path: str) -> _Encoded:
+        if self.remaining < 2:
+            return None
+        self.remaining -= 2
+        kept: list[typing.Any] = []
+        encoded_elements: list[bytes] = []
+        for index, element in enumerate(value):
+            separator = 1 if kept else 0
+            if self.elements <= 0 or separator >= self.remaining:
+                break
+            self.remaining -= separator
+            self.elements -= 1
+            result = self.encode(element, f'{path}/{index}')
+            if result is None:
+                self.remaining += separator
+                self.elements += 1
+                break
+            encoded_elements.append(result[0])
+            kept.append(result[1])
+        if len(kept) < len(value):
+            self.truncated[path] = {'kept': len(kept), 'total': len(value)}
+        return b'[' + b','.join(encoded_elements) + b']', kept
+
+    def _encode_dict(self, value: dict[typing.Any, typing.Any],
+                     path: str) -> _Encoded:
+        if self.remaining < 2:
+            return None
+        self.remaining -= 2
+        kept: dict[typing.Any, typing.Any] = {}
+        encoded_members: list[bytes] = []
+        for key, member in value.items():
+            if self.remaining <= 0:
+                break
+            prefix = self.dumps(_member_name(key)) + b':'
+            if kept:
+                prefix = b',' + prefix
+            if len(prefix) >= self.remaining:
+                continue
+            self.remaining -= len(prefix)
+            result = self.encode(member, f'{path}/{_escape(key)}')
+            if result is None:
+                self.remaining += len(prefix)
+                continue
+            encoded_members.append(prefix + result[0])
+            kept[key] = result[1]
+        if len(kept) < len(value):
+            self.truncated[path] = {'kept': len(kept), 'total': len(value)}
+        return b'{' + b''.join(encoded_members) + b'}', kept
+
+
+def _member_name(key: typing.Any) -> str:
+    """Return the JSON member name that `key` is encoded as."""
+    if isinstance(key, str):
+        return key
+    if isinstance(key, bool) or key is None:
+        return json.dumps(key)
+    return str(key)
+
+
+def _escape(key: typing.Any) -> str:
+    return _member_name(key).replace('~', '~0').replace('/', '~1')
+
+
+def _shorten(value: str, size: int,
+             dumps: typing.Callable[[typing.Any], bytes]) -> str | None:
+    """Return the longest prefix of `value` that encodes into `size` bytes."""
+    low, high = 0, min(len(value), max(size, 0))
+    if size < len(dumps('')):
+        return None
+    while low < high:
+        middle = (low + high + 1) // 2
+        if len(dumps(value[:middle])) <= size:
+            low = middle
+        else:
+            high = middle - 1
+    return value[:low]
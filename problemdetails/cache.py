@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import collections
+import sys
+import typing
+
+
+class CacheInfo(typing.NamedTuple):
+    """Statistics reported by :meth:`ProblemCache.info`."""
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    maxsize: int
+    currsize: int
+
+
+class ProblemCache:
+    """Bounded LRU cache of fully encoded problem bodies.
+
+    :param maxsize: maximum number of encoded bodies to retain
+    :param max_values: documents with more than this many values,
+        counting members and the elements of lists and dictionaries,
+        bypass the cache
+
+    Install an instance as :attr:`problemdetails.ErrorWriter.problem_cache`
+    to enable caching.  The cache key is the *canonical document*
+    which is computed after the default ``type`` link is added so
+    changes to :data:`problemdetails.type_link_map` simply produce
+    different keys.  Entries are grouped into *partitions* and the
+    entries in a partition are discarded whenever the *token* passed
+    to :meth:`lookup` for the partition changes.  The error writer
+    partitions entries by representation and uses the content type
+    and serializer fingerprint as the token so modifying either
+    invalidates the cached bodies.
+
+    Documents that contain values other than strings, numbers,
+    booleans, ``None``, lists, tuples, and dictionaries with string
+    keys are not cacheable and bypass the cache entirely.  So do large
+    documents since computing their keys costs more than encoding them
+    and they are rarely rendered twice.
+
+    """
+
+    def __init__(self, maxsize: int = 128, max_values: int = 1000) -> None:
+        if maxsize < 1:
+            raise ValueError('maxsize must be positive')
+        self.maxsize = maxsize
+        self.max_values = max_values
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: collections.OrderedDict[
+            tuple[typing.Hashable, typing.
+                  Hashable], bytes] = collections.OrderedDict()
+        self._tokens: dict[typing.Hashable, typing.Hashable] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self,
+               token: typing.Hashable,
+               key: typing.Hashable,
+               partition: typing.Hashable = None) -> bytes | None:
+        """Retrieve the encoded body for `key` if it is present.
+
+        :param token: identifies the rendering configuration.  The
+            partition is cleared if this differs from the previous
+            token for the partition.
+        :param key: canonical document as returned by :func:`make_key`
+        :param partition: group that the entry belongs to
+
+        """
+        if partition not in self._tokens:
+            self._tokens[partition] = token
+        elif self._tokens[partition] != token:
+            self._tokens[partition] = token
+            self._invalidate(partition)
+        try:
+            body = self._entries[partition, key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._entries.move_to_end((partition, key))
+        self.hits += 1
+        return body
+
+    def store(self,
+              key: typing.Hashable,
+              body: bytes,
+              partition: typing.Hashable = None) -> None:
+        """Add an encoded body to the cache evicting the LRU entry."""
+        self._entries[partition, key] = body
+        self._entries.move_to_end((partition, key))
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Remove all cached bodies and reset the statistics."""
+        self._entries.clear()
+        self._tokens.clear()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def info(self) -> CacheInfo:
+        """Return a snapshot of the cache statistics."""
+        return CacheInfo(self.hits, self.misses, self.evictions,
+                         self.invalidations, self.maxsize, len(self._entries))
+
+    def _invalidate(self, partition: typing.Hashable) -> None:
+        stale = [key for key in self._entries if key[0] == partition]
+        if stale:
+            self.invalidations += 1
+            for key in stale:
+                del self._entries[key]
+
+
+class _Uncacheable(Exception):
+    pass
+
+
+def _freeze(value: typing.Any, budget: list[int]) -> typing.Hashable:
+    # str, int, and None cannot compare equal to each other so they
+    # are used directly.  bool and float are tagged since True == 1
+    # and 1.0 == 1 but they encode differently.
+    cls = type(value)
+    if cls is str or cls is int or value is None:
+        return value
+    if cls is bool or cls is float:
+        return cls, value
+    if cls is list or cls is tuple:
+        budget[0] -= len(value)
+        if budget[0] < 0:
+            raise _Uncacheable()
+        return list, tuple(_freeze(v, budget) for v in value)
+    if cls is dict:
+        return dict, _freeze_items(value, budget)
+    raise _Uncacheable()
+
+
+def _freeze_items(document: dict[str, typing.Any], budget: list[int]) -> tuple:
+    budget[0] -= len(document)
+    if budget[0] < 0:
+        raise _Uncacheable()
+    items = []
+    for name, value in document.items():
+        if type(name) is not str:
+            raise _Uncacheable()
+        items.append((name, _freeze(value, budget)))
+    return tuple(items)
+
+
+def make_key(document: dict[str, typing.Any],
+             max_values: int | None = None) -> typing.Hashable | None:
+    """Compute the canonical cache key for `document`.
+
+    :param document: the document to compute the key for
+    :param max_values: optional limit on the number of values in
+        `document`, counting members and the elements of lists and
+        dictionaries
+    :returns: a hashable representation that preserves member order
+        and value types or :data:`None` if the document is not
+        cacheable
+
+    """
+    budget = [sys.maxsize if max_values is None else max_values]
+    try:
+        return _freeze_items(document, budget)
+    except _Uncacheable:
+        return None
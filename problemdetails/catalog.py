@@ -0,0 +1,219 @@
+"""Registry of named problem types.
+
+A :class:`ProblemCatalog` is populated when the application starts.
+Each registered :class:`ProblemType` creates :class:`~problemdetails.Problem`
+instances that share the constant *type*, *title*, and *status* members.
+The constant portion of the document is encoded once per serializer
+so that only the per-occurrence members are encoded when a problem is
+rendered.
+
+.. code-block:: python
+
+   problems = catalog.ProblemCatalog(base_uri='https://example.com/probs/')
+   out_of_credit = problems.register(
+       'out-of-credit', 403, title='You do not have enough credit.')
+
+   class AccountHandler(problemdetails.ErrorWriter, web.RequestHandler):
+      def post(self, account):
+         raise out_of_credit(detail='Your current balance is 30',
+                             balance=30)
+
+"""
+from __future__ import annotations
+
+import typing
+
+from problemdetails import serializers
+from problemdetails.errors import Problem
+
+
+class ProblemType:
+    """Constant portion of a family of problem documents.
+
+    :param name: name that the type is registered under
+    :param status_code: HTTP status code for the problems
+    :param type: *type* URI.  If this is omitted, then the writer's
+        default type for `status_code` is used.
+    :param title: optional *title* for the problems
+    :param reason: optional HTTP reason phrase for the problems
+    :param cache_control: optional ``Cache-Control`` value for the
+        responses.  Responses to ``GET`` and ``HEAD`` requests for
+        problem types with a caching policy include a strong *ETag*
+        and conditional requests are answered with *304 Not Modified*.
+
+    Calling the problem type creates a new :class:`~problemdetails.Problem`
+    instance.  The positional and keyword parameters are passed to the
+    :class:`~problemdetails.Problem` initializer.
+
+    """
+
+    __slots__ = ('name', 'status_code', 'type', 'title', 'reason',
+                 'cache_control', '_templates')
+
+    def __init__(self,
+                 name: str,
+                 status_code: int,
+                 type: str | None = None,
+                 title: str | None = None,
+                 reason: str | None = None,
+                 cache_control: str | None = None) -> None:
+        self.name = name
+        self.status_code = status_code
+        self.type = type
+        self.title = title
+        self.reason = reason
+        self.cache_control = cache_control
+        self._templates: dict[typing.Hashable, bytes | None] = {}
+
+    def __repr__(self) -> str:
+        return f'<ProblemType {self.name!r} {self.status_code}>'
+
+    def __call__(self,
+                 log_message: str | None = None,
+                 *args: typing.Any,
+                 **kwargs: typing.Any) -> Problem:
+        if self.reason is not None:
+            kwargs.setdefault('reason', self.reason)
+        problem = Problem(self.status_code, log_message, *args, **kwargs)
+        problem.problem_type = self
+        return problem
+
+    def constant_document(
+            self, default_type: str | None = None) -> dict[str, typing.Any]:
+        """Return the members that are shared by every occurrence."""
+        document: dict[str, typing.Any] = {}
+        type_ = self.type if self.type is not None else default_type
+        if type_ is not None:
+            document['type'] = type_
+        if self.title is not None:
+            document['title'] = self.title
+        document['status'] = self.status_code
+        return document
+
+    def template(self,
+                 serializer: serializers.Serializer,
+                 default_type: str | None = None) -> bytes | None:
+        """Retrieve the pre-encoded constant members.
+
+        :param serializer: serializer that renders the document
+        :param default_type: *type* to use if the problem type does
+            not specify one
+        :returns: the encoded constant members without the closing
+            brace or :data:`None` if `serializer` does not produce
+            JSON objects that can be spliced together
+
+        """
+        key = serializer.fingerprint(), default_type
+        try:
+            return self._templates[key]
+        except KeyError:
+            pass
+
+        template = None
+        if serializers.produces_json(serializer):
+            encoded = serializer.dumps(self.constant_document(default_type))
+            if encoded.startswith(b'{') and encoded.endswith(b'}'):
+                template = encoded[:-1]
+        self._templates[key] = template
+        return template
+
+    def render(self,
+               problem: Problem,
+               serializer: serializers.Serializer,
+               default_type: str | None = None) -> bytes | None:
+        """Render `problem` by splicing it into the template.
+
+        :returns: the encoded document or :data:`None` if the
+            template cannot be used for `problem`
+
+        Problems that override the constant members or have had their
+        :attr:`~problemdetails.Problem.document` materialized are not
+        rendered from the template.
+
+        """
+        if problem.problem_type is not self:
+            return None
+        return self._render(problem, serializer, default_type, problem.detail)
+
+    def _render(self, problem: Problem, serializer: serializers.Serializer,
+                default_type: str | None, detail: str | None) -> bytes | None:
+        if (problem.type is not None or problem.title is not None
+                or problem._document is not None):
+            return None
+        extensions = problem.extensions
+        if 'type' in extensions or 'title' in extensions:
+            return None
+        template = self.template(serializer, default_type)
+        if template is None:
+            return None
+
+        occurrence: dict[str, typing.Any] = {}
+        if detail is not None:
+            occurrence['detail'] = detail
+        if problem.instance is not None:
+            occurrence['instance'] = problem.instance
+        if extensions:
+            occurrence.update(extensions)
+        if not occurrence:
+            return template + b'}'
+        return template + b',' + serializer.dumps(occurrence)[1:]
+
+
+class ProblemCatalog:
+    """Registry of :class:`ProblemType` instances by name.
+
+    :param base_uri: optional prefix used to create the *type* of
+        problem types that are registered without one
+
+    """
+
+    def __init__(self, base_uri: str | None = None) -> None:
+        self.base_uri = base_uri
+        self._types: dict[str, ProblemType] = {}
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._types
+
+    def __getitem__(self, name: str) -> ProblemType:
+        return self._types[name]
+
+    def __iter__(self) -> typing.Iterator[ProblemType]:
+        return iter(self._types.values())
+
+    def __len__(self) -> int:
+        return len(self._types)
+
+    def register(self,
+                 name: str,
+                 status_code: int,
+                 *,
+                 type: str | None = None,
+                 title: str | None = None,
+                 reason: str | None = None,
+                 cache_control: str | None = None) -> ProblemType:
+        """Add a new problem type to the catalog.
+
+        :param name: unique name for the problem type
+        :param status_code: HTTP status code for the problems
+        :param type: optional *type* URI.  This defaults to `name`
+            appended to :attr:`base_uri` if a base URI was configured.
+        :param title: optional *title* for the problems
+        :param reason: optional HTTP reason phrase
+        :param cache_control: optional ``Cache-Control`` value for
+            the responses
+        :raises ValueError: if `name` is already registered
+
+        """
+        if name in self._types:
+            raise ValueError(f'problem type {name!r} is already registered')
+        if type is None and self.base_uri is not None:
+            type = self.base_uri + name
+        problem_type = ProblemType(
+            name,
+            status_code,
+            type=type,
+            title=title,
+            reason=reason,
+            cache_control=cache_control)
+        self._types[name] = problem_type
+        return problem_type
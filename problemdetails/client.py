@@ -0,0 +1,447 @@
+"""Problem-aware HTTP client.
+
+:class:`ProblemClient` wraps :class:`tornado.httpclient.AsyncHTTPClient`
+and translates failed upstream requests into
+:class:`~problemdetails.Problem` instances that can be raised from a
+request handler.
+
+- *application/problem+json* responses are parsed and either
+  propagated as-is or wrapped in a *502 Bad Gateway* problem
+- each upstream (scheme, host, and port) has a :class:`CircuitBreaker`
+  that fails requests immediately with a *503 Service Unavailable*
+  problem while the upstream is failing
+- a single HTTP client instance is shared by every request.  The
+  *curl* based client, which keeps connections alive between
+  requests, is used when *pycurl* is installed.  Tornado's simple
+  client opens a new connection for each request.
+
+.. code-block:: python
+
+   upstream = client.ProblemClient()
+
+   class HttpBinHandler(problemdetails.ErrorWriter, web.RequestHandler):
+      async def get(self):
+         response = await upstream.fetch('http://httpbin.org/status/404')
+         self.write(response.body)
+
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import datetime
+import email.utils
+import json
+import time
+import typing
+import urllib.parse
+
+from tornado import httpclient
+
+try:
+    from tornado import curl_httpclient
+except ImportError:  # pragma: no cover
+    curl_httpclient = None
+
+from problemdetails import Problem
+from problemdetails.catalog import ProblemType
+
+PROBLEM_MIME_TYPE = 'application/problem+json'
+_STANDARD_MEMBERS = ('type', 'title', 'detail', 'instance')
+
+_Document = typing.Dict[str, typing.Any]
+_Outcome = typing.Tuple[int, str, typing.Optional[_Document]]
+
+bad_gateway = ProblemType('bad-gateway', 502, title='Bad Gateway')
+"""Problem type used to wrap upstream failures."""
+
+upstream_unavailable = ProblemType(
+    'upstream-unavailable', 503, title='Upstream Unavailable')
+"""Problem type used while an upstream's circuit is open."""
+
+
+class CircuitBreaker:
+    """Track the health of a single upstream.
+
+    :param failure_threshold: number of consecutive failures that
+        opens the circuit
+    :param reset_timeout: number of seconds that the circuit stays
+        open before a trial request is allowed
+    :param clock: function that returns the current time in seconds
+
+    The circuit is *closed* while requests succeed.  It *opens* after
+    `failure_threshold` consecutive failures and requests are refused
+    until `reset_timeout` seconds have passed.  The circuit is then
+    *half-open* and a single trial request is allowed.  The circuit
+    closes if the trial request succeeds and opens again if it fails.
+
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self,
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 30.0,
+                 clock: typing.Callable[[], float] = time.monotonic) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self._opened_at: float | None = None
+        self._trial_pending = False
+
+    @property
+    def state(self) -> str:
+        """The current state of the circuit."""
+        if self._opened_at is None:
+            return self.CLOSED
+        if self.clock() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        """Should a request be sent to the upstream?"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial_pending:
+            self._trial_pending = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        """Close the circuit after a successful request."""
+        self.failures = 0
+        self._opened_at = None
+        self._trial_pending = False
+
+    def record_failure(self) -> None:
+        """Count a failed request and open the circuit if necessary."""
+        self.failures += 1
+        if self._trial_pending or self.failures >= self.failure_threshold:
+            self._opened_at = self.clock()
+        self._trial_pending = False
+
+
+def parse_problem(response: httpclient.HTTPResponse) -> Problem | None:
+    """Create a :class:`~problemdetails.Problem` from a problem response.
+
+    :returns: the problem or :data:`None` if `response` does not
+        contain an *application/problem+json* object
+
+    The *status* member of the document takes precedence over the
+    response status code.
+
+    """
+    document = _parse_document(response)
+    if document is None:
+        return None
+    return _create_problem(document, response.code, response.reason)
+
+
+def _parse_document(
+        response: httpclient.HTTPResponse) -> dict[str, typing.Any] | None:
+    content_type = response.headers.get('Content-Type', '')
+    if content_type.partition(';')[0].strip().lower() != PROBLEM_MIME_TYPE:
+        return None
+    try:
+        document = json.loads(response.body)
+    except (TypeError, ValueError):
+        return None
+    return document if isinstance(document, dict) else None
+
+
+def _create_problem(document: dict[str, typing.Any], status_code: int,
+                    reason: str | None) -> Problem:
+    document = document.copy()
+    status = document.pop('status', status_code)
+    if isinstance(status, int):
+        status_code = status
+    problem = Problem(status_code, reason=reason)
+    for name in _STANDARD_MEMBERS:
+        value = document.get(name)
+        if value is not None:
+            setattr(problem, name, document.pop(name))
+    problem.extensions = document
+    return problem
+
+
+class UpstreamProblemCache:
+    """Cache of problem responses from upstream services.
+
+    :param maxsize: maximum number of responses to cache
+    :param default_ttl: number of seconds to cache responses that do
+        not include caching headers.  Such responses are not cached
+        when this is :data:`None`.
+    :param statuses: status codes that are cached
+    :param coalesce: share a single upstream request between
+        concurrent identical requests
+    :param clock: function that returns the current time in seconds
+    :param key_headers: request headers that are included in the
+        cache key
+
+    Only ``GET`` and ``HEAD`` requests are cached and they are keyed
+    by method, URL, basic authentication credentials, and the values
+    of `key_headers`.  The default headers include ``Authorization``
+    and ``Cookie`` so that requests made on behalf of different users
+    never share entries.  The lifetime of an entry
+    is the ``max-age`` from the upstream ``Cache-Control`` header,
+    the ``Retry-After`` delay, or `default_ttl` in that order.
+    Responses with ``no-store`` or ``no-cache`` directives are not
+    cached.  The least recently used entries are evicted when the
+    cache is full.
+
+    Coalesced requests share every outcome including successful
+    responses so make sure that `key_headers` includes every header
+    that identifies the caller.
+
+    """
+
+    def __init__(self,
+                 maxsize: int = 256,
+                 default_ttl: float | None = None,
+                 statuses: typing.Collection[int] = (404, 410, 422, 429, 503),
+                 coalesce: bool = True,
+                 clock: typing.Callable[[], float] = time.monotonic,
+                 key_headers: typing.Sequence[str] = ('Accept',
+                                                      'Authorization',
+                                                      'Cookie')) -> None:
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self.statuses = frozenset(statuses)
+        self.coalesce = coalesce
+        self.clock = clock
+        self.key_headers = tuple(key_headers)
+        self.hits = 0
+        self.misses = 0
+        self.in_flight: dict[typing.Hashable, asyncio.Future] = {}
+        self._entries: collections.OrderedDict[typing.Hashable,
+                                               tuple[float, _Outcome]]
+        self._entries = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def key(self, request: httpclient.HTTPRequest) -> typing.Hashable | None:
+        """Return the cache key for `request` or :data:`None`."""
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        headers = request.headers
+        return (request.method, request.url, request.auth_username,
+                request.auth_password,
+                *(headers.get(name) for name in self.key_headers))
+
+    def lookup(self, key: typing.Hashable) -> _Outcome | None:
+        """Retrieve the unexpired entry for `key`."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, outcome = entry
+            if self.clock() < expires:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return outcome
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def store(self, key: typing.Hashable,
+              response: httpclient.HTTPResponse) -> None:
+        """Cache `response` if it is cacheable."""
+        if response.code not in self.statuses:
+            return
+        ttl = self.ttl(response)
+        if ttl is None or ttl <= 0:
+            return
+        outcome = (response.code, response.reason, _parse_document(response))
+        self._entries[key] = (self.clock() + ttl, outcome)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def ttl(self, response: httpclient.HTTPResponse) -> float | None:
+        """Determine how long `response` can be cached."""
+        cache_control = response.headers.get('Cache-Control')
+        if cache_control:
+            for directive in cache_control.split(','):
+                name, _, value = directive.strip().partition('=')
+                name = name.lower()
+                if name in ('no-store', 'no-cache'):
+                    return None
+                if name == 'max-age':
+                    try:
+                        return float(value.strip('"'))
+                    except ValueError:
+                        return None
+
+        retry_after = response.headers.get('Retry-After')
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+            try:
+                when = email.utils.parsedate_to_datetime(retry_after)
+            except (TypeError, ValueError):
+                return None
+            return (when - datetime.datetime.now(
+                datetime.timezone.utc)).total_seconds()
+
+        return self.default_ttl
+
+    def clear(self) -> None:
+        """Discard every entry."""
+        self._entries.clear()
+
+
+class ProblemClient:
+    """Send HTTP requests and raise problems for failures.
+
+    :param http_client: client to send requests with.  The shared
+        *curl* client is used if *pycurl* is installed and the shared
+        :class:`~tornado.httpclient.AsyncHTTPClient` otherwise.  Only
+        the *curl* client reuses connections.
+    :param propagate: raise upstream problems as-is when this is
+        :data:`True`.  Otherwise upstream errors are wrapped in a
+        *502 Bad Gateway* problem with the upstream status and document
+        in the ``upstream`` member.
+    :param failure_threshold: consecutive failures that open an
+        upstream's circuit
+    :param reset_timeout: seconds that a circuit stays open
+    :param clock: function that returns the current time in seconds
+    :param problem_cache: optional cache of upstream problem responses
+
+    Connection failures, timeouts, and *5xx* responses count as
+    failures for the circuit breaker.  Other responses close it.
+    The wrapping problems have log messages that include the upstream
+    URL.  The URL is not included in the response documents.
+
+    """
+
+    def __init__(self,
+                 http_client: httpclient.AsyncHTTPClient | None = None,
+                 propagate: bool = True,
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 30.0,
+                 clock: typing.Callable[[], float] = time.monotonic,
+                 problem_cache: UpstreamProblemCache | None = None) -> None:
+        self._http_client = http_client
+        self.problem_cache = problem_cache
+        self.propagate = propagate
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.breakers: dict[str, CircuitBreaker] = {}
+
+    @property
+    def http_client(self) -> httpclient.AsyncHTTPClient:
+        """The client that requests are sent with.
+
+        The shared clients are bound to the current IOLoop so they
+        are looked up when they are needed.
+
+        """
+        if self._http_client is not None:
+            return self._http_client
+        if curl_httpclient is not None:  # pragma: no cover
+            return curl_httpclient.CurlAsyncHTTPClient()
+        return httpclient.AsyncHTTPClient()
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        """Retrieve the circuit breaker for the upstream of `url`."""
+        parts = urllib.parse.urlsplit(url)
+        key = f'{parts.scheme}://{parts.netloc}'
+        breaker = self.breakers.get(key)
+        if breaker is None:
+            breaker = self.breakers[key] = CircuitBreaker(
+                self.failure_threshold, self.reset_timeout, self.clock)
+        return breaker
+
+    async def fetch(self, request: str | httpclient.HTTPRequest,
+                    **kwargs: typing.Any) -> httpclient.HTTPResponse:
+        """Send `request` and return the successful response.
+
+        :param request: URL or request to send
+        :param kwargs: passed to :meth:`tornado.httpclient.HTTPRequest`
+            when `request` is a URL
+        :raises problemdetails.Problem: if the upstream's circuit is
+            open, the request fails, or the response status is *4xx*
+            or *5xx*
+
+        """
+        if not isinstance(request, httpclient.HTTPRequest):
+            request = httpclient.HTTPRequest(request, **kwargs)
+        url = request.url
+
+        problem_cache, key = self.problem_cache, None
+        if problem_cache is not None:
+            key = problem_cache.key(request)
+        if key is not None:
+            outcome = problem_cache.lookup(key)
+            if outcome is not None:
+                raise self._create_upstream_problem(url, *outcome)
+            future = problem_cache.in_flight.get(key)
+            if future is not None:
+                result = await asyncio.shield(future)
+                return self._handle_result(url, result)
+
+        breaker = self.breaker(url)
+        if not breaker.allow():
+            raise upstream_unavailable()
+        if key is not None and problem_cache.coalesce:
+            future = asyncio.ensure_future(self._send(request, breaker, key))
+            problem_cache.in_flight[key] = future
+            future.add_done_callback(lambda _: problem_cache.in_flight.pop(
+                key, None))
+            result = await asyncio.shield(future)
+        else:
+            result = await self._send(request, breaker, key)
+        return self._handle_result(url, result)
+
+    async def _send(self, request: httpclient.HTTPRequest,
+                    breaker: CircuitBreaker, key: typing.Hashable | None
+                    ) -> httpclient.HTTPResponse | Exception:
+        try:
+            response = await self.http_client.fetch(request, raise_error=False)
+        except (OSError, httpclient.HTTPClientError) as error:
+            breaker.record_failure()
+            return error
+        except BaseException:
+            # a cancelled trial request must not hold the circuit open
+            breaker.record_failure()
+            raise
+
+        if response.code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if key is not None and response.code >= 400:
+            typing.cast(UpstreamProblemCache, self.problem_cache).store(
+                key, response)
+        return response
+
+    def _handle_result(self, url: str,
+                       result: httpclient.HTTPResponse | Exception
+                       ) -> httpclient.HTTPResponse:
+        if isinstance(result, Exception):
+            raise bad_gateway('request to %s failed: %s', url,
+                              result) from result
+        if result.code < 400:
+            return result
+        raise self._create_upstream_problem(url, result.code, result.reason,
+                                            _parse_document(result))
+
+    def _create_upstream_problem(
+            self, url: str, status_code: int, reason: str | None,
+            document: dict[str, typing.Any] | None) -> Problem:
+        if self.propagate:
+            if document is None:
+                return Problem(status_code, reason=reason)
+            return _create_problem(document, status_code, reason)
+
+        upstream: dict[str, typing.Any] = {'status': status_code}
+        if document is not None:
+            upstream['problem'] = document
+        return bad_gateway(
+            '%s returned %d', url, status_code, upstream=upstream)
@@ -0,0 +1,120 @@
+"""Compression of problem response bodies.
+
+A :class:`ProblemCompressor` installed as
+:attr:`problemdetails.ErrorWriter.problem_compressor` compresses large
+problem bodies using the content coding negotiated from the request's
+``Accept-Encoding`` header.  *gzip* is always available and *br* is
+available when the *brotli* package is installed.
+
+Compressed bodies that are rendered from a
+:class:`~problemdetails.ProblemCache` or a catalog template are kept
+in a bounded cache keyed by the coding and the uncompressed body so
+that a problem that is rendered repeatedly, for example during an
+error storm, is only compressed once.  Other bodies are compressed
+every time they are rendered.
+
+"""
+from __future__ import annotations
+
+import collections
+import gzip
+import typing
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+from problemdetails import negotiation
+
+
+class ProblemCompressor:
+    """Negotiate and apply content codings to problem bodies.
+
+    :param min_size: bodies smaller than this many bytes are not
+        compressed
+    :param gzip_level: compression level for the *gzip* coding
+    :param brotli_quality: quality for the *br* coding
+    :param maxsize: maximum number of compressed bodies to cache.
+        Set this to zero to disable caching.
+    :param max_bytes: maximum combined size of the cached
+        uncompressed and compressed bodies
+
+    """
+
+    def __init__(self,
+                 min_size: int = 1024,
+                 gzip_level: int = 6,
+                 brotli_quality: int = 5,
+                 maxsize: int = 128,
+                 max_bytes: int = 4 * 1024 * 1024) -> None:
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.codings: tuple[str, ...] = ('gzip', )
+        if brotli is not None:
+            self.codings = ('br', 'gzip')
+        self.hits = 0
+        self.misses = 0
+        self._cache: collections.OrderedDict[tuple[str, bytes], bytes]
+        self._cache = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def select_coding(self, accept_encoding: str | None) -> str | None:
+        """Select the content coding for an ``Accept-Encoding`` value.
+
+        :returns: the selected coding or :data:`None` if the body
+            should not be compressed
+
+        """
+        if not accept_encoding:
+            return None
+        return negotiation.select_content_coding(accept_encoding, self.codings)
+
+    def compress(self, body: bytes, coding: str, cache: bool = True) -> bytes:
+        """Compress `body` using `coding` reusing cached results.
+
+        :param body: the uncompressed body
+        :param coding: content coding to apply
+        :param cache: store the compressed body for reuse.  Pass
+            :data:`False` for bodies that are unlikely to be rendered
+            again.
+
+        """
+        key = (coding, body)
+        try:
+            compressed = self._cache[key]
+        except KeyError:
+            pass
+        else:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return compressed
+
+        self.misses += 1
+        compressed = self._compress(body, coding)
+        size = len(body) + len(compressed)
+        if cache and self.maxsize > 0 and size <= self.max_bytes:
+            self._cache[key] = compressed
+            self.size += size
+            while (len(self._cache) > self.maxsize
+                   or self.size > self.max_bytes):
+                (_, evicted), value = self._cache.popitem(last=False)
+                self.size -= len(evicted) + len(value)
+        return compressed
+
+    def clear(self) -> None:
+        """Discard the cached bodies."""
+        self._cache.clear()
+        self.size = 0
+
+    def _compress(self, body: bytes, coding: str) -> bytes:
+        if coding == 'br':
+            return typing.cast(
+                bytes, brotli.compress(body, quality=self.brotli_quality))
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
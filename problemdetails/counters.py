@@ -0,0 +1,159 @@
+"""Problem response counters shared by forked worker processes.
+
+A :class:`SharedProblemCounters` table lives in an anonymous shared
+memory mapping.  Create it before calling
+:func:`tornado.process.fork_processes` and install it as
+:attr:`problemdetails.ErrorWriter.problem_counters` so that each
+worker increments its own row of the table.  Any worker can read the
+totals of every worker and serve them:
+
+.. code-block:: python
+
+   counters = problemdetails.SharedProblemCounters(workers=4,
+                                                   types=catalog)
+   problemdetails.ErrorWriter.problem_counters = counters
+   process.fork_processes(4)
+   app = web.Application([
+      web.url('/metrics', problemdetails.MetricsHandler,
+              {'metrics': counters}),
+      ...
+   ])
+
+Incrementing a counter writes to the shared memory directly without
+locks or system calls.  Each row starts with a sequence number that
+the worker makes odd while it updates the row so that readers can
+copy a consistent row without blocking the worker.
+
+"""
+from __future__ import annotations
+
+import mmap
+import os
+import time
+import typing
+
+from tornado import process
+from tornado.log import app_log
+
+from problemdetails import catalog, handlers, metrics
+
+_COUNTER_SIZE = 8
+
+Key = typing.Tuple[int, typing.Optional[str]]
+
+
+class SharedProblemCounters:
+    """Count problem responses by status code and *type*.
+
+    :param workers: number of worker processes.  This is the value
+        passed to :func:`~tornado.process.fork_processes` and the
+        number of CPUs is used if it is zero or omitted.
+    :param types: problem types to count separately.  This accepts
+        :class:`~problemdetails.ProblemType` instances, such as a
+        :class:`~problemdetails.ProblemCatalog`, and (*status*,
+        *type*) pairs.  The entries of
+        :data:`~problemdetails.type_link_map` are always counted.
+    :param namespace: prefix for the metric names
+
+    Responses with a status code between 100 and 599 whose *type* is
+    not known when the table is created are counted under a *type* of
+    :data:`None`.  Other status codes are counted as status code 0.
+
+    Workers whose task ID is not less than `workers` do not have a
+    row.  Their responses are counted in :attr:`overflows` of the
+    worker's process and a warning is logged for the first one.
+
+    """
+
+    def __init__(self,
+                 workers: int | None = None,
+                 types: typing.Iterable[catalog.ProblemType | Key] = (),
+                 namespace: str = 'problemdetails') -> None:
+        if not workers:
+            workers = os.cpu_count() or 1
+        self.workers = workers
+        self.namespace = namespace
+        self.overflows = 0
+
+        keys: list[Key] = [(0, None)]
+        keys.extend((status, None) for status in range(100, 600))
+        keys.extend(handlers.type_link_map.items())
+        for entry in types:
+            if isinstance(entry, catalog.ProblemType):
+                type_ = entry.type
+                if type_ is None:
+                    type_ = handlers.type_link_map.get(entry.status_code)
+                keys.append((entry.status_code, type_))
+            else:
+                keys.append(entry)
+        self.keys = tuple(dict.fromkeys(keys))
+        # column zero of each row is the row's sequence number
+        self._columns = {
+            key: column
+            for column, key in enumerate(self.keys, 1)
+        }
+        self._stride = len(self.keys) + 1
+        self._mmap = mmap.mmap(-1, workers * self._stride * _COUNTER_SIZE)
+        self._counts = memoryview(self._mmap).cast('Q')
+
+    def increment(self, status_code: int, type_: str | None) -> None:
+        """Count a problem response in the current worker's row."""
+        task_id = process.task_id() or 0
+        if task_id >= self.workers:
+            if not self.overflows:
+                app_log.warning(
+                    'worker %d is not counted since the shared counters '
+                    'were created for %d workers', task_id, self.workers)
+            self.overflows += 1
+            return
+        column = self._columns.get((status_code, type_))
+        if column is None:
+            column = self._columns.get((status_code, None), 1)
+        row = task_id * self._stride
+        counts = self._counts
+        counts[row] += 1
+        counts[row + column] += 1
+        counts[row] += 1
+
+    def worker_snapshot(self, worker: int) -> dict[Key, int]:
+        """Return the non-zero counters of `worker`."""
+        return {
+            key: count
+            for key, count in zip(self.keys, self._read_row(worker)) if count
+        }
+
+    def snapshot(self) -> dict[Key, int]:
+        """Return the non-zero counters summed across the workers."""
+        totals = [0] * len(self.keys)
+        for worker in range(self.workers):
+            for column, count in enumerate(self._read_row(worker)):
+                totals[column] += count
+        return {key: count for key, count in zip(self.keys, totals) if count}
+
+    def render_prometheus(self) -> str:
+        """Format the totals in the Prometheus text format.
+
+        This allows the counters to be exposed by
+        :class:`~problemdetails.MetricsHandler`.
+
+        """
+        lines = metrics.format_responses(
+            f'{self.namespace}_shared_responses_total',
+            'Problem responses of all workers by status code and type.',
+            self.snapshot())
+        lines.append('')
+        return '\n'.join(lines)
+
+    def _read_row(self, worker: int, attempts: int = 100) -> list[int]:
+        start = worker * self._stride
+        counts = self._counts
+        for _ in range(attempts):
+            sequence = counts[start]
+            if sequence % 2 == 0:
+                row = counts[start + 1:start + self._stride].tolist()
+                if counts[start] == sequence:
+                    return row
+            time.sleep(0)
+        # the worker may have died while updating the row
+        return typing.cast(list[int],
+                           counts[start + 1:start + self._stride].tolist())
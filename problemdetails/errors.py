@@ -1,10 +1,23 @@
 from __future__ import annotations
 
 import http.client
+import traceback
 import typing
 
 from tornado import web
 
+if typing.TYPE_CHECKING:  # pragma: no cover
+    from problemdetails.catalog import ProblemType
+
+
+def _take_member(kwargs: dict[str, typing.Any], name: str) -> typing.Any:
+    # explicit None values stay in kwargs so that they are rendered
+    # as null instead of being omitted
+    value = kwargs.get(name)
+    if value is not None:
+        del kwargs[name]
+    return value
+
 
 class Problem(web.HTTPError):
     """An exception that will be translated into a json document.
@@ -26,24 +39,158 @@ class Problem(web.HTTPError):
     *type* property will be set by ``write_error`` unless it is
     explicitly set.
 
-    .. attribute:: document
+    The standard :rfc:`7807` members are stored in slots and the
+    response document is not created until it is rendered or
+    :attr:`.document` is accessed.
+
+    .. attribute:: type
+                   title
+                   detail
+                   instance
+
+       The standard :rfc:`7807#section-3.1` members or :data:`None`
+       if they were not specified.
+
+    .. attribute:: extensions
+
+       :class:`dict` of additional keyword parameters that are
+       rendered as extension members
+
+    .. attribute:: problem_type
 
-       The keyword parameters are collected into this :class:`dict`
-       and rendered as the response document
+       The :class:`~problemdetails.catalog.ProblemType` that created
+       this instance or :data:`None`.  The problem type supplies the
+       *type* and *title* members when they are not specified.
+
+    .. attribute:: keep_traceback
+
+       Set this to :data:`True` to keep the traceback after the
+       problem is rendered or :data:`False` to always release it.
+       The :class:`~problemdetails.ErrorWriter` setting is used when
+       this is :data:`None`.
+
+    .. attribute:: stack
+
+       :class:`traceback.StackSummary` that was captured when the
+       traceback was released or :data:`None`
 
     """
 
+    __slots__ = ('status_code', '_log_message', '_reason', '_document', 'type',
+                 'title', 'detail', 'instance', 'extensions', 'problem_type',
+                 'keep_traceback', 'stack')
+
     def __init__(self,
                  status_code: int,
                  log_message: str | None = None,
                  *args: typing.Any,
                  **kwargs: typing.Any) -> None:
-        kwargs.setdefault(
-            'reason', http.client.responses.get(status_code,
-                                                'Abnormal Status'))
-        super(Problem, self).__init__(status_code, log_message, *args,
-                                      **kwargs)
-        self.document = kwargs
-        self.document['status'] = status_code
-        self.document.pop('reason', None)
-        self.document.pop('log_message', None)
+        super(Problem, self).__init__(
+            status_code, log_message, *args, reason=kwargs.pop('reason', None))
+        kwargs.pop('status', None)
+        self._document: dict[str, typing.Any] | None = None
+        self.type = _take_member(kwargs, 'type')
+        self.title = _take_member(kwargs, 'title')
+        self.detail = _take_member(kwargs, 'detail')
+        self.instance = _take_member(kwargs, 'instance')
+        self.extensions = kwargs
+        self.problem_type: ProblemType | None = None
+        self.keep_traceback: bool | None = None
+        self.stack: traceback.StackSummary | None = None
+
+    @property
+    def reason(self) -> str:  # type: ignore[override]
+        """HTTP reason phrase for the response line.
+
+        This defaults to the standard phrase for :attr:`status_code`
+        and is computed when it is first needed.
+
+        """
+        if self._reason is None:
+            return http.client.responses.get(self.status_code,
+                                             'Abnormal Status')
+        return self._reason
+
+    @reason.setter
+    def reason(self, value: str | None) -> None:
+        self._reason = value
+
+    @property
+    def document(self) -> dict[str, typing.Any]:
+        """The response document as a :class:`dict`.
+
+        The document is created the first time that this property
+        is accessed.  Modifications to the returned dictionary are
+        reflected in the rendered response.
+
+        """
+        if self._document is None:
+            self._document = self.build_document()
+        return self._document
+
+    @document.setter
+    def document(self, value: dict[str, typing.Any]) -> None:
+        self._document = value
+
+    def build_document(
+            self, default_type: str | None = None) -> dict[str, typing.Any]:
+        """Create a new response document.
+
+        :param default_type: *type* to use if one was not specified
+
+        """
+        if self._document is not None:
+            document = self._document.copy()
+            if default_type is not None:
+                document.setdefault('type', default_type)
+            return document
+
+        document: dict[str, typing.Any] = {}
+        extensions = self.extensions
+        type_, title = self.type, self.title
+        if self.problem_type is not None:
+            if type_ is None:
+                type_ = self.problem_type.type
+            if title is None:
+                title = self.problem_type.title
+        if type_ is not None:
+            document['type'] = type_
+        elif default_type is not None and 'type' not in extensions:
+            document['type'] = default_type
+        if title is not None:
+            document['title'] = title
+        document['status'] = self.status_code
+        if self.detail is not None:
+            document['detail'] = self.detail
+        if self.instance is not None:
+            document['instance'] = self.instance
+        if extensions:
+            document.update(extensions)
+        return document
+
+    def release_traceback(self, capture: bool = False) -> None:
+        """Release the traceback and the frames that it references.
+
+        :param capture: capture a compact :attr:`stack` summary
+            before the traceback is released
+
+        The local variables of the frames that have finished running
+        are cleared so that objects such as request bodies are not
+        kept alive by references to this exception.  The tracebacks
+        of chained exceptions are released without clearing their
+        frames since they may belong to suspended coroutines that
+        clearing would close.
+
+        """
+        if self.__traceback__ is not None:
+            if capture:
+                self.stack = traceback.StackSummary.extract(
+                    traceback.walk_tb(self.__traceback__), lookup_lines=False)
+            traceback.clear_frames(self.__traceback__)
+            self.__traceback__ = None
+        seen = {id(self)}
+        exc = self.__cause__ or self.__context__
+        while exc is not None and id(exc) not in seen:
+            seen.add(id(exc))
+            exc.__traceback__ = None
+            exc = exc.__cause__ or exc.__context__
@@ -0,0 +1,230 @@
+"""Batched recording of problem responses.
+
+Install a :class:`ProblemEventRecorder` as
+:attr:`problemdetails.ErrorWriter.problem_events` to record a compact
+:class:`ProblemEvent` for every problem response.  Recording appends
+the event to a bounded in-memory buffer and a background task writes
+the buffered events to a sink in batches so the sink's I/O never runs
+while a request is being handled.
+
+.. code-block:: python
+
+   recorder = events.ProblemEventRecorder(
+      events.JSONLinesSink('/var/log/app/problems.jsonl'))
+   problemdetails.ErrorWriter.problem_events = recorder
+   app = web.Application([
+      web.url('/events', problemdetails.MetricsHandler,
+              {'metrics': recorder}),
+      ...
+   ])
+   recorder.start()
+   ...
+   await recorder.stop()
+
+When the sink cannot keep up, the buffer fills and the oldest events
+are discarded and counted in :attr:`ProblemEventRecorder.dropped`
+instead of slowing down request handling.
+
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import concurrent.futures
+import json
+import time
+import typing
+
+from tornado import web
+from tornado.log import app_log
+
+from problemdetails import metrics
+
+
+class ProblemEvent(typing.NamedTuple):
+    """Record of a single problem response."""
+    timestamp: float
+    """When the response was rendered as a UNIX timestamp."""
+    status: int
+    """HTTP status code of the response."""
+    type: str | None
+    """*type* member of the document."""
+    instance: str | None
+    """*instance* member of the document."""
+    request_id: str | None
+    """Value of the recorder's request ID header."""
+    elapsed: float
+    """Seconds between receiving the request and the response."""
+
+
+class EventSink(typing.Protocol):
+    """Destination of batches of :class:`ProblemEvent` instances."""
+
+    async def write(self, events: typing.Sequence[ProblemEvent]) -> None:
+        """Write `events` to the destination."""
+
+
+class JSONLinesSink:
+    """Append events to a file as JSON Lines.
+
+    :param path: file to append to
+    :param executor: executor that writes to the file.  The IOLoop's
+        default executor is used if this is omitted.
+
+    Each batch is encoded and appended in `executor`.  The file is
+    opened for each batch so it can be rotated by external tools.
+
+    """
+
+    def __init__(self,
+                 path: str,
+                 executor: concurrent.futures.Executor | None = None) -> None:
+        self.path = path
+        self.executor = executor
+
+    async def write(self, events: typing.Sequence[ProblemEvent]) -> None:
+        await asyncio.get_running_loop().run_in_executor(
+            self.executor, self._write, events)
+
+    def _write(self, events: typing.Sequence[ProblemEvent]) -> None:
+        lines = ''.join(
+            json.dumps(event._asdict(), separators=(',', ':')) + '\n'
+            for event in events)
+        with open(self.path, 'a', encoding='utf-8') as output:
+            output.write(lines)
+
+
+class ProblemEventRecorder:
+    """Buffer problem events and write them to `sink` in batches.
+
+    :param sink: where the events are written
+    :param maxsize: maximum number of buffered events.  The oldest
+        event is discarded when an event is recorded into a full
+        buffer.
+    :param batch_size: maximum number of events per write.  The
+        background task is woken up as soon as this many events
+        are buffered.
+    :param interval: seconds between writes of partial batches
+    :param request_id_header: request header that identifies the
+        request in the events
+    :param namespace: prefix for the metric names
+
+    Events are written by a task that is created by :meth:`start` on
+    the running event loop.  A single batch is written at a time so a
+    slow sink applies backpressure by letting the buffer fill.
+
+    """
+
+    def __init__(self,
+                 sink: EventSink,
+                 *,
+                 maxsize: int = 10_000,
+                 batch_size: int = 500,
+                 interval: float = 1.0,
+                 request_id_header: str = 'X-Request-Id',
+                 namespace: str = 'problemdetails') -> None:
+        self.sink = sink
+        self.batch_size = batch_size
+        self.interval = interval
+        self.request_id_header = request_id_header
+        self.namespace = namespace
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self._buffer: collections.deque[ProblemEvent] = collections.deque(
+            maxlen=maxsize)
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def record(self, event: ProblemEvent) -> None:
+        """Buffer `event` for the next batch."""
+        buffer = self._buffer
+        if len(buffer) == buffer.maxlen:
+            self.dropped += 1
+        buffer.append(event)
+        self.recorded += 1
+        if len(buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def observe(self, handler: web.RequestHandler, status_code: int,
+                type_: str | None, instance: str | None) -> None:
+        """Record the problem response of `handler`."""
+        request = handler.request
+        self.record(
+            ProblemEvent(time.time(), status_code, type_, instance,
+                         request.headers.get(self.request_id_header),
+                         request.request_time()))
+
+    def start(self) -> None:
+        """Start writing events from the running event loop."""
+        if self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """Write the buffered events and stop the background task."""
+        task = self._task
+        if task is not None:
+            assert self._wakeup is not None
+            self._stopping = True
+            self._wakeup.set()
+            await task
+            self._task = self._wakeup = None
+
+    async def flush(self) -> None:
+        """Write the buffered events in batches."""
+        buffer = self._buffer
+        while buffer:
+            batch = [
+                buffer.popleft()
+                for _ in range(min(self.batch_size, len(buffer)))
+            ]
+            try:
+                await self.sink.write(batch)
+            except Exception:
+                self.failed += len(batch)
+                app_log.error(
+                    'Failed to write %d problem events',
+                    len(batch),
+                    exc_info=True)
+            else:
+                self.written += len(batch)
+
+    def render_prometheus(self) -> str:
+        """Format the counters in the Prometheus text format.
+
+        This allows the recorder to be exposed by
+        :class:`~problemdetails.MetricsHandler`.
+
+        """
+        lines = metrics.format_metrics(self.namespace, [
+            ('events_recorded_total', 'counter', 'Recorded problem events.',
+             self.recorded),
+            ('events_dropped_total', 'counter',
+             'Problem events discarded from a full buffer.', self.dropped),
+            ('events_written_total', 'counter',
+             'Problem events written to the sink.', self.written),
+            ('events_failed_total', 'counter',
+             'Problem events that the sink failed to write.', self.failed),
+            ('events_buffered', 'gauge', 'Problem events waiting to be '
+             'written.', len(self._buffer)),
+        ])
+        lines.append('')
+        return '\n'.join(lines)
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+        await self.flush()
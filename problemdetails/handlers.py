@@ -1,11 +1,20 @@
 from __future__ import annotations
 
+import asyncio
+import concurrent.futures
+import functools
+import hashlib
 import json
+import time
+import types
 import typing
 
-from tornado import web
+from tornado import httputil, iostream, web
+from tornado.log import access_log, app_log
 
-from problemdetails import Problem
+from problemdetails import (Problem, budget, cache, catalog, compression,
+                            counters, events, localization, metrics,
+                            negotiation, sampling, serializers)
 
 
 def _rfc_link(rfc_no: int, anchor: str | None = None) -> str:
@@ -112,14 +121,259 @@ class ErrorWriter(web.RequestHandler):
 
     PROBLEM_DETAILS_MIME_TYPE: str = "application/problem+json"
 
+    _problem_future: asyncio.Future | None = None
+
     json_encoder = json.JSONEncoder()
     """Used to encode problem response documents.
 
     You set the attributes of this encoder to customize the creation
-    of problem documents.
+    of problem documents.  This encoder is used by the default
+    :attr:`serializer`.
+
+    """
+
+    serializer: serializers.Serializer = serializers.StdlibSerializer(
+        json_encoder)
+    """Serializes problem response documents into bytes.
+
+    This defaults to a
+    :class:`~problemdetails.serializers.StdlibSerializer` that encodes
+    with :attr:`json_encoder`.  Set this to the result of
+    :func:`problemdetails.serializers.find_serializer` to use *orjson*
+    or *ujson* when they are installed.  Use
+    :meth:`~problemdetails.serializers.Serializer.register_default` to
+    teach the serializer how to handle additional types.
+
+    """
+
+    alternate_serializers: dict[str, serializers.Serializer] | None = None
+    """Additional problem representations keyed by media type.
+
+    ``write_error`` selects the representation based on the request's
+    ``Accept`` header.  :attr:`PROBLEM_DETAILS_MIME_TYPE` rendered by
+    :attr:`serializer` is preferred and used when none of the
+    representations is acceptable.  When this is :data:`None`, the
+    binary representations that are available as reported by
+    :func:`problemdetails.serializers.find_binary_serializers` are
+    used.  They are looked up the first time that a problem is
+    negotiated.  Set this to an empty dictionary to disable content
+    negotiation.
 
     """
 
+    problem_log_sampler: sampling.ProblemLogSampler | None = None
+    """Optional rate limiter for logging HTTP errors.
+
+    Set this to a :class:`problemdetails.ProblemLogSampler` to limit
+    the number of warnings that are logged for repeated HTTP errors.
+    Other exceptions are always logged by
+    :meth:`tornado.web.RequestHandler.log_exception`.
+
+    """
+
+    problem_metrics: metrics.ProblemMetrics | None = None
+    """Optional instrumentation of problem responses.
+
+    Set this to a :class:`problemdetails.ProblemMetrics` instance to
+    count responses by status code and *type* and to record rendering
+    time and body size.  Instrumentation is disabled by default.
+
+    """
+
+    problem_counters: counters.SharedProblemCounters | None = None
+    """Optional counters that are shared by forked workers.
+
+    Set this to a :class:`problemdetails.SharedProblemCounters` table
+    before forking to count problem responses in shared memory so
+    that any worker can report the totals of every worker.  Counting
+    is disabled by default.
+
+    """
+
+    problem_events: events.ProblemEventRecorder | None = None
+    """Optional audit of problem responses.
+
+    Set this to a :class:`problemdetails.ProblemEventRecorder` to
+    record an event for every problem response.  The events are
+    buffered and written to the recorder's sink in the background.
+    Recording is disabled by default.
+
+    """
+
+    problem_stream_threshold: int | None = None
+    """Stream documents with more than this many extension elements.
+
+    When this is set, problem documents whose extension members
+    contain more than this many elements in total are encoded
+    incrementally and written in chunks of
+    :attr:`problem_stream_chunk_size` bytes.  The response is flushed
+    after each chunk so the connection's flow control limits how much
+    of the document is held in memory.  Elements are counted like
+    :attr:`problem_executor_threshold` counts them.  Only JSON
+    representations are streamed.  Streaming is disabled by default.
+
+    """
+
+    problem_stream_chunk_size: int = 64 * 1024
+    """Size of the chunks that streamed documents are written in."""
+
+    release_problem_tracebacks: bool | None = None
+    """Release the tracebacks of problems after they are rendered.
+
+    Tracebacks reference the frames of the request handler and every
+    local variable in them.  When this is :data:`True`, the traceback
+    of a :class:`~problemdetails.Problem` is released and the finished
+    frames are cleared once the document is rendered.  When it is
+    :data:`None`, tracebacks are released unless the application's
+    ``serve_traceback`` setting is enabled, which Tornado enables in
+    debug mode.  Set :attr:`Problem.keep_traceback
+    <problemdetails.Problem.keep_traceback>` to override this for a
+    single problem.
+
+    """
+
+    capture_problem_stacks: bool = False
+    """Capture a compact stack summary when releasing tracebacks.
+
+    The summary is available as :attr:`Problem.stack
+    <problemdetails.Problem.stack>` and does not reference any frames.
+
+    """
+
+    problem_executor: concurrent.futures.Executor | None = None
+    """Optional executor that renders large problem documents.
+
+    When this is set, problem documents whose extension members
+    contain more than :attr:`problem_executor_threshold` elements in
+    total are encoded in the executor instead of on the
+    IOLoop thread.  The response is finished when encoding completes.
+    Smaller documents are rendered inline.  The serializer, the
+    budget, and the document must be picklable if this is a
+    :class:`~concurrent.futures.ProcessPoolExecutor`.
+
+    """
+
+    problem_executor_threshold: int = 1000
+    """Render documents with more than this many elements off-loop.
+
+    Every list element and object member of the extension members
+    counts as an element at any depth and strings count as one element
+    for every 64 characters.
+    Lower this if a slow hook is installed with
+    :meth:`~problemdetails.serializers.Serializer.register_default`.
+    Set it to zero to render every :class:`~problemdetails.Problem`
+    in :attr:`problem_executor`.
+
+    """
+
+    problem_budget: budget.ProblemBudget | None = None
+    """Optional size limits for problem documents.
+
+    Set this to a :class:`problemdetails.ProblemBudget` instance to
+    trim oversized members while the document is encoded.  Documents
+    are not streamed when a budget is set.
+
+    """
+
+    problem_compressor: compression.ProblemCompressor | None = None
+    """Optional compression of large problem bodies.
+
+    Set this to a :class:`problemdetails.ProblemCompressor` instance
+    to compress problem bodies using the coding negotiated from the
+    ``Accept-Encoding`` request header.  Streamed documents are not
+    compressed.  Compression is disabled by default.
+
+    """
+
+    problem_translations: localization.ProblemTranslations | None = None
+    """Optional translations of problem types.
+
+    Set this to a :class:`problemdetails.ProblemTranslations` instance
+    to render the *title* and *detail* of catalog problems in the
+    language negotiated from the request's ``Accept-Language`` header.
+    Responses include ``Vary: Accept-Language`` and translated ones
+    include a ``Content-Language`` header.
+
+    """
+
+    problem_cache_control: dict[int, str] = {}
+    """``Cache-Control`` values for problem responses by status code.
+
+    Problem responses to ``GET`` and ``HEAD`` requests that have a
+    caching policy include the ``Cache-Control`` header and a strong
+    *ETag* computed by :meth:`~tornado.web.RequestHandler.compute_etag`
+    from the response body.  Requests with a matching
+    ``If-None-Match`` header receive a *304 Not Modified* response.
+    The policy of a :class:`~problemdetails.ProblemType` takes
+    precedence over this mapping.  Assign a new :class:`dict` instead
+    of modifying the shared one::
+
+       ErrorWriter.problem_cache_control = {404: 'public, max-age=60'}
+
+    """
+
+    problem_cache: cache.ProblemCache | None = None
+    """Optional cache of encoded problem bodies.
+
+    Set this to a :class:`problemdetails.ProblemCache` instance to
+    reuse the encoded body when the same document is rendered
+    repeatedly.  Caching is disabled by default.
+
+    """
+
+    def log_exception(self, typ: type[BaseException] | None,
+                      value: BaseException | None,
+                      tb: types.TracebackType | None) -> None:
+        """Log HTTP errors through :attr:`problem_log_sampler` if set."""
+        sampler = self.problem_log_sampler
+        if sampler is not None and isinstance(value, web.HTTPError):
+            sampler.log(self, value)
+        else:
+            super().log_exception(typ, value, tb)
+
+    def send_problem(self,
+                     status_code: int | Problem,
+                     log_message: str | None = None,
+                     *args: typing.Any,
+                     **kwargs: typing.Any) -> None:
+        """Send a problem response without raising an exception.
+
+        :param status_code: HTTP status code to return or a
+            :class:`~problemdetails.Problem` instance to render
+        :param log_message: optional log message for the problem
+        :param args: parameters that are passed to `log_message`
+        :param kwargs: keyword parameters that are passed to the
+            :class:`~problemdetails.Problem` initializer
+
+        This renders and finishes the same response that raising the
+        problem would without unwinding the stack or going through
+        Tornado's exception handling.  The problem is logged by
+        :meth:`log_exception` if it has a log message, just as it
+        would be if it were raised.  It can be called from both
+        synchronous and asynchronous request methods, including
+        :meth:`~tornado.web.RequestHandler.prepare`.
+
+        .. code-block:: python
+
+           class ItemHandler(problemdetails.ErrorWriter,
+                             web.RequestHandler):
+              async def get(self, item_id):
+                 item = await self.lookup(item_id)
+                 if item is None:
+                    self.send_problem(404, detail='No such item')
+                    return
+                 ...
+
+        """
+        if isinstance(status_code, Problem):
+            problem = status_code
+        else:
+            problem = Problem(status_code, log_message, *args, **kwargs)
+        if problem.log_message:
+            self.log_exception(Problem, problem, None)
+        self.send_error(
+            problem.status_code, exc_info=(type(problem), problem, None))
+
     def write_error(self, status_code: int, **kwargs: typing.Any) -> None:
         """Render *application/problem+json* documents instead of HTML.
 
@@ -135,29 +389,458 @@ class ErrorWriter(web.RequestHandler):
             official HTTP specification of `status_code` if omitted
             and `status_code` is a standard code.
 
+        The response representation is negotiated with the request's
+        ``Accept`` header when :attr:`alternate_serializers` is not
+        empty.
+
+        Problems created from a :class:`~problemdetails.catalog.ProblemType`
+        are rendered by splicing the per-occurrence members into the
+        pre-encoded constant members of the problem type.  The *type*
+        from the catalog takes precedence over :data:`type_link_map`.
+
         See :rfc:`7807#section-3.1` for a description of each optional
         field.
 
         """
-        body = {}
+        problem_metrics = self.problem_metrics
+        start = 0.0
+        if problem_metrics is not None and problem_metrics.enabled:
+            start = time.perf_counter()
+
+        exc_value = None
         if 'exc_info' in kwargs:
             exc_value = kwargs['exc_info'][1]
-            if isinstance(exc_value, Problem):
-                body = exc_value.document.copy()
 
-        if not body:
+        content_type, serializer = self._select_problem_serializer()
+        encoded = None
+        stream = offload = cacheable = False
+        if isinstance(exc_value, Problem):
+            default_type = type_link_map.get(status_code)
+            problem_type = exc_value.problem_type
+            localized = None
+            if (problem_type is not None
+                    and self.problem_translations is not None):
+                localized = self._localize_problem_type(problem_type)
+                if localized is not None:
+                    problem_type = localized
+            stream = self._should_stream_problem(exc_value, serializer)
+            offload = not stream and self._should_offload_problem(exc_value)
+            if (problem_type is not None and not stream and not offload
+                    and self.problem_budget is None):
+                encoded = problem_type.render(exc_value, serializer,
+                                              default_type)
+                type_ = problem_type.type or default_type
+                cacheable = encoded is not None
+            if encoded is None:
+                body = exc_value.build_document(default_type)
+                if localized is not None:
+                    localized.localize(exc_value, body)
+        else:
             status_code = int(status_code)
             body = {'status': status_code}
             sentinel = object()
             for kwarg in ('detail', 'instance', 'title', 'type'):
                 if kwargs.get(kwarg, sentinel) is not sentinel:
                     body[kwarg] = kwargs[kwarg]
+            if 'type' not in body:
+                try:
+                    body['type'] = type_link_map[status_code]
+                except KeyError:
+                    pass
+
+        if isinstance(exc_value, Problem):
+            self._release_problem(exc_value)
+
+        if stream:
+            self.set_header('Content-Type', content_type)
+            self._defer_problem(self._stream_problem(body, serializer))
+            return
+
+        if offload:
+            self.set_header('Content-Type', content_type)
+            self._defer_problem(
+                self._render_problem(body, serializer, exc_value, start))
+            return
+
+        if encoded is None:
+            type_ = body.get('type')
+            encoded, cacheable = self._encode_problem(body, content_type,
+                                                      serializer)
+        self.set_header('Content-Type', content_type)
+        self._write_encoded_problem(
+            int(status_code), exc_value, type_, encoded, start, cacheable)
+
+    def finish(self,
+               chunk: str | bytes | dict | None = None) -> asyncio.Future:
+        """Finish the response unless a problem is being rendered.
+
+        When a problem document is being rendered asynchronously, the
+        response is finished once rendering completes and the pending
+        rendering future is returned instead.
+
+        """
+        if self._problem_future is not None:
+            return self._problem_future
+        return super().finish(chunk)
+
+    def observe_problem(self, status_code: int, type_uri: str | None,
+                        instance: str | None, seconds: float,
+                        size: int) -> None:
+        """Record a problem response that was sent.
+
+        :param status_code: HTTP status code of the response
+        :param type_uri: *type* of the problem document
+        :param instance: *instance* of the problem document
+        :param seconds: time spent rendering the document
+        :param size: number of body bytes that were written
+
+        The response is recorded by :attr:`problem_metrics`,
+        :attr:`problem_counters`, and :attr:`problem_events` when they
+        are set.  Problems rendered by :meth:`write_error` are recorded
+        automatically.  Call this when a problem document is written
+        some other way, such as by
+        :meth:`LoadShedder.reject <problemdetails.LoadShedder.reject>`.
+
+        """
+        problem_metrics = self.problem_metrics
+        if problem_metrics is not None and problem_metrics.enabled:
+            problem_metrics.observe(status_code, type_uri, seconds, size)
+        if self.problem_counters is not None:
+            self.problem_counters.increment(status_code, type_uri)
+        if self.problem_events is not None:
+            self.problem_events.observe(self, status_code, type_uri, instance)
+
+    def _write_encoded_problem(self,
+                               status_code: int,
+                               exc_value: BaseException | None,
+                               type_: str | None,
+                               encoded: bytes,
+                               start: float,
+                               cacheable: bool = False) -> None:
+        encoded = self._compress_problem(encoded, cacheable)
+        if self._apply_problem_cache_policy(status_code, exc_value, encoded):
+            encoded = b''
+        else:
+            self.write(encoded)
+
+        self.observe_problem(
+            status_code, type_,
+            exc_value.instance if isinstance(exc_value, Problem) else None,
+            time.perf_counter() - start, len(encoded))
+
+    def _release_problem(self, problem: Problem) -> None:
+        keep = problem.keep_traceback
+        if keep is None:
+            release = self.release_problem_tracebacks
+            if release is None:
+                release = not self.settings.get('serve_traceback', False)
+            keep = not release
+        if not keep:
+            problem.release_traceback(self.capture_problem_stacks)
+
+    def _defer_problem(self, coroutine: typing.Coroutine) -> None:
+        self._problem_future = asyncio.ensure_future(coroutine)
+        # Marking the handler as finished keeps RequestHandler._execute
+        # from running the request method after prepare() and keeps
+        # send_error from finishing the response.  Both check the flag
+        # before the deferred coroutine starts and clears it again.
+        # The private flag behaves this way in Tornado 6.0 through 6.5;
+        # the tornado-min hatch environment tests the oldest release.
+        self._finished = True
+
+    def _finish_deferred_problem(self) -> None:
+        self._problem_future = None
+        try:
+            self.finish()
+        except Exception:
+            app_log.error('Failed to finish problem response', exc_info=True)
+
+    def _should_stream_problem(self, problem: Problem,
+                               serializer: serializers.Serializer) -> bool:
+        threshold = self.problem_stream_threshold
+        if threshold is None or self.problem_budget is not None:
+            return False
+        return (serializers.produces_json(serializer)
+                and _count_elements(problem, threshold) > threshold)
+
+    def _should_offload_problem(self, problem: Problem) -> bool:
+        if self.problem_executor is None:
+            return False
+        threshold = self.problem_executor_threshold
+        return (threshold <= 0
+                or _count_elements(problem, threshold) > threshold)
+
+    async def _render_problem(self, body: dict[str, typing.Any],
+                              serializer: serializers.Serializer,
+                              exc_value: BaseException | None,
+                              start: float) -> None:
+        self._finished = False
+        try:
+            encoded = await asyncio.get_running_loop().run_in_executor(
+                self.problem_executor, self._problem_dumps(serializer), body)
+        except Exception:
+            app_log.error('Failed to render problem document', exc_info=True)
+            # nothing has been written so send a plain error instead
+            # of an empty problem document
+            self.clear()
+            self.set_status(500)
+        else:
+            self._write_encoded_problem(body['status'], exc_value,
+                                        body.get('type'), encoded, start)
+        self._finish_deferred_problem()
+
+    async def _stream_problem(self, body: dict[str, typing.Any],
+                              serializer: serializers.Serializer) -> None:
+        start, size = time.perf_counter(), 0
+        chunk_size = self.problem_stream_chunk_size
+        buffer = bytearray()
+        self._finished = False
+        try:
+            for fragment in serializers.iterdumps(body, serializer):
+                buffer += fragment
+                if len(buffer) >= chunk_size:
+                    size += len(buffer)
+                    self.write(bytes(buffer))
+                    buffer.clear()
+                    await self.flush()
+            size += len(buffer)
+            self.write(bytes(buffer))
+        except iostream.StreamClosedError:
+            # release the request so that on_finish runs
+            self._finish_deferred_problem()
+            return
+        except Exception:
+            app_log.error('Failed to stream problem document', exc_info=True)
+        self._finish_deferred_problem()
+        self.observe_problem(body['status'], body.get('type'),
+                             body.get('instance'),
+                             time.perf_counter() - start, size)
+
+    def _apply_problem_cache_policy(self, status_code: int,
+                                    exc_value: BaseException | None,
+                                    encoded: bytes) -> bool:
+        cache_control = None
+        if (isinstance(exc_value, Problem)
+                and exc_value.problem_type is not None):
+            cache_control = exc_value.problem_type.cache_control
+        if cache_control is None:
+            cache_control = self.problem_cache_control.get(status_code)
+        if cache_control is None or self.request.method not in ('GET', 'HEAD'):
+            return False
+
+        self.set_header('Cache-Control', cache_control)
+        # same as RequestHandler.compute_etag but without having to
+        # write the body before the tag is known
+        self.set_header('Etag', f'"{hashlib.sha1(encoded).hexdigest()}"')
+        if self.check_etag_header():
+            self.set_status(304)
+            return True
+        return False
+
+    def _compress_problem(self, encoded: bytes, cacheable: bool) -> bytes:
+        compressor = self.problem_compressor
+        if compressor is None or len(encoded) < compressor.min_size:
+            return encoded
+        self.add_header('Vary', 'Accept-Encoding')
+        coding = compressor.select_coding(
+            self.request.headers.get('Accept-Encoding'))
+        if coding is None:
+            return encoded
+        self.set_header('Content-Encoding', coding)
+        return compressor.compress(encoded, coding, cacheable)
+
+    def _localize_problem_type(self, problem_type: catalog.ProblemType
+                               ) -> localization.LocalizedProblemType | None:
+        translations = self.problem_translations
+        if translations is None or problem_type.name not in translations:
+            return None
+        self.add_header('Vary', 'Accept-Language')
+        locale = translations.select_locale(
+            self.request.headers.get('Accept-Language'))
+        localized = translations.lookup(problem_type, locale)
+        if localized is not None:
+            self.set_header('Content-Language', locale)
+        return localized
 
-        if 'type' not in body:
-            try:
-                body['type'] = type_link_map[status_code]
-            except KeyError:
-                pass
+    def _select_problem_serializer(self) -> tuple[str, serializers.Serializer]:
+        alternates = self.alternate_serializers
+        if alternates is None:
+            alternates = serializers.find_binary_serializers()
+            ErrorWriter.alternate_serializers = alternates
+        if alternates:
+            self.add_header('Vary', 'Accept')
+            accept = self.request.headers.get('Accept')
+            if accept:
+                media_type = negotiation.select_media_type(
+                    accept, (self.PROBLEM_DETAILS_MIME_TYPE, *alternates))
+                if media_type in alternates:
+                    return media_type, alternates[media_type]
+        return self.PROBLEM_DETAILS_MIME_TYPE, self.serializer
 
-        self.set_header('Content-Type', self.PROBLEM_DETAILS_MIME_TYPE)
-        self.write(self.json_encoder.encode(body).encode('utf-8'))
+    def _problem_dumps(self, serializer: serializers.Serializer
+                       ) -> typing.Callable[[dict[str, typing.Any]], bytes]:
+        problem_budget = self.problem_budget
+        if problem_budget is None:
+            return serializer.dumps
+        return functools.partial(problem_budget.encode, serializer=serializer)
+
+    def _encode_problem(
+            self, body: dict[str, typing.Any], content_type: str,
+            serializer: serializers.Serializer) -> tuple[bytes, bool]:
+        problem_budget = self.problem_budget
+        dumps = self._problem_dumps(serializer)
+
+        problem_cache = self.problem_cache
+        if problem_cache is None:
+            return dumps(body), False
+
+        key = cache.make_key(body, problem_cache.max_values)
+        if key is None:
+            return dumps(body), False
+        partition = None if serializer is self.serializer else content_type
+        token = (content_type, serializer.fingerprint(), None
+                 if problem_budget is None else problem_budget.fingerprint())
+        encoded = problem_cache.lookup(token, key, partition)
+        if encoded is None:
+            encoded = dumps(body)
+            problem_cache.store(key, encoded, partition)
+        return encoded, True
+
+
+class NotFoundHandler(ErrorWriter):
+    """Answer requests that do not match a route with a problem document.
+
+    Install this as the application's ``default_handler_class`` so
+    that unmatched URLs receive a problem document instead of the
+    HTML page rendered by :class:`tornado.web.ErrorHandler`:
+
+    .. code-block:: python
+
+       app = web.Application(
+          [...], default_handler_class=problemdetails.NotFoundHandler)
+
+    The ``default_handler_args`` setting is passed to
+    :meth:`initialize`.  The document is encoded once per serializer
+    and the same bytes are written for every request so floods of
+    requests for random paths do not create or encode documents.
+    Set the application's ``log_function`` setting to
+    :meth:`log_function` to keep these requests out of the access
+    log as well:
+
+    .. code-block:: python
+
+       app = web.Application(
+          [...], default_handler_class=problemdetails.NotFoundHandler,
+          log_function=problemdetails.NotFoundHandler.log_function)
+
+    """
+
+    log_requests: bool = False
+    """Should :meth:`log_function` log requests for this handler?"""
+
+    _encoded_problems: dict[tuple[typing.Any, ...], bytes] = {}
+
+    def initialize(self,
+                   status_code: int = 404,
+                   type: str | None = None,
+                   title: str | None = None) -> None:
+        """Configure the problem document.
+
+        :param status_code: HTTP status code of the responses
+        :param type: *type* of the documents.  This defaults to the
+            :data:`type_link_map` entry for `status_code`.
+        :param title: *title* of the documents.  This defaults to the
+            HTTP reason phrase for `status_code`.
+
+        """
+        self.set_status(status_code)
+        self.problem_type_uri = (type_link_map.get(status_code)
+                                 if type is None else type)
+        self.problem_title = (httputil.responses.get(status_code)
+                              if title is None else title)
+
+    def prepare(self) -> None:
+        problem_metrics = self.problem_metrics
+        start = 0.0
+        if problem_metrics is not None and problem_metrics.enabled:
+            start = time.perf_counter()
+
+        status_code = self.get_status()
+        content_type, serializer = self._select_problem_serializer()
+        key = (serializer, status_code, self.problem_type_uri,
+               self.problem_title)
+        try:
+            encoded = self._encoded_problems[key]
+        except KeyError:
+            document: dict[str, typing.Any] = {}
+            if self.problem_type_uri is not None:
+                document['type'] = self.problem_type_uri
+            if self.problem_title is not None:
+                document['title'] = self.problem_title
+            document['status'] = status_code
+            encoded = self._encoded_problems[key] = serializer.dumps(document)
+
+        self.set_header('Content-Type', content_type)
+        self._write_encoded_problem(status_code, None, self.problem_type_uri,
+                                    encoded, start, True)
+        self.finish()
+
+    def check_xsrf_cookie(self) -> None:
+        # unmatched POST requests should not fail XSRF validation
+        pass
+
+    @staticmethod
+    def log_function(handler: web.RequestHandler) -> None:
+        """Write the access log entry for `handler`.
+
+        This is meant to be the application's ``log_function``
+        setting.  Requests that are answered by a
+        :class:`NotFoundHandler` are omitted unless
+        :attr:`log_requests` is enabled.  Other requests are logged
+        like :meth:`tornado.web.Application.log_request` does.
+
+        """
+        if isinstance(handler, NotFoundHandler) and not handler.log_requests:
+            return
+        status = handler.get_status()
+        if status < 400:
+            log_method = access_log.info
+        elif status < 500:
+            log_method = access_log.warning
+        else:
+            log_method = access_log.error
+        request = handler.request
+        log_method('%d %s %s (%s) %.2fms', status, request.method, request.uri,
+                   request.remote_ip, 1000.0 * request.request_time())
+
+
+# number of string characters that count as one element when
+# estimating the cost of encoding a problem document
+_STRING_ELEMENT_SIZE = 64
+
+
+def _count_elements(problem: Problem, limit: int) -> int:
+    """Estimate the encoding cost of the extension members of `problem`.
+
+    Every list element and object member counts as one element at any
+    depth and strings count as one element per
+    ``_STRING_ELEMENT_SIZE`` characters.  Counting stops once the
+    count exceeds `limit`.
+
+    """
+    members = problem.extensions
+    if problem._document is not None:
+        members = problem._document
+    elements = 0
+    pending = list(members.values())
+    while pending and elements <= limit:
+        value = pending.pop()
+        if isinstance(value, str):
+            elements += len(value) // _STRING_ELEMENT_SIZE
+        elif isinstance(value, (list, tuple)):
+            elements += len(value)
+            pending.extend(value)
+        elif isinstance(value, dict):
+            elements += len(value)
+            pending.extend(value.values())
+    return elements
@@ -0,0 +1,230 @@
+"""Localized *title* and *detail* members.
+
+A :class:`ProblemTranslations` instance holds the translated messages
+of the problem types in a :class:`~problemdetails.ProblemCatalog`.
+Install it as :attr:`problemdetails.ErrorWriter.problem_translations`
+and the language of each problem response is negotiated from the
+request's ``Accept-Language`` header.
+
+.. code-block:: python
+
+   problems = problemdetails.ProblemCatalog()
+   out_of_credit = problems.register(
+       'out-of-credit', 403, title='You do not have enough credit.')
+
+   translations = localization.ProblemTranslations(default_locale='en')
+   translations.add('de', 'out-of-credit',
+                    title='Sie haben nicht genug Guthaben.',
+                    detail='Ihr Guthaben beträgt {balance}.')
+   translations.compile(problems)
+   problemdetails.ErrorWriter.problem_translations = translations
+
+   class AccountHandler(problemdetails.ErrorWriter, web.RequestHandler):
+      def post(self, account):
+         raise out_of_credit(balance=30)
+
+:meth:`ProblemTranslations.compile` creates a
+:class:`LocalizedProblemType` for each translated problem type and
+locale and encodes its constant members so that the per-request work
+is the cached language negotiation and the formatting of the *detail*
+template.
+
+"""
+from __future__ import annotations
+
+import typing
+
+from problemdetails import catalog, handlers, negotiation, serializers
+from problemdetails.errors import Problem
+
+
+class LocalizedProblemType(catalog.ProblemType):
+    """Translation of a :class:`~problemdetails.ProblemType`.
+
+    :param base: the problem type that is translated
+    :param locale: language tag of the translation
+    :param title: translated *title* or :data:`None` to keep the
+        title of `base`
+    :param detail: optional :meth:`str.format` template for the
+        *detail* member.  It is formatted with the extension members
+        of the problem.
+
+    """
+
+    __slots__ = ('base', 'locale', 'detail_template')
+
+    def __init__(self,
+                 base: catalog.ProblemType,
+                 locale: str,
+                 title: str | None = None,
+                 detail: str | None = None) -> None:
+        super().__init__(
+            base.name,
+            base.status_code,
+            type=base.type,
+            title=base.title if title is None else title,
+            reason=base.reason,
+            cache_control=base.cache_control)
+        self.base = base
+        self.locale = locale
+        self.detail_template = detail
+
+    def __repr__(self) -> str:
+        return (f'<LocalizedProblemType {self.name!r} {self.status_code} '
+                f'{self.locale!r}>')
+
+    def render(self,
+               problem: Problem,
+               serializer: serializers.Serializer,
+               default_type: str | None = None) -> bytes | None:
+        """Render a problem of the translated type from the template."""
+        if problem.problem_type is not self.base:
+            return None
+        return self._render(problem, serializer, default_type,
+                            self.format_detail(problem))
+
+    def format_detail(self, problem: Problem) -> str | None:
+        """Return the translated *detail* of `problem`.
+
+        The *detail* of `problem` is returned if there is no template
+        or the template refers to a member that `problem` does not
+        have.
+
+        """
+        if self.detail_template is None:
+            return problem.detail
+        try:
+            return self.detail_template.format_map(problem.extensions)
+        except (AttributeError, IndexError, KeyError, ValueError):
+            return problem.detail
+
+    def localize(self, problem: Problem,
+                 document: dict[str, typing.Any]) -> None:
+        """Translate the members of a document built from `problem`."""
+        if problem.title is None and 'title' not in problem.extensions:
+            if self.title is not None:
+                document['title'] = self.title
+        detail = self.format_detail(problem)
+        if detail is not None:
+            document['detail'] = detail
+
+
+class ProblemTranslations:
+    """Translated messages of problem types.
+
+    :param default_locale: language of the untranslated messages
+
+    Messages are keyed by the name of the problem type and the
+    lower-case language tag.  Problem types are compiled by
+    :meth:`compile` when the application starts or when they are
+    first rendered in a language.
+
+    """
+
+    def __init__(self, default_locale: str = 'en') -> None:
+        self.default_locale = default_locale.lower()
+        self.locales: tuple[str, ...] = (self.default_locale, )
+        self._messages: dict[tuple[str, str], tuple[str | None, str
+                                                    | None]] = {}
+        self._names: set[str] = set()
+        self._compiled: dict[tuple[catalog.ProblemType, str],
+                             LocalizedProblemType] = {}
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._names
+
+    def add(self,
+            locale: str,
+            name: str,
+            *,
+            title: str | None = None,
+            detail: str | None = None) -> None:
+        """Add the translated messages of a problem type.
+
+        :param locale: language tag of the messages
+        :param name: name of the problem type
+        :param title: translated *title*
+        :param detail: :meth:`str.format` template for the *detail*
+            member that is formatted with the problem's extension
+            members
+
+        """
+        locale = locale.lower()
+        self._messages[locale, name] = (title, detail)
+        self._names.add(name)
+        if locale not in self.locales:
+            self.locales += (locale, )
+        self._compiled.clear()
+
+    def load(self, locale: str,
+             messages: typing.Mapping[str, typing.Mapping[str, str]]) -> None:
+        """Add the messages of a locale.
+
+        :param locale: language tag of the messages
+        :param messages: mapping of problem type name to a mapping
+            with optional ``title`` and ``detail`` members
+
+        """
+        for name, members in messages.items():
+            self.add(
+                locale,
+                name,
+                title=members.get('title'),
+                detail=members.get('detail'))
+
+    def compile(self,
+                problem_types: typing.Iterable[catalog.ProblemType],
+                serializers: typing.Iterable[serializers.Serializer]
+                | None = None) -> int:
+        """Create and encode the translations of `problem_types`.
+
+        :param problem_types: the problem types to compile such as
+            a :class:`~problemdetails.ProblemCatalog`
+        :param serializers: serializers to encode the constant members
+            with.  This defaults to :attr:`ErrorWriter.serializer
+            <problemdetails.ErrorWriter.serializer>`.
+        :returns: the number of translations that were compiled
+
+        """
+        if serializers is None:
+            serializers = (handlers.ErrorWriter.serializer, )
+        serializers = tuple(serializers)
+        compiled = 0
+        for problem_type in problem_types:
+            if problem_type.name not in self._names:
+                continue
+            default_type = handlers.type_link_map.get(problem_type.status_code)
+            for locale in self.locales[1:]:
+                localized = self.lookup(problem_type, locale)
+                if localized is not None:
+                    for serializer in serializers:
+                        localized.template(serializer, default_type)
+                    compiled += 1
+        return compiled
+
+    def select_locale(self, accept_language: str | None) -> str:
+        """Select the locale for an ``Accept-Language`` value."""
+        if not accept_language:
+            return self.default_locale
+        return (negotiation.select_language(accept_language, self.locales)
+                or self.default_locale)
+
+    def lookup(self, problem_type: catalog.ProblemType,
+               locale: str) -> LocalizedProblemType | None:
+        """Retrieve the translation of `problem_type` into `locale`.
+
+        :returns: the translated problem type or :data:`None` if
+            there are no messages for `problem_type` in `locale`
+
+        """
+        key = (problem_type, locale)
+        try:
+            return self._compiled[key]
+        except KeyError:
+            pass
+        messages = self._messages.get((locale, problem_type.name))
+        if messages is None:
+            return None
+        localized = self._compiled[key] = LocalizedProblemType(
+            problem_type, locale, *messages)
+        return localized
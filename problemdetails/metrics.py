@@ -0,0 +1,199 @@
+"""Low overhead instrumentation of problem responses.
+
+Install a :class:`ProblemMetrics` instance as
+:attr:`problemdetails.ErrorWriter.problem_metrics` to count problem
+responses by status code and *type* and to record how long rendering
+takes and how large the bodies are.  The :class:`MetricsHandler`
+exposes the values in the Prometheus text format.
+
+.. code-block:: python
+
+   metrics = problemdetails.ProblemMetrics()
+   problemdetails.ErrorWriter.problem_metrics = metrics
+   app = web.Application([
+       web.url('/metrics', MetricsHandler, {'metrics': metrics}),
+       ...
+   ])
+
+The counters are plain dictionaries and lists that are only updated
+from the IOLoop thread so no locking is required.
+
+"""
+from __future__ import annotations
+
+import bisect
+import typing
+
+from tornado import web
+
+DEFAULT_DURATION_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025,
+                            0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                            0.1)
+DEFAULT_SIZE_BUCKETS = (64, 128, 256, 512, 1024, 4096, 16384, 65536, 262144,
+                        1048576)
+
+PROMETHEUS_MIME_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """Fixed bucket histogram.
+
+    :param buckets: upper bounds of the buckets in increasing order.
+        An implicit ``+Inf`` bucket is added.
+
+    """
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets: typing.Sequence[float]) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """Return the (upper bound, cumulative count) pairs."""
+        result, total = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((repr(float(bound)), total))
+        result.append(('+Inf', self.count))
+        return result
+
+
+class ProblemMetrics:
+    """Counters and histograms for problem responses.
+
+    :param duration_buckets: bucket bounds for the rendering
+        duration histogram in seconds
+    :param size_buckets: bucket bounds for the body size histogram
+        in bytes
+    :param namespace: prefix for the metric names
+
+    Set :attr:`enabled` to :data:`False` to stop collecting without
+    removing the instance from the error writer.
+
+    """
+
+    def __init__(self,
+                 duration_buckets: typing.
+                 Sequence[float] = DEFAULT_DURATION_BUCKETS,
+                 size_buckets: typing.Sequence[float] = DEFAULT_SIZE_BUCKETS,
+                 namespace: str = 'problemdetails') -> None:
+        self.enabled = True
+        self.namespace = namespace
+        self.responses: dict[tuple[int, str | None], int] = {}
+        self.render_seconds = Histogram(duration_buckets)
+        self.body_bytes = Histogram(size_buckets)
+
+    def observe(self, status_code: int, type_: str | None, seconds: float,
+                size: int) -> None:
+        """Record a rendered problem response."""
+        key = (status_code, type_)
+        responses = self.responses
+        responses[key] = responses.get(key, 0) + 1
+        self.render_seconds.observe(seconds)
+        self.body_bytes.observe(size)
+
+    def reset(self) -> None:
+        """Discard all recorded values."""
+        self.responses.clear()
+        self.render_seconds = Histogram(self.render_seconds.buckets)
+        self.body_bytes = Histogram(self.body_bytes.buckets)
+
+    def render_prometheus(self) -> str:
+        """Format the metrics in the Prometheus text format."""
+        lines = format_responses(f'{self.namespace}_responses_total',
+                                 'Problem responses by status code and type.',
+                                 self.responses)
+        lines.extend(
+            _format_histogram(f'{self.namespace}_render_seconds',
+                              'Time spent rendering problem documents.',
+                              self.render_seconds))
+        lines.extend(
+            _format_histogram(f'{self.namespace}_body_bytes',
+                              'Size of rendered problem documents.',
+                              self.body_bytes))
+        lines.append('')
+        return '\n'.join(lines)
+
+
+class MetricsHandler(web.RequestHandler):
+    """Expose :class:`ProblemMetrics` in the Prometheus text format.
+
+    Pass the metrics instance as the ``metrics`` initialization
+    parameter when adding the handler to the application.
+
+    """
+
+    def initialize(self, metrics: ProblemMetrics) -> None:
+        self.metrics = metrics
+
+    def get(self) -> None:
+        self.set_header('Content-Type', PROMETHEUS_MIME_TYPE)
+        self.write(self.metrics.render_prometheus().encode('utf-8'))
+
+
+def format_metrics(
+        namespace: str,
+        samples: typing.Iterable[tuple[str, str, str, float]]) -> list[str]:
+    """Format unlabelled samples in the Prometheus text format.
+
+    :param namespace: prefix for the metric names
+    :param samples: (name, type, description, value) tuples
+    :returns: the lines of the exposition
+
+    """
+    lines: list[str] = []
+    for name, kind, description, value in samples:
+        name = f'{namespace}_{name}'
+        lines.extend([
+            f'# HELP {name} {description}', f'# TYPE {name} {kind}',
+            f'{name} {value!r}'
+        ])
+    return lines
+
+
+def format_responses(
+        name: str, description: str,
+        responses: typing.Mapping[tuple[int, str | None], int]) -> list[str]:
+    """Format a counter labelled by status code and *type*.
+
+    :param name: name of the metric
+    :param description: help text of the metric
+    :param responses: counts keyed by (status code, *type*)
+    :returns: the lines of the exposition
+
+    """
+    lines = [f'# HELP {name} {description}', f'# TYPE {name} counter']
+    for (status, type_), count in sorted(
+            responses.items(), key=_response_order):
+        lines.append(f'{name}{{status="{status}",'
+                     f'type="{_escape(type_ or "")}"}} {count}')
+    return lines
+
+
+def _escape(value: str) -> str:
+    return (value.replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n'))
+
+
+def _response_order(
+        item: tuple[tuple[int, str | None], int]) -> tuple[int, str]:
+    (status, type_), _ = item
+    return status, type_ or ''
+
+
+def _format_histogram(name: str, description: str,
+                      histogram: Histogram) -> list[str]:
+    lines = [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+    for bound, count in histogram.cumulative():
+        lines.append(f'{name}_bucket{{le="{bound}"}} {count}')
+    lines.append(f'{name}_sum {histogram.sum!r}')
+    lines.append(f'{name}_count {histogram.count}')
+    return lines
@@ -0,0 +1,160 @@
+"""Cached parsing of HTTP content negotiation headers.
+
+Clients tend to send the same handful of ``Accept``, ``Accept-Encoding``,
+and ``Accept-Language`` headers so the parsed headers and the negotiation
+results are memoized.
+
+"""
+from __future__ import annotations
+
+import functools
+import typing
+
+
+class MediaRange(typing.NamedTuple):
+    """Parsed element of an ``Accept`` header."""
+    type: str
+    subtype: str
+    quality: float
+
+
+@functools.lru_cache(maxsize=256)
+def parse_accept(header: str) -> tuple[MediaRange, ...]:
+    """Parse an ``Accept`` header into its media ranges.
+
+    :param header: the header value
+    :returns: the media ranges in the order that they appear.
+        Invalid elements are ignored.
+
+    """
+    ranges = []
+    for element in header.split(','):
+        media_type, *params = element.split(';')
+        type_, _, subtype = media_type.strip().lower().partition('/')
+        if not type_ or not subtype:
+            continue
+        ranges.append(MediaRange(type_, subtype, _parse_quality(params)))
+    return tuple(ranges)
+
+
+def _parse_quality(params: list[str]) -> float:
+    quality = 1.0
+    for param in params:
+        name, _, value = param.strip().partition('=')
+        if name.strip().lower() == 'q':
+            try:
+                quality = min(max(float(value), 0.0), 1.0)
+            except ValueError:
+                quality = 0.0
+    return quality
+
+
+def _quality(ranges: tuple[MediaRange, ...], media_type: str) -> float:
+    type_, _, subtype = media_type.lower().partition('/')
+    best, quality = -1, 0.0
+    for media_range in ranges:
+        if media_range.type == type_ and media_range.subtype == subtype:
+            specificity = 2
+        elif media_range.type == type_ and media_range.subtype == '*':
+            specificity = 1
+        elif media_range.type == '*' and media_range.subtype == '*':
+            specificity = 0
+        else:
+            continue
+        if specificity > best:
+            best, quality = specificity, media_range.quality
+    return quality
+
+
+@functools.lru_cache(maxsize=512)
+def select_media_type(header: str, candidates: tuple[str, ...]) -> str | None:
+    """Select the best of `candidates` for the ``Accept`` `header`.
+
+    :param header: the ``Accept`` header value
+    :param candidates: available media types in order of preference
+    :returns: the acceptable candidate with the highest quality or
+        :data:`None` if no candidate is acceptable.  Ties are broken
+        by the order of `candidates`.
+
+    """
+    ranges = parse_accept(header)
+    selected, selected_quality = None, 0.0
+    for candidate in candidates:
+        quality = _quality(ranges, candidate)
+        if quality > selected_quality:
+            selected, selected_quality = candidate, quality
+    return selected
+
+
+@functools.lru_cache(maxsize=256)
+def select_content_coding(header: str,
+                          candidates: tuple[str, ...]) -> str | None:
+    """Select the best of `candidates` for the ``Accept-Encoding`` `header`.
+
+    :param header: the ``Accept-Encoding`` header value
+    :param candidates: available content codings in order of preference
+    :returns: the acceptable candidate with the highest quality or
+        :data:`None` if no candidate is acceptable.  Ties are broken
+        by the order of `candidates`.
+
+    """
+    qualities: dict[str, float] = {}
+    for element in header.split(','):
+        coding, *params = element.split(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        qualities[coding] = _parse_quality(params)
+
+    wildcard = qualities.get('*', 0.0)
+    selected, selected_quality = None, 0.0
+    for candidate in candidates:
+        quality = qualities.get(candidate, wildcard)
+        if quality > selected_quality:
+            selected, selected_quality = candidate, quality
+    return selected
+
+
+@functools.lru_cache(maxsize=256)
+def select_language(header: str, candidates: tuple[str, ...]) -> str | None:
+    """Select the best of `candidates` for the ``Accept-Language`` `header`.
+
+    :param header: the ``Accept-Language`` header value
+    :param candidates: available lower-case language tags in order of
+        preference
+    :returns: the acceptable candidate with the highest quality or
+        :data:`None` if no candidate is acceptable.  Ties are broken
+        by the order of `candidates`.
+
+    A language range matches the candidates that are equal to it,
+    that it is a prefix of (``de`` matches ``de-ch``), and that are a
+    prefix of it (``de-ch`` matches ``de``).  The most specific match
+    determines the quality of a candidate.
+
+    """
+    ranges = []
+    for element in header.split(','):
+        tag, *params = element.split(';')
+        tag = tag.strip().lower()
+        if tag:
+            ranges.append((tag, _parse_quality(params)))
+
+    selected, selected_quality = None, 0.0
+    for candidate in candidates:
+        best, quality = -1, 0.0
+        for tag, tag_quality in ranges:
+            if tag == candidate:
+                specificity = 3
+            elif tag.startswith(candidate + '-'):
+                specificity = 2
+            elif candidate.startswith(tag + '-'):
+                specificity = 1
+            elif tag == '*':
+                specificity = 0
+            else:
+                continue
+            if specificity > best:
+                best, quality = specificity, tag_quality
+        if quality > selected_quality:
+            selected, selected_quality = candidate, quality
+    return selected
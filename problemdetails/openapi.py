@@ -0,0 +1,231 @@
+"""Problem types declared in an OpenAPI specification.
+
+An :class:`OpenAPICatalog` reads the problem responses of each
+operation in an OpenAPI 3 specification and registers a
+:class:`~problemdetails.ProblemType` for each of them.  The *type*,
+*title*, and *status* members are read from the response's example
+and the constant members are encoded when the problem type is
+compiled.
+
+.. code-block:: python
+
+   problems = openapi.OpenAPICatalog(yaml.safe_load(OPENAPI_SPEC))
+
+   class FetchHandler(problemdetails.ErrorWriter, web.RequestHandler):
+      def get(self, record_id):
+         ...
+         raise problems['getCustomer:404'](instance=self.request.uri)
+
+Problem types are named ``<operation>:<status>`` where *operation*
+is the ``operationId`` of the operation or the upper-cased method and
+path (``GET /{customerId}``) if the operation does not have one.
+
+Every operation is compiled when the catalog is created unless *lazy*
+is enabled.  Lazy catalogs compile the problem types of an operation
+the first time that one of them is retrieved so that processes with
+very large specifications start quickly.  The time and memory spent
+compiling is recorded in :attr:`OpenAPICatalog.report`.
+
+"""
+from __future__ import annotations
+
+import time
+import tracemalloc
+import typing
+
+from tornado.log import app_log
+
+from problemdetails import catalog, handlers, serializers
+
+METHODS = ('get', 'put', 'post', 'delete', 'options', 'head', 'patch', 'trace')
+"""Members of an OpenAPI path item that describe operations."""
+
+
+class CompilationReport(typing.NamedTuple):
+    """Cost of compiling the problem types of a specification."""
+    operations: int
+    problem_types: int
+    seconds: float
+    memory_bytes: int | None
+
+
+class OpenAPICatalog(catalog.ProblemCatalog):
+    """Catalog of the problem types declared in an OpenAPI specification.
+
+    :param specification: deserialized OpenAPI 3 specification
+    :param base_uri: optional prefix used to create the *type* of
+        problem types whose examples do not include one
+    :param lazy: compile operations when their problem types are
+        first retrieved instead of when the catalog is created
+    :param serializers: serializers to encode the constant members
+        with.  This defaults to :attr:`ErrorWriter.serializer
+        <problemdetails.ErrorWriter.serializer>`.
+    :param media_types: response media types that describe problems
+    :param measure_memory: measure the memory allocated while
+        compiling using :mod:`tracemalloc`.  This slows compilation
+        down and is disabled by default.
+
+    The operations in the specification are indexed when the catalog
+    is created.  Iterating over a lazy catalog or taking its length
+    compiles the remaining operations.
+
+    """
+
+    def __init__(
+            self,
+            specification: typing.Mapping[str, typing.Any],
+            *,
+            base_uri: str | None = None,
+            lazy: bool = False,
+            serializers: typing.Iterable[serializers.Serializer]
+            | None = None,
+            media_types: typing.Iterable[str] = ('application/problem+json', ),
+            measure_memory: bool = False) -> None:
+        super().__init__(base_uri)
+        self.specification = specification
+        self.serializers = ((handlers.ErrorWriter.serializer, )
+                            if serializers is None else tuple(serializers))
+        self.media_types = tuple(media_types)
+        self.measure_memory = measure_memory
+        self.report = CompilationReport(0, 0, 0.0,
+                                        0 if measure_memory else None)
+        self._pending: dict[str, typing.Mapping[str, typing.Any]] = {}
+        for path, path_item in specification.get('paths', {}).items():
+            path_item = self._resolve(path_item)
+            for method in METHODS:
+                operation = path_item.get(method)
+                if operation is not None:
+                    operation_id = operation.get('operationId',
+                                                 f'{method.upper()} {path}')
+                    self._pending[operation_id] = operation
+        self.operations = frozenset(self._pending)
+        if not lazy:
+            self.compile()
+            app_log.info(
+                'compiled %d problem types from %d operations in %.3fms',
+                self.report.problem_types, self.report.operations,
+                self.report.seconds * 1000.0)
+
+    def __contains__(self, name: object) -> bool:
+        if isinstance(name, str):
+            self._compile_for(name)
+        return super().__contains__(name)
+
+    def __getitem__(self, name: str) -> catalog.ProblemType:
+        self._compile_for(name)
+        return super().__getitem__(name)
+
+    def __iter__(self) -> typing.Iterator[catalog.ProblemType]:
+        self.compile()
+        return super().__iter__()
+
+    def __len__(self) -> int:
+        self.compile()
+        return super().__len__()
+
+    @property
+    def pending(self) -> int:
+        """Number of operations that have not been compiled."""
+        return len(self._pending)
+
+    def compile(self, operation_id: str | None = None) -> None:
+        """Compile the problem types of pending operations.
+
+        :param operation_id: compile this operation instead of
+            every pending operation
+        :raises KeyError: if `operation_id` is not in the specification
+
+        """
+        if operation_id is None:
+            operation_ids = list(self._pending)
+        elif operation_id in self._pending:
+            operation_ids = [operation_id]
+        elif operation_id in self.operations:
+            return
+        else:
+            raise KeyError(operation_id)
+        if not operation_ids:
+            return
+
+        tracing = False
+        memory = None
+        if self.measure_memory:
+            tracing = not tracemalloc.is_tracing()
+            if tracing:
+                tracemalloc.start()
+            memory = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        registered = 0
+        try:
+            for name in operation_ids:
+                registered += self._compile_operation(name,
+                                                      self._pending.pop(name))
+        finally:
+            elapsed = time.perf_counter() - start
+            if memory is not None:
+                memory = tracemalloc.get_traced_memory()[0] - memory
+                if tracing:
+                    tracemalloc.stop()
+
+        report = self.report
+        self.report = CompilationReport(
+            report.operations + len(operation_ids),
+            report.problem_types + registered, report.seconds + elapsed,
+            None if memory is None else
+            (report.memory_bytes or 0) + max(memory, 0))
+
+    def _compile_for(self, name: str) -> None:
+        operation_id = name.rpartition(':')[0]
+        if operation_id in self._pending:
+            self.compile(operation_id)
+
+    def _compile_operation(self, operation_id: str,
+                           operation: typing.Mapping[str, typing.Any]) -> int:
+        registered = 0
+        for status, response in operation.get('responses', {}).items():
+            content = self._resolve(response).get('content') or {}
+            for media_type in self.media_types:
+                if media_type in content:
+                    example = self._example(content[media_type])
+                    break
+            else:
+                continue
+
+            status_code = example.get('status', example.get('status_code'))
+            if status_code is None:
+                if not str(status).isdigit():
+                    continue
+                status_code = int(status)
+            problem_type = self.register(
+                f'{operation_id}:{status}',
+                int(status_code),
+                type=example.get('type'),
+                title=example.get('title'))
+            default_type = handlers.type_link_map.get(problem_type.status_code)
+            for serializer in self.serializers:
+                problem_type.template(serializer, default_type)
+            registered += 1
+        return registered
+
+    def _example(self, media: typing.Mapping[str, typing.Any]
+                 ) -> typing.Mapping[str, typing.Any]:
+        example = media.get('example')
+        if example is None:
+            for candidate in media.get('examples', {}).values():
+                example = self._resolve(candidate).get('value')
+                break
+        return example if isinstance(example, dict) else {}
+
+    def _resolve(self, node: typing.Mapping[str, typing.Any]
+                 ) -> typing.Mapping[str, typing.Any]:
+        """Follow local ``$ref`` members of `node`."""
+        seen = set()
+        while isinstance(node.get('$ref'), str):
+            ref = node['$ref']
+            if not ref.startswith('#/') or ref in seen:
+                raise ValueError(f'cannot resolve reference {ref!r}')
+            seen.add(ref)
+            node = self.specification
+            for part in ref[2:].split('/'):
+                node = node[part.replace('~1', '/').replace('~0', '~')]
+        return node
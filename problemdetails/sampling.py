@@ -0,0 +1,148 @@
+"""Rate limited logging of HTTP errors.
+
+Tornado logs a warning for every :class:`tornado.web.HTTPError` that
+has a log message.  A :class:`ProblemLogSampler` installed as
+:attr:`problemdetails.ErrorWriter.problem_log_sampler` limits the
+number of lines that are logged for each status code and problem
+*type* and periodically logs the number of lines that were suppressed.
+
+"""
+from __future__ import annotations
+
+import logging
+import time
+import typing
+
+from tornado import ioloop, web
+from tornado.log import gen_log
+
+from problemdetails.errors import Problem
+
+
+class _Deferred:
+    """Call a function when the log record is formatted."""
+
+    __slots__ = ('func', )
+
+    def __init__(self, func: typing.Callable[[], typing.Any]) -> None:
+        self.func = func
+
+    def __str__(self) -> str:
+        return str(self.func())
+
+
+class _Window:
+    __slots__ = ('start', 'emitted', 'suppressed')
+
+    def __init__(self, start: float) -> None:
+        self.start = start
+        self.emitted = 0
+        self.suppressed = 0
+
+
+def _format_message(error: web.HTTPError) -> str | None:
+    """Return the formatted log message of `error`."""
+    get_message = getattr(error, 'get_message', None)
+    if get_message is not None:
+        return typing.cast(typing.Optional[str], get_message())
+    # Tornado before 6.5 stores the unformatted message
+    if error.log_message and error.args:
+        return error.log_message % error.args
+    return error.log_message
+
+
+def problem_key(error: web.HTTPError) -> tuple[int, str | None]:
+    """Return the (status, type) pair that `error` is sampled by."""
+    type_ = None
+    if isinstance(error, Problem):
+        type_ = error.type
+        if type_ is None and error.problem_type is not None:
+            type_ = error.problem_type.type
+    return error.status_code, type_
+
+
+class ProblemLogSampler:
+    """Limit the number of log lines for repeated HTTP errors.
+
+    :param rate: number of lines to log for each (status, type) pair
+        in each interval
+    :param interval: length of the sampling interval in seconds
+    :param logger: logger to write to.  This defaults to the
+        ``tornado.general`` logger that Tornado uses.
+    :param clock: function that returns the current time in seconds
+
+    Occurrences beyond `rate` are counted and a summary line is logged
+    when the interval expires.  The summary is written when the next
+    occurrence for the same pair arrives or when :meth:`flush` is
+    called.  Use :meth:`start` to flush periodically from the IOLoop.
+
+    The log message and request summary are formatted only when a line
+    is actually emitted.
+
+    """
+
+    def __init__(self,
+                 rate: int = 1,
+                 interval: float = 60.0,
+                 logger: logging.Logger | None = None,
+                 clock: typing.Callable[[], float] = time.monotonic) -> None:
+        self.rate = rate
+        self.interval = interval
+        self.logger = gen_log if logger is None else logger
+        self.clock = clock
+        self._windows: dict[tuple[int, str | None], _Window] = {}
+        self._callback: ioloop.PeriodicCallback | None = None
+
+    def log(self, handler: web.RequestHandler, error: web.HTTPError) -> None:
+        """Log `error` for `handler` unless the rate has been exceeded."""
+        if not error.log_message or not self.logger.isEnabledFor(
+                logging.WARNING):
+            return
+
+        key = problem_key(error)
+        now = self.clock()
+        window = self._windows.get(key)
+        if window is None or now - window.start >= self.interval:
+            if window is not None:
+                self._summarize(key, window)
+            window = self._windows[key] = _Window(now)
+
+        if window.emitted < self.rate:
+            window.emitted += 1
+            self.logger.warning('%d %s: %s', error.status_code,
+                                _Deferred(handler._request_summary),
+                                _Deferred(lambda: _format_message(error)))
+        else:
+            window.suppressed += 1
+
+    def flush(self) -> None:
+        """Log summaries for intervals that have expired."""
+        now = self.clock()
+        for key, window in list(self._windows.items()):
+            if now - window.start >= self.interval:
+                self._summarize(key, window)
+                del self._windows[key]
+
+    def start(self) -> None:
+        """Call :meth:`flush` periodically on the current IOLoop."""
+        if self._callback is None:
+            self._callback = ioloop.PeriodicCallback(self.flush,
+                                                     self.interval * 1000)
+            self._callback.start()
+
+    def stop(self) -> None:
+        """Stop flushing periodically and log pending summaries."""
+        if self._callback is not None:
+            self._callback.stop()
+            self._callback = None
+        for key, window in self._windows.items():
+            self._summarize(key, window)
+        self._windows.clear()
+
+    def _summarize(self, key: tuple[int, str | None], window: _Window) -> None:
+        if window.suppressed:
+            status, type_ = key
+            self.logger.warning(
+                '%d %s: suppressed %d messages in the last %.0f seconds',
+                status, type_ or '-', window.suppressed,
+                self.clock() - window.start)
@@ -0,0 +1,299 @@
+"""Serialization backends used to render problem documents.
+
+A serializer turns a problem document into the :class:`bytes` that
+are written to the response.  The :class:`StdlibSerializer` is always
+available.  The :class:`OrjsonSerializer` and :class:`UjsonSerializer`
+adapters are available when the corresponding library is installed
+and :func:`find_serializer` picks the fastest one that is available.
+:attr:`ErrorWriter.serializer <problemdetails.ErrorWriter.serializer>`
+uses the standard library unless it is set to another serializer::
+
+   problemdetails.ErrorWriter.serializer = serializers.find_serializer()
+
+The :class:`CborSerializer` and :class:`MsgpackSerializer` adapters
+produce the binary *application/problem+cbor* and
+*application/problem+msgpack* representations.  They are available
+when *cbor2* and *msgpack* are installed and
+:func:`find_binary_serializers` returns the ones that are available.
+
+"""
+from __future__ import annotations
+
+import importlib
+import json
+import types
+import typing
+
+CBOR_MIME_TYPE = 'application/problem+cbor'
+MSGPACK_MIME_TYPE = 'application/problem+msgpack'
+
+DefaultHook = typing.Callable[[typing.Any], typing.Any]
+
+# Optional encoders are imported when a serializer first needs them
+# since importing them takes longer than importing the package.
+_OPTIONAL_MODULES = ('cbor2', 'msgpack', 'orjson', 'ujson')
+
+
+def _import_optional(name: str) -> types.ModuleType | None:
+    try:
+        module = globals()[name]
+    except KeyError:
+        try:
+            module = importlib.import_module(name)
+        except ImportError:  # pragma: no cover
+            module = None
+        globals()[name] = module
+    return typing.cast(typing.Optional[types.ModuleType], module)
+
+
+def __getattr__(name: str) -> typing.Any:
+    if name in _OPTIONAL_MODULES:
+        return _import_optional(name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+class Serializer(typing.Protocol):
+    """Interface implemented by problem document serializers."""
+
+    default: DefaultHook | None
+    """Hook that converts unsupported values, if registered."""
+
+    def dumps(self, document: typing.Any) -> bytes:
+        """Encode `document` into its binary representation."""
+
+    def register_default(self, default: DefaultHook | None) -> None:
+        """Install a hook that converts values the backend does not support.
+
+        The hook is called with the unsupported value and returns a
+        value that the backend can encode or raises :exc:`TypeError`.
+        This is the same contract as the `default` parameter of
+        :class:`json.JSONEncoder`.
+
+        """
+
+    def fingerprint(self) -> typing.Hashable:
+        """Identify the current configuration of the serializer.
+
+        The value changes whenever the output of :meth:`dumps` may
+        change so it is safe to use when caching encoded bodies.
+
+        """
+
+
+class StdlibSerializer:
+    """Serialize using :class:`json.JSONEncoder`.
+
+    :param encoder: optional encoder to use.  A new encoder is
+        created if this is omitted.
+
+    The encoder's attributes may be modified after the serializer is
+    created.
+
+    """
+
+    def __init__(self, encoder: json.JSONEncoder | None = None) -> None:
+        self.encoder = json.JSONEncoder() if encoder is None else encoder
+
+    @property
+    def default(self) -> DefaultHook | None:
+        return vars(self.encoder).get('default')
+
+    def dumps(self, document: typing.Any) -> bytes:
+        return self.encoder.encode(document).encode('utf-8')
+
+    def register_default(self, default: DefaultHook | None) -> None:
+        if default is None:
+            vars(self.encoder).pop('default', None)
+        else:
+            self.encoder.default = default  # type: ignore[method-assign]
+
+    def fingerprint(self) -> typing.Hashable:
+        return self.encoder, tuple(vars(self.encoder).items())
+
+
+class OrjsonSerializer:
+    """Serialize using :func:`orjson.dumps`.
+
+    :param option: ``orjson.OPT_*`` flags to pass to :func:`orjson.dumps`.
+        Non-string dictionary keys are permitted by default to match
+        the behavior of the standard library.
+
+    """
+
+    def __init__(self, option: int | None = None) -> None:
+        orjson = _import_optional('orjson')
+        if orjson is None:
+            raise RuntimeError('orjson is not installed')
+        self.option = orjson.OPT_NON_STR_KEYS if option is None else option
+        self.default: DefaultHook | None = None
+        self._dumps = orjson.dumps
+
+    def dumps(self, document: typing.Any) -> bytes:
+        return typing.cast(
+            bytes,
+            self._dumps(document, default=self.default, option=self.option))
+
+    def register_default(self, default: DefaultHook | None) -> None:
+        self.default = default
+
+    def fingerprint(self) -> typing.Hashable:
+        return self, self.default, self.option
+
+
+class UjsonSerializer:
+    """Serialize using :func:`ujson.dumps`.
+
+    :param options: additional keyword parameters that are passed
+        to :func:`ujson.dumps`
+
+    """
+
+    def __init__(self, **options: typing.Any) -> None:
+        ujson = _import_optional('ujson')
+        if ujson is None:
+            raise RuntimeError('ujson is not installed')
+        options.setdefault('ensure_ascii', False)
+        options.setdefault('escape_forward_slashes', False)
+        self.options = options
+        self.default: DefaultHook | None = None
+        self._dumps = ujson.dumps
+
+    def dumps(self, document: typing.Any) -> bytes:
+        if self.default is None:
+            encoded = self._dumps(document, **self.options)
+        else:
+            encoded = self._dumps(
+                document, default=self.default, **self.options)
+        return typing.cast(str, encoded).encode('utf-8')
+
+    def register_default(self, default: DefaultHook | None) -> None:
+        self.default = default
+
+    def fingerprint(self) -> typing.Hashable:
+        return self, self.default, tuple(sorted(self.options.items()))
+
+
+class CborSerializer:
+    """Serialize using :func:`cbor2.dumps`.
+
+    :param options: additional keyword parameters that are passed
+        to :func:`cbor2.dumps`
+
+    """
+
+    def __init__(self, **options: typing.Any) -> None:
+        cbor2 = _import_optional('cbor2')
+        if cbor2 is None:
+            raise RuntimeError('cbor2 is not installed')
+        self.options = options
+        self.default: DefaultHook | None = None
+        self._dumps = cbor2.dumps
+
+    def dumps(self, document: typing.Any) -> bytes:
+        if self.default is None:
+            return typing.cast(bytes, self._dumps(document, **self.options))
+        return typing.cast(
+            bytes,
+            self._dumps(
+                document, default=self._encode_default, **self.options))
+
+    def register_default(self, default: DefaultHook | None) -> None:
+        self.default = default
+
+    def fingerprint(self) -> typing.Hashable:
+        return self, self.default, tuple(sorted(self.options.items()))
+
+    def _encode_default(self, encoder: typing.Any, value: typing.Any) -> None:
+        # cbor2 passes the encoder to the hook instead of expecting
+        # a return value
+        encoder.encode(self.default(value))  # type: ignore[misc]
+
+
+class MsgpackSerializer:
+    """Serialize using :func:`msgpack.packb`.
+
+    :param options: additional keyword parameters that are passed
+        to :func:`msgpack.packb`
+
+    """
+
+    def __init__(self, **options: typing.Any) -> None:
+        msgpack = _import_optional('msgpack')
+        if msgpack is None:
+            raise RuntimeError('msgpack is not installed')
+        self.options = options
+        self.default: DefaultHook | None = None
+        self._dumps = msgpack.packb
+
+    def dumps(self, document: typing.Any) -> bytes:
+        return typing.cast(
+            bytes, self._dumps(document, default=self.default, **self.options))
+
+    def register_default(self, default: DefaultHook | None) -> None:
+        self.default = default
+
+    def fingerprint(self) -> typing.Hashable:
+        return self, self.default, tuple(sorted(self.options.items()))
+
+
+def find_serializer(encoder: json.JSONEncoder | None = None) -> Serializer:
+    """Create the fastest serializer that is available.
+
+    :param encoder: encoder to use if falling back to the
+        :class:`StdlibSerializer`
+
+    orjson is preferred over ujson which is preferred over the
+    standard library.
+
+    """
+    if _import_optional('orjson') is not None:
+        return OrjsonSerializer()
+    if _import_optional('ujson') is not None:
+        return UjsonSerializer()
+    return StdlibSerializer(encoder)  # pragma: no cover
+
+
+def find_binary_serializers() -> dict[str, Serializer]:
+    """Create the binary serializers that are available.
+
+    :returns: a mapping from media type to serializer for each of
+        the binary representations that are installed
+
+    """
+    available: dict[str, Serializer] = {}
+    if _import_optional('cbor2') is not None:
+        available[CBOR_MIME_TYPE] = CborSerializer()
+    if _import_optional('msgpack') is not None:
+        available[MSGPACK_MIME_TYPE] = MsgpackSerializer()
+    return available
+
+
+def produces_json(serializer: Serializer) -> bool:
+    """Does `serializer` produce JSON text?"""
+    return serializer.dumps({}) == b'{}'
+
+
+def iterdumps(document: dict[str, typing.Any],
+              serializer: Serializer) -> typing.Iterator[bytes]:
+    """Encode `document` incrementally using a JSON `serializer`.
+
+    Members whose values are lists or tuples are encoded one element
+    at a time so that the complete encoded document is never held in
+    memory.  Every other value is encoded by a single call to
+    :meth:`Serializer.dumps`.
+
+    """
+    yield b'{'
+    separator = b''
+    for name, value in document.items():
+        yield separator + serializer.dumps(name) + b':'
+        separator = b','
+        if isinstance(value, (list, tuple)):
+            element_separator = b'['
+            for element in value:
+                yield element_separator + serializer.dumps(element)
+                element_separator = b','
+            yield b']' if element_separator == b',' else b'[]'
+        else:
+            yield serializer.dumps(value)
+    yield b'}'
@@ -0,0 +1,195 @@
+"""Shed load when the IOLoop falls behind.
+
+A :class:`LoadShedder` measures how late the IOLoop runs its callbacks
+and counts the requests that are in progress.  Handlers that include
+:class:`LoadSheddingMixin` reject new requests in
+:meth:`~tornado.web.RequestHandler.prepare` while either value is past
+its threshold.  Rejected requests receive a *503 Service Unavailable*
+problem document that is encoded once and a ``Retry-After`` header.
+
+.. code-block:: python
+
+   shedder = shedding.LoadShedder(max_lag=0.25, max_in_flight=500)
+
+   class Handler(shedding.LoadSheddingMixin, web.RequestHandler):
+      load_shedder = shedder
+
+   app = web.Application([
+      web.url('/', Handler),
+      web.url('/shedding', problemdetails.MetricsHandler,
+              {'metrics': shedder}),
+   ])
+   shedder.start()
+
+"""
+from __future__ import annotations
+
+import typing
+
+from tornado import ioloop
+
+from problemdetails import handlers, metrics, serializers
+
+
+class SheddingState(typing.NamedTuple):
+    """Snapshot of a :class:`LoadShedder`."""
+    shedding: bool
+    lag: float
+    in_flight: int
+    shed: int
+
+
+class LoadShedder:
+    """Decide when to reject requests.
+
+    :param max_lag: reject requests while the measured IOLoop lag
+        exceeds this many seconds.  Set this to :data:`None` to
+        ignore the lag.
+    :param max_in_flight: reject requests while this many requests
+        are in progress.  Set this to :data:`None` to ignore the
+        number of requests.
+    :param interval: how often to measure the IOLoop lag in seconds
+    :param retry_after: value of the ``Retry-After`` header in seconds
+    :param type: *type* of the rejection documents.  This defaults
+        to the :data:`~problemdetails.type_link_map` entry for 503.
+    :param title: *title* of the rejection documents
+    :param namespace: prefix for the metric names
+
+    The lag is the difference between when a timer was scheduled to
+    run and when it actually ran.  It is measured every `interval`
+    seconds after :meth:`start` is called.
+
+    """
+
+    def __init__(self,
+                 max_lag: float | None = 0.5,
+                 max_in_flight: int | None = None,
+                 interval: float = 0.1,
+                 retry_after: int = 1,
+                 type: str | None = None,
+                 title: str = 'Service overloaded',
+                 namespace: str = 'problemdetails') -> None:
+        self.max_lag = max_lag
+        self.max_in_flight = max_in_flight
+        self.interval = interval
+        self.retry_after = str(retry_after)
+        self.namespace = namespace
+        self.lag = 0.0
+        self.in_flight = 0
+        self.shed = 0
+        self.document: dict[str, typing.Any] = {
+            'type': handlers.type_link_map[503] if type is None else type,
+            'title': title,
+            'status': 503,
+        }
+        self._encoded: tuple[serializers.Serializer, bytes] | None = None
+        self._io_loop: ioloop.IOLoop | None = None
+        self._timeout: object | None = None
+        self._expected = 0.0
+
+    @property
+    def shedding(self) -> bool:
+        """Are new requests being rejected?"""
+        return ((self.max_lag is not None and self.lag > self.max_lag)
+                or (self.max_in_flight is not None
+                    and self.in_flight >= self.max_in_flight))
+
+    def state(self) -> SheddingState:
+        """Return the current state."""
+        return SheddingState(self.shedding, self.lag, self.in_flight,
+                             self.shed)
+
+    def start(self) -> None:
+        """Start measuring the lag of the current IOLoop."""
+        if self._io_loop is None:
+            self._io_loop = ioloop.IOLoop.current()
+            self._schedule()
+
+    def stop(self) -> None:
+        """Stop measuring the lag and reset it."""
+        if self._io_loop is not None:
+            self._io_loop.remove_timeout(self._timeout)
+            self._io_loop = self._timeout = None
+        self.lag = 0.0
+
+    def encode(self, serializer: serializers.Serializer) -> bytes:
+        """Return the rejection document encoded by `serializer`."""
+        encoded = self._encoded
+        if encoded is None or encoded[0] is not serializer:
+            encoded = self._encoded = (serializer,
+                                       serializer.dumps(self.document))
+        return encoded[1]
+
+    def reject(self, handler: handlers.ErrorWriter) -> None:
+        """Finish `handler` with the rejection document."""
+        self.shed += 1
+        body = self.encode(handler.serializer)
+        handler.set_status(503)
+        handler.set_header('Content-Type', handler.PROBLEM_DETAILS_MIME_TYPE)
+        handler.set_header('Retry-After', self.retry_after)
+        handler.finish(body)
+        handler.observe_problem(503, self.document['type'], None, 0.0,
+                                len(body))
+
+    def render_prometheus(self) -> str:
+        """Format the state in the Prometheus text format.
+
+        This allows the shedder to be exposed by
+        :class:`~problemdetails.MetricsHandler`.
+
+        """
+        state = self.state()
+        lines = metrics.format_metrics(self.namespace, [
+            ('shedding', 'gauge', 'Whether requests are being rejected.',
+             int(state.shedding)),
+            ('ioloop_lag_seconds', 'gauge', 'Most recent IOLoop lag.',
+             state.lag),
+            ('in_flight_requests', 'gauge', 'Requests in progress.',
+             state.in_flight),
+            ('shed_requests_total', 'counter', 'Rejected requests.',
+             state.shed),
+        ])
+        lines.append('')
+        return '\n'.join(lines)
+
+    def _schedule(self) -> None:
+        assert self._io_loop is not None
+        self._expected = self._io_loop.time() + self.interval
+        self._timeout = self._io_loop.call_at(self._expected, self._measure)
+
+    def _measure(self) -> None:
+        if self._io_loop is not None:
+            self.lag = max(0.0, self._io_loop.time() - self._expected)
+            self._schedule()
+
+
+class LoadSheddingMixin(handlers.ErrorWriter):
+    """Reject requests while :attr:`load_shedder` is shedding load.
+
+    Requests are rejected and counted in :meth:`prepare`.  Handlers
+    that implement ``prepare`` must call this implementation first
+    and return if the request has been finished.
+
+    """
+
+    load_shedder: LoadShedder | None = None
+    """The :class:`LoadShedder` that decides when to reject requests."""
+
+    _admitted_by: LoadShedder | None = None
+
+    def prepare(self) -> typing.Awaitable[None] | None:
+        shedder = self.load_shedder
+        if shedder is not None:
+            if shedder.shedding:
+                shedder.reject(self)
+                return None
+            shedder.in_flight += 1
+            self._admitted_by = shedder
+        return super().prepare()
+
+    def on_finish(self) -> None:
+        shedder = self._admitted_by
+        if shedder is not None:
+            shedder.in_flight -= 1
+            self._admitted_by = None
+        super().on_finish()
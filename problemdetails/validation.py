@@ -0,0 +1,187 @@
+"""JSON schema validation that produces problem documents.
+
+A :class:`SchemaValidator` compiles each schema once and reports
+validation failures as *422 Unprocessable Entity*
+:class:`~problemdetails.Problem` instances.  It requires the
+*jsonschema* package.
+
+.. code-block:: python
+
+   openapi = yaml.safe_load(OPENAPI_SPEC)
+   validator = validation.SchemaValidator(openapi)
+
+   class CreateHandler(problemdetails.ErrorWriter, web.RequestHandler):
+      def post(self):
+         body = json.loads(self.request.body)
+         validator.validate(body, '#/components/schemas/CustomerDetails')
+         ...
+
+Errors are collected lazily and collection stops after
+:attr:`~SchemaValidator.max_errors` errors so an invalid request with a
+large body does not produce an error for every element.  The errors
+are reported in the ``invalid-params`` extension member as a list of
+``{"name": ..., "reason": ...}`` objects where *name* is a JSON
+pointer (:rfc:`6901`) to the invalid value.
+
+"""
+from __future__ import annotations
+
+import collections
+import itertools
+import typing
+
+try:
+    import jsonschema
+    import jsonschema.exceptions
+    import jsonschema.validators
+    import referencing
+    import referencing.jsonschema
+except ImportError:  # pragma: no cover
+    jsonschema = None
+    referencing = None
+
+from problemdetails.catalog import ProblemType
+from problemdetails.errors import Problem
+
+ROOT_URI = 'urn:problemdetails:root'
+"""URI that the root document is registered under."""
+
+Schema = typing.Union[str, typing.Mapping[str, typing.Any]]
+
+
+class SchemaValidator:
+    """Validate instances against cached, compiled schemas.
+
+    :param root: optional document that contains schemas.  Schemas
+        that are passed as ``$ref`` strings, such as
+        ``'#/components/schemas/Customer'``, are resolved within this
+        document.
+    :param max_errors: stop collecting errors after this many
+    :param validator_class: *jsonschema* validator class to use.  The
+        class is selected by the ``$schema`` member of each schema and
+        defaults to Draft 7 if this is omitted.
+    :param format_checker: optional :class:`jsonschema.FormatChecker`
+    :param maxsize: maximum number of compiled schemas to cache
+    :param type: *type* of the validation problems
+    :param title: *title* of the validation problems
+    :param member: name of the extension member that lists the errors
+
+    Compiled validators are cached by ``$ref`` string, by ``$id`` if
+    the schema has one, and by identity otherwise.  Schemas that are
+    mappings are compiled on their own so references within them must
+    be local to the schema or absolute.
+
+    """
+
+    def __init__(self,
+                 root: typing.Mapping[str, typing.Any] | None = None,
+                 *,
+                 max_errors: int = 10,
+                 validator_class: type | None = None,
+                 format_checker: typing.Any = None,
+                 maxsize: int = 128,
+                 type: str | None = None,
+                 title: str = 'Request validation failed',
+                 member: str = 'invalid-params') -> None:
+        if jsonschema is None:  # pragma: no cover
+            raise RuntimeError('SchemaValidator requires jsonschema')
+        self.root = root
+        self.max_errors = max_errors
+        self.validator_class = validator_class
+        self.format_checker = format_checker
+        self.maxsize = maxsize
+        self.member = member
+        self.problem_type = ProblemType(
+            'validation-failed', 422, type=type, title=title)
+        self._registry = referencing.Registry()
+        if root is not None:
+            self._registry = self._registry.with_resource(
+                ROOT_URI, referencing.jsonschema.DRAFT7.create_resource(root))
+        self._validators: collections.OrderedDict[typing.Hashable,
+                                                  tuple[Schema, typing.Any]]
+        self._validators = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._validators)
+
+    def compile(self, schema: Schema) -> typing.Any:
+        """Retrieve the compiled validator for `schema`."""
+        if isinstance(schema, str):
+            key: typing.Hashable = ('$ref', schema)
+        elif isinstance(schema.get('$id'), str):
+            key = ('$id', schema['$id'])
+        else:
+            key = id(schema)
+
+        entry = self._validators.get(key)
+        if entry is not None and (entry[0] is schema
+                                  or not isinstance(key, int)):
+            self._validators.move_to_end(key)
+            return entry[1]
+
+        if isinstance(schema, str):
+            if self.root is None:
+                raise ValueError(
+                    f'cannot resolve {schema!r} without a root document')
+            definition: typing.Mapping[str, typing.Any] = {
+                '$ref': ROOT_URI + schema
+            }
+        else:
+            definition = schema
+        cls = self.validator_class
+        if cls is None:
+            cls = jsonschema.validators.validator_for(
+                definition, default=jsonschema.Draft7Validator)
+        cls.check_schema(definition)
+        validator = cls(
+            definition,
+            registry=self._registry,
+            format_checker=self.format_checker)
+
+        # the schema is kept so that its id is not reused
+        self._validators[key] = (schema, validator)
+        while len(self._validators) > self.maxsize:
+            self._validators.popitem(last=False)
+        return validator
+
+    def iter_errors(self, instance: typing.Any,
+                    schema: Schema) -> typing.Iterator[typing.Any]:
+        """Generate at most :attr:`max_errors` validation errors."""
+        return itertools.islice(
+            self.compile(schema).iter_errors(instance), self.max_errors)
+
+    def is_valid(self, instance: typing.Any, schema: Schema) -> bool:
+        """Is `instance` valid?  This stops at the first error."""
+        return typing.cast(bool, self.compile(schema).is_valid(instance))
+
+    def validate(self, instance: typing.Any, schema: Schema) -> None:
+        """Validate `instance` against `schema`.
+
+        :raises problemdetails.Problem: if `instance` is invalid
+
+        """
+        errors = list(self.iter_errors(instance, schema))
+        if errors:
+            raise self.problem(errors)
+
+    def problem(self, errors: typing.Sequence[typing.Any]) -> Problem:
+        """Create the problem that reports `errors`.
+
+        The *detail* member is the message of the most relevant error
+        as determined by :func:`jsonschema.exceptions.best_match`.
+
+        """
+        best = jsonschema.exceptions.best_match(errors)
+        return self.problem_type(
+            detail=best.message if best is not None else None,
+            **{
+                self.member: [{
+                    'name': _json_pointer(error.absolute_path),
+                    'reason': error.message
+                } for error in errors]
+            })
+
+
+def _json_pointer(path: typing.Iterable[typing.Any]) -> str:
+    return ''.join(
+        '/' + str(part).replace('~', '~0').replace('/', '~1') for part in path)
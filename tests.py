@@ -1,18 +1,64 @@
+import asyncio
+import collections
+import concurrent.futures
+import datetime
+import email.utils
+import gzip
+import hashlib
 import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import weakref
+from unittest import mock
 try:
     from urllib.parse import urlencode
 except ImportError:  # pragma: no cover
     from urllib import urlencode
 
-from tornado import httputil, testing, web
+from tornado import httpclient, httputil, tcpclient, testing, web
 
-from problemdetails import handlers
+from problemdetails import (cache, client, compression, counters, events,
+                            handlers, localization, negotiation, openapi,
+                            sampling, serializers, shedding, validation)
+import benchmarks
 import problemdetails
 
+problem_catalog = problemdetails.ProblemCatalog(
+    base_uri='https://example.com/probs/')
+problem_catalog.register(
+    'out-of-credit', 403, title='You do not have enough credit.')
+problem_metrics = problemdetails.ProblemMetrics()
+
+plain_catalog = problemdetails.ProblemCatalog()
+plain_catalog.register(
+    'throttled', 429, title='Slow down', reason='Too Many Requests')
+plain_catalog.register('custom-reason', 600)
+plain_catalog.register(
+    'cached-missing',
+    404,
+    title='Not here',
+    cache_control='public, max-age=300')
+
 
 class Application(web.Application):
     def __init__(self, **settings):
-        super(Application, self).__init__([web.url('/', Handler)], settings)
+        super(Application, self).__init__([
+            web.url('/', Handler),
+            web.url('/catalog/(?P<name>.*)', CatalogHandler),
+            web.url('/large', LargeProblemHandler),
+            web.url('/prepared', PreparedProblemHandler),
+            web.url('/retained', RetainingHandler),
+            web.url('/send/(?P<name>.*)', SendingHandler),
+            web.url('/shed', SheddingHandler),
+            web.url('/metrics', problemdetails.MetricsHandler,
+                    {'metrics': problem_metrics}),
+        ], **settings)
 
 
 class Handler(problemdetails.ErrorWriter, web.RequestHandler):
@@ -51,6 +97,109 @@ class Handler(problemdetails.ErrorWriter, web.RequestHandler):
             self.send_error(status, **kwargs)
 
 
+class CatalogHandler(problemdetails.ErrorWriter, web.RequestHandler):
+    def get(self, name):
+        kwargs = {}
+        for arg in self.request.query_arguments.keys():
+            kwargs[arg] = self.get_query_argument(arg)
+            if kwargs[arg].startswith(('{', '[')):
+                kwargs[arg] = json.loads(kwargs[arg])
+        catalog = problem_catalog if name in problem_catalog else plain_catalog
+        raise catalog[name](**kwargs)
+
+
+class SendingHandler(problemdetails.ErrorWriter, web.RequestHandler):
+    def get(self, name):
+        if name in problem_catalog or name in plain_catalog:
+            catalog = (problem_catalog
+                       if name in problem_catalog else plain_catalog)
+            self.send_problem(catalog[name](detail='sent'))
+        else:
+            self.send_problem(
+                int(name),
+                'sent %s',
+                name,
+                detail='sent',
+                reason='Sent',
+                extra=[1, 2])
+
+    async def post(self, name):
+        await asyncio.sleep(0)
+        self.send_problem(int(name), detail='sent')
+
+
+class SheddingHandler(problemdetails.LoadSheddingMixin, web.RequestHandler):
+    release = None
+
+    async def get(self):
+        if self.get_query_argument('wait', None):
+            await SheddingHandler.release.wait()
+        self.write('ok')
+
+
+class LargeProblemHandler(problemdetails.ErrorWriter, web.RequestHandler):
+    flushes = 0
+
+    async def get(self):
+        count = int(self.get_query_argument('count'))
+        problem_type = self.get_query_argument('catalog', None)
+        kwargs = {
+            'title':
+            'Validation failed',
+            'failure': [{
+                'index': idx,
+                'message': 'bad value'
+            } for idx in range(count)],
+            'other':
+            list(range(3)),
+        }
+        text = int(self.get_query_argument('text', '0'))
+        if text:
+            kwargs['failure'] = {'summary': {'detail': 'x' * text}}
+        if problem_type:
+            del kwargs['title']
+            raise problem_catalog[problem_type](**kwargs)
+        raise problemdetails.Problem(422, **kwargs)
+
+    def flush(self, include_footers=False):
+        LargeProblemHandler.flushes += 1
+        return super(LargeProblemHandler, self).flush(include_footers)
+
+
+class PreparedProblemHandler(problemdetails.LoadSheddingMixin,
+                             web.RequestHandler):
+    def prepare(self):
+        super(PreparedProblemHandler, self).prepare()
+        if self._finished:
+            return
+        count = int(self.get_query_argument('count'))
+        self.send_problem(422, failure=list(range(count)))
+
+    def get(self):
+        self.write('handled')
+
+
+class Payload:
+    pass
+
+
+class RetainingHandler(problemdetails.ErrorWriter, web.RequestHandler):
+    problems = []
+    payloads = []
+
+    async def get(self):
+        payload = Payload()
+        RetainingHandler.payloads.append(weakref.ref(payload))
+        problem = problemdetails.Problem(400, detail='retained')
+        if self.get_query_argument('keep', None):
+            problem.keep_traceback = True
+        RetainingHandler.problems.append(problem)
+        try:
+            {}['missing']
+        except KeyError:
+            raise problem
+
+
 class ErrorWriterTests(testing.AsyncHTTPTestCase):
     def setUp(self):
         super(ErrorWriterTests, self).setUp()
@@ -74,6 +223,15 @@ class ErrorWriterTests(testing.AsyncHTTPTestCase):
         self.assertEqual(response.headers['Content-Type'],
                          'application/problem+json')
 
+    def test_that_json_encoder_is_used_by_default(self):
+        encoder = handlers.ErrorWriter.json_encoder
+        encoder.sort_keys = True
+        self.addCleanup(setattr, encoder, 'sort_keys', False)
+        response = self.send_query(status=400, detail='sorted')
+        self.assertEqual(
+            response.body, b'{"detail": "sorted", "status": 400, "type": ' +
+            json.dumps(handlers.type_link_map[400]).encode() + b'}')
+
     def test_that_send_error_includes_status(self):
         response = self.send_query(status=500)
         body = json.loads(response.body.decode('utf-8'))
@@ -160,3 +318,2508 @@ class ProblemTests(ErrorWriterTests):
         response = self.send_query(status=401, log_message='whatever')
         body = json.loads(response.body.decode('utf-8'))
         self.assertNotIn('log_message', body)
+
+
+class ProblemCacheTests(testing.AsyncHTTPTestCase):
+    def setUp(self):
+        super(ProblemCacheTests, self).setUp()
+        self.cache = problemdetails.ProblemCache(maxsize=4)
+        handlers.ErrorWriter.problem_cache = self.cache
+
+    def tearDown(self):
+        super(ProblemCacheTests, self).tearDown()
+        handlers.ErrorWriter.problem_cache = None
+        handlers.ErrorWriter.PROBLEM_DETAILS_MIME_TYPE = (
+            'application/problem+json')
+
+    def get_app(self):
+        return Application()
+
+    def send_query(self, **query):
+        return self.fetch('/?{0}'.format(urlencode(query)))
+
+    def test_that_large_documents_bypass_the_cache(self):
+        self.cache.max_values = 100
+        self.fetch('/large?count=10')
+        self.fetch('/large?count=100')
+        info = self.cache.info()
+        self.assertEqual((info.misses, info.currsize), (1, 1))
+
+    def test_that_repeated_documents_are_served_from_cache(self):
+        first = self.send_query(status=404)
+        second = self.send_query(status=404)
+        self.assertEqual(first.body, second.body)
+        info = self.cache.info()
+        self.assertEqual(info.misses, 1)
+        self.assertEqual(info.hits, 1)
+        self.assertEqual(info.currsize, 1)
+
+    def test_that_raised_problems_are_cached(self):
+        self.send_query(status=429, title='Slow down', raise_error=True)
+        response = self.send_query(
+            status=429, title='Slow down', raise_error=True)
+        body = json.loads(response.body.decode('utf-8'))
+        self.assertEqual(body['title'], 'Slow down')
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_that_content_type_change_invalidates_cache(self):
+        self.send_query(status=404)
+        handlers.ErrorWriter.PROBLEM_DETAILS_MIME_TYPE = 'application/json'
+        self.send_query(status=404)
+        self.assertEqual(self.cache.hits, 0)
+        self.assertEqual(self.cache.invalidations, 1)
+
+    def test_that_encoder_change_invalidates_cache(self):
+        serializer = serializers.StdlibSerializer()
+        original, handlers.ErrorWriter.serializer = (
+            handlers.ErrorWriter.serializer, serializer)
+        try:
+            self.send_query(status=404)
+            serializer.encoder.sort_keys = True
+            self.send_query(status=404)
+        finally:
+            handlers.ErrorWriter.serializer = original
+        self.assertEqual(self.cache.hits, 0)
+        self.assertEqual(self.cache.invalidations, 1)
+
+    def test_that_registering_default_invalidates_cache(self):
+        serializer = handlers.ErrorWriter.serializer
+        self.send_query(status=404)
+        try:
+            serializer.register_default(str)
+            self.send_query(status=404)
+        finally:
+            serializer.register_default(None)
+        self.assertEqual(self.cache.hits, 0)
+        self.assertEqual(self.cache.invalidations, 1)
+
+    def test_that_type_link_map_changes_are_honored(self):
+        original = handlers.type_link_map[404]
+        self.send_query(status=404)
+        try:
+            handlers.type_link_map[404] = 'https://example.com/missing'
+            response = self.send_query(status=404)
+        finally:
+            handlers.type_link_map[404] = original
+        body = json.loads(response.body.decode('utf-8'))
+        self.assertEqual(body['type'], 'https://example.com/missing')
+        self.assertEqual(self.cache.hits, 0)
+
+
+class ProblemCacheUnitTests(unittest.TestCase):
+    def test_that_least_recently_used_entry_is_evicted(self):
+        problem_cache = problemdetails.ProblemCache(maxsize=2)
+        problem_cache.lookup(None, 'a')
+        problem_cache.store('a', b'a')
+        problem_cache.store('b', b'b')
+        problem_cache.lookup(None, 'a')
+        problem_cache.store('c', b'c')
+        self.assertEqual(problem_cache.lookup(None, 'a'), b'a')
+        self.assertIsNone(problem_cache.lookup(None, 'b'))
+        self.assertEqual(problem_cache.info().evictions, 1)
+
+    def test_that_keys_distinguish_value_types(self):
+        keys = {
+            cache.make_key({'value': value})
+            for value in (1, 1.0, True, '1', [1], {
+                '1': 1
+            })
+        }
+        self.assertEqual(len(keys), 6)
+
+    def test_that_keys_preserve_member_order(self):
+        self.assertNotEqual(
+            cache.make_key({
+                'a': 1,
+                'b': 2
+            }), cache.make_key({
+                'b': 2,
+                'a': 1
+            }))
+
+    def test_that_unsupported_values_are_not_cacheable(self):
+        self.assertIsNone(cache.make_key({'value': object()}))
+        self.assertIsNone(cache.make_key({'value': {1: 'one'}}))
+
+    def test_that_large_documents_are_not_cacheable(self):
+        document = {'status': 422, 'failure': [{'index': 1}, {'index': 2}]}
+        self.assertIsNotNone(cache.make_key(document, 6))
+        self.assertIsNone(cache.make_key(document, 5))
+        self.assertIsNone(cache.make_key({'items': list(range(10))}, 5))
+
+    def test_that_maxsize_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            problemdetails.ProblemCache(maxsize=0)
+
+
+class SerializerTests(unittest.TestCase):
+    def setUp(self):
+        super(SerializerTests, self).setUp()
+        self.serializers = [serializers.StdlibSerializer()]
+        if serializers.orjson is not None:
+            self.serializers.append(serializers.OrjsonSerializer())
+        if serializers.ujson is not None:
+            self.serializers.append(serializers.UjsonSerializer())
+
+    def test_that_serializers_produce_equivalent_documents(self):
+        document = {
+            'status': 400,
+            'type': 'https://example.com/probs/out-of-credit',
+            'invalid-params': [{
+                'name': 'age',
+                'reason': 'too old'
+            }],
+            'detail': 'Caf\u00e9 is closed',
+            'ratio': 0.5,
+            'flag': True,
+            'missing': None,
+        }
+        for serializer in self.serializers:
+            body = serializer.dumps(document)
+            self.assertIsInstance(body, bytes)
+            self.assertEqual(
+                json.loads(body.decode('utf-8')), document, serializer)
+
+    def test_that_default_hook_is_used(self):
+        marker = object()
+        for serializer in self.serializers:
+            with self.assertRaises(TypeError):
+                serializer.dumps({'value': marker})
+            serializer.register_default(lambda obj: 'converted')
+            self.assertIsNotNone(serializer.default)
+            body = serializer.dumps({'value': marker})
+            self.assertEqual(
+                json.loads(body.decode('utf-8')), {'value': 'converted'},
+                serializer)
+            serializer.register_default(None)
+            self.assertIsNone(serializer.default)
+
+    def test_that_fingerprint_tracks_configuration(self):
+        for serializer in self.serializers:
+            before = serializer.fingerprint()
+            serializer.register_default(str)
+            self.assertNotEqual(before, serializer.fingerprint(), serializer)
+            serializer.register_default(None)
+            self.assertEqual(before, serializer.fingerprint(), serializer)
+
+    def test_that_stdlib_serializer_wraps_encoder(self):
+        encoder = json.JSONEncoder(sort_keys=True)
+        serializer = serializers.StdlibSerializer(encoder)
+        self.assertEqual(
+            serializer.dumps({
+                'b': 1,
+                'a': 2
+            }), b'{"a": 2, "b": 1}')
+
+
+class ProblemInstanceTests(unittest.TestCase):
+    def test_that_document_is_built_on_demand(self):
+        problem = problemdetails.Problem(
+            404, title='Not here', instance='/1234', custom=[1, 2])
+        self.assertEqual(problem.title, 'Not here')
+        self.assertEqual(problem.instance, '/1234')
+        self.assertIsNone(problem.detail)
+        self.assertEqual(problem.extensions, {'custom': [1, 2]})
+        self.assertEqual(
+            problem.document, {
+                'title': 'Not here',
+                'status': 404,
+                'instance': '/1234',
+                'custom': [1, 2],
+            })
+
+    def test_that_document_modifications_are_rendered(self):
+        problem = problemdetails.Problem(400, title='Bad')
+        problem.document['extra'] = True
+        self.assertEqual(
+            problem.build_document('/errors#bad'), {
+                'title': 'Bad',
+                'status': 400,
+                'extra': True,
+                'type': '/errors#bad',
+            })
+        self.assertNotIn('type', problem.document)
+
+    def test_that_document_can_be_replaced(self):
+        problem = problemdetails.Problem(400)
+        problem.document = {'status': 400, 'replaced': True}
+        self.assertEqual(problem.build_document(), {
+            'status': 400,
+            'replaced': True
+        })
+
+    def test_that_default_type_is_not_applied_to_explicit_null(self):
+        problem = problemdetails.Problem(400, type=None)
+        self.assertEqual(
+            problem.build_document('/errors#bad'), {
+                'status': 400,
+                'type': None
+            })
+
+    def test_that_status_cannot_be_overridden(self):
+        problem = problemdetails.Problem(400, status=200)
+        self.assertEqual(problem.build_document()['status'], 400)
+
+    def test_that_reason_is_computed_from_status(self):
+        self.assertEqual(problemdetails.Problem(404).reason, 'Not Found')
+        self.assertEqual(problemdetails.Problem(600).reason, 'Abnormal Status')
+        self.assertEqual(
+            problemdetails.Problem(404, reason='Gone fishing').reason,
+            'Gone fishing')
+
+    def test_that_log_message_is_formatted(self):
+        problem = problemdetails.Problem(400, 'failed %s', 'here')
+        self.assertEqual(problem.log_message % problem.args, 'failed here')
+        self.assertEqual(str(problem), 'HTTP 400: Bad Request (failed here)')
+        self.assertEqual(problem.build_document(), {'status': 400})
+
+
+class CatalogTests(testing.AsyncHTTPTestCase):
+    def get_app(self):
+        return Application()
+
+    def get_document(self, name, **query):
+        response = self.fetch('/catalog/{0}?{1}'.format(
+            name, urlencode(query)))
+        self.assertEqual(response.headers['Content-Type'],
+                         'application/problem+json')
+        return response, json.loads(response.body.decode('utf-8'))
+
+    def test_that_constant_members_are_rendered(self):
+        response, body = self.get_document('out-of-credit')
+        self.assertEqual(response.code, 403)
+        self.assertEqual(
+            body, {
+                'type': 'https://example.com/probs/out-of-credit',
+                'title': 'You do not have enough credit.',
+                'status': 403,
+            })
+
+    def test_that_occurrence_members_are_spliced(self):
+        response, body = self.get_document(
+            'out-of-credit',
+            detail='Balance is 30',
+            instance='/account/1',
+            accounts=json.dumps(['/account/2']))
+        self.assertEqual(
+            list(body.items()),
+            [('type', 'https://example.com/probs/out-of-credit'),
+             ('title', 'You do not have enough credit.'), ('status', 403),
+             ('detail', 'Balance is 30'), ('instance', '/account/1'),
+             ('accounts', ['/account/2'])])
+
+    def test_that_type_defaults_to_type_link_map(self):
+        response, body = self.get_document('throttled')
+        self.assertEqual(response.code, 429)
+        self.assertEqual(response.reason, 'Too Many Requests')
+        self.assertEqual(body['type'], handlers.type_link_map[429])
+
+    def test_that_type_is_omitted_for_unknown_status(self):
+        response, body = self.get_document('custom-reason')
+        self.assertEqual(response.code, 600)
+        self.assertEqual(body, {'status': 600})
+
+    def test_that_constant_members_can_be_overridden(self):
+        response, body = self.get_document(
+            'out-of-credit', title='Broke', type='/errors#broke')
+        self.assertEqual(body['title'], 'Broke')
+        self.assertEqual(body['type'], '/errors#broke')
+
+
+class ProblemCatalogTests(unittest.TestCase):
+    def test_that_problem_types_create_problems(self):
+        problem = problem_catalog['out-of-credit'](detail='Nope', balance=30)
+        self.assertIsInstance(problem, problemdetails.Problem)
+        self.assertEqual(problem.status_code, 403)
+        self.assertEqual(
+            problem.document, {
+                'type': 'https://example.com/probs/out-of-credit',
+                'title': 'You do not have enough credit.',
+                'status': 403,
+                'detail': 'Nope',
+                'balance': 30,
+            })
+
+    def test_that_template_output_matches_document(self):
+        problem_type = problem_catalog['out-of-credit']
+        for serializer in (serializers.StdlibSerializer(),
+                           handlers.ErrorWriter.serializer):
+            problem = problem_type(detail='Nope', extra={'a': [1, 2]})
+            rendered = problem_type.render(problem, serializer)
+            self.assertEqual(
+                json.loads(rendered.decode('utf-8')), problem.build_document())
+
+    def test_that_materialized_documents_are_not_templated(self):
+        problem_type = problem_catalog['out-of-credit']
+        problem = problem_type()
+        problem.document['extra'] = True
+        self.assertIsNone(
+            problem_type.render(problem, handlers.ErrorWriter.serializer))
+
+    def test_that_non_json_serializers_are_not_templated(self):
+        class Serializer(serializers.StdlibSerializer):
+            def dumps(self, document):
+                return b'\x80'
+
+        problem_type = problem_catalog['out-of-credit']
+        self.assertIsNone(problem_type.template(Serializer()))
+        self.assertIsNone(problem_type.render(problem_type(), Serializer()))
+
+    def test_that_duplicate_names_are_rejected(self):
+        catalog = problemdetails.ProblemCatalog()
+        catalog.register('dup', 400)
+        with self.assertRaises(ValueError):
+            catalog.register('dup', 404)
+        self.assertIn('dup', catalog)
+        self.assertEqual(len(catalog), 1)
+        self.assertEqual([t.name for t in catalog], ['dup'])
+        self.assertIsNone(catalog['dup'].type)
+        self.assertEqual(repr(catalog['dup']), "<ProblemType 'dup' 400>")
+
+
+class ContentNegotiationTests(testing.AsyncHTTPTestCase):
+    def get_app(self):
+        return Application()
+
+    def tearDown(self):
+        super(ContentNegotiationTests, self).tearDown()
+        handlers.ErrorWriter.problem_cache = None
+
+    def send_query(self, accept, **query):
+        headers = {} if accept is None else {'Accept': accept}
+        return self.fetch('/?{0}'.format(urlencode(query)), headers=headers)
+
+    def test_that_json_is_the_default(self):
+        for accept in (None, '*/*', 'text/html', 'application/json',
+                       'application/problem+cbor;q=0'):
+            response = self.send_query(accept, status=404)
+            self.assertEqual(response.headers['Content-Type'],
+                             'application/problem+json', accept)
+
+    @unittest.skipIf(not serializers.find_binary_serializers(),
+                     'neither cbor2 nor msgpack is installed')
+    def test_that_negotiated_responses_vary_on_accept(self):
+        for accept in (None, '*/*', 'application/problem+cbor;q=0'):
+            response = self.send_query(accept, status=404)
+            self.assertEqual(response.headers['Vary'], 'Accept', accept)
+
+    @unittest.skipIf(serializers.cbor2 is None, 'cbor2 is not installed')
+    def test_that_cbor_is_negotiated(self):
+        response = self.send_query(
+            'application/problem+json;q=0.5, application/problem+cbor',
+            status=429,
+            title='Slow down',
+            raise_error=True)
+        self.assertEqual(response.headers['Content-Type'],
+                         'application/problem+cbor')
+        self.assertEqual(
+            serializers.cbor2.loads(response.body), {
+                'title': 'Slow down',
+                'status': 429,
+                'type': handlers.type_link_map[429]
+            })
+
+    @unittest.skipIf(serializers.msgpack is None, 'msgpack is not installed')
+    def test_that_msgpack_is_negotiated(self):
+        response = self.send_query('application/problem+msgpack', status=404)
+        self.assertEqual(response.headers['Content-Type'],
+                         'application/problem+msgpack')
+        self.assertEqual(
+            serializers.msgpack.unpackb(response.body), {
+                'status': 404,
+                'type': handlers.type_link_map[404]
+            })
+
+    @unittest.skipIf(serializers.msgpack is None, 'msgpack is not installed')
+    def test_that_catalog_problems_are_negotiated(self):
+        response = self.fetch(
+            '/catalog/out-of-credit?detail=none',
+            headers={'Accept': 'application/*+msgpack'})
+        self.assertEqual(response.headers['Content-Type'],
+                         'application/problem+json')
+        response = self.fetch(
+            '/catalog/out-of-credit?detail=none',
+            headers={'Accept': 'application/problem+msgpack'})
+        self.assertEqual(
+            serializers.msgpack.unpackb(response.body), {
+                'type': 'https://example.com/probs/out-of-credit',
+                'title': 'You do not have enough credit.',
+                'status': 403,
+                'detail': 'none',
+            })
+
+    @unittest.skipIf(serializers.msgpack is None, 'msgpack is not installed')
+    def test_that_representations_are_cached_separately(self):
+        problem_cache = problemdetails.ProblemCache()
+        handlers.ErrorWriter.problem_cache = problem_cache
+        for _ in range(2):
+            json_body = self.send_query(None, status=404).body
+            msgpack_body = self.send_query(
+                'application/problem+msgpack', status=404).body
+        self.assertNotEqual(json_body, msgpack_body)
+        self.assertEqual(problem_cache.info().hits, 2)
+        self.assertEqual(problem_cache.info().invalidations, 0)
+
+    def test_that_negotiation_can_be_disabled(self):
+        original = handlers.ErrorWriter.alternate_serializers
+        handlers.ErrorWriter.alternate_serializers = {}
+        try:
+            response = self.send_query('application/problem+cbor', status=404)
+        finally:
+            handlers.ErrorWriter.alternate_serializers = original
+        self.assertEqual(response.headers['Content-Type'],
+                         'application/problem+json')
+        self.assertNotIn('Accept-Language', response.headers.get('Vary', ''))
+
+
+class NegotiationTests(unittest.TestCase):
+    def test_that_accept_headers_are_parsed(self):
+        self.assertEqual(
+            negotiation.parse_accept(
+                'text/html, Application/JSON;q=0.5;level=1, bad, */*;q=x'),
+            (negotiation.MediaRange('text', 'html', 1.0),
+             negotiation.MediaRange('application', 'json', 0.5),
+             negotiation.MediaRange('*', '*', 0.0)))
+
+    def test_that_most_specific_range_wins(self):
+        candidates = ('application/problem+json', 'application/problem+cbor')
+        self.assertEqual(
+            negotiation.select_media_type(
+                'application/*;q=0.5, application/problem+cbor;q=0.8',
+                candidates), 'application/problem+cbor')
+        self.assertEqual(
+            negotiation.select_media_type(
+                'application/*;q=0.9, application/problem+cbor;q=0.8',
+                candidates), 'application/problem+json')
+        self.assertIsNone(negotiation.select_media_type('text/*', candidates))
+
+    def test_that_parsing_is_cached(self):
+        header = 'application/problem+cbor;q=0.1'
+        self.assertIs(
+            negotiation.parse_accept(header), negotiation.parse_accept(header))
+
+    def test_that_languages_are_negotiated(self):
+        candidates = ('en', 'de', 'de-ch')
+        self.assertEqual(
+            negotiation.select_language('fr, de;q=0.5', candidates), 'de')
+        self.assertEqual(
+            negotiation.select_language('de-AT, en;q=0.8', candidates), 'de')
+        self.assertEqual(
+            negotiation.select_language('de-CH;q=0.9, de;q=0.5', candidates),
+            'de-ch')
+        self.assertEqual(negotiation.select_language('*', candidates), 'en')
+        self.assertIsNone(
+            negotiation.select_language('fr, en;q=0', candidates))
+
+
+class LocalizationTests(testing.AsyncHTTPTestCase):
+    def setUp(self):
+        super().setUp()
+        self.translations = localization.ProblemTranslations()
+        self.translations.load(
+            'de', {
+                'out-of-credit': {
+                    'title': 'Sie haben nicht genug Guthaben.',
+                    'detail': 'Ihr Guthaben beträgt {balance}.',
+                },
+            })
+        handlers.ErrorWriter.problem_translations = self.translations
+
+    def tearDown(self):
+        handlers.ErrorWriter.problem_translations = None
+        super().tearDown()
+
+    def get_app(self):
+        return Application()
+
+    def get_document(self, path, language=None):
+        headers = {}
+        if language is not None:
+            headers['Accept-Language'] = language
+        response = self.fetch(path, headers=headers)
+        return response, json.loads(response.body.decode('utf-8'))
+
+    def test_that_title_and_detail_are_translated(self):
+        response, body = self.get_document(
+            '/catalog/out-of-credit?balance=30&instance=/account/1',
+            'fr, de;q=0.8')
+        self.assertEqual(response.code, 403)
+        self.assertEqual(response.headers['Content-Language'], 'de')
+        self.assertIn('Accept-Language', response.headers['Vary'])
+        self.assertEqual(
+            body, {
+                'type': 'https://example.com/probs/out-of-credit',
+                'title': 'Sie haben nicht genug Guthaben.',
+                'status': 403,
+                'detail': 'Ihr Guthaben beträgt 30.',
+                'instance': '/account/1',
+                'balance': '30',
+            })
+
+    def test_that_default_locale_is_not_translated(self):
+        for language in (None, 'en', 'fr'):
+            response, body = self.get_document(
+                '/catalog/out-of-credit?detail=Balance+is+30', language)
+            self.assertNotIn('Content-Language', response.headers)
+            self.assertIn('Accept-Language', response.headers['Vary'])
+            self.assertEqual(body['title'], 'You do not have enough credit.')
+            self.assertEqual(body['detail'], 'Balance is 30')
+
+    def test_that_detail_falls_back_when_members_are_missing(self):
+        response, body = self.get_document(
+            '/catalog/out-of-credit?detail=Balance+is+30', 'de')
+        self.assertEqual(body['title'], 'Sie haben nicht genug Guthaben.')
+        self.assertEqual(body['detail'], 'Balance is 30')
+
+    def test_that_untranslated_types_do_not_vary(self):
+        response, body = self.get_document('/catalog/throttled', 'de')
+        self.assertEqual(body['title'], 'Slow down')
+        self.assertNotIn('Content-Language', response.headers)
+        self.assertNotIn('Accept-Language', response.headers.get('Vary', ''))
+
+    def test_that_built_documents_are_translated(self):
+        problem_type = problem_catalog['out-of-credit']
+        localized = self.translations.lookup(problem_type, 'de')
+        problem = problem_type(balance=5, title='Explicit')
+        document = problem.build_document()
+        localized.localize(problem, document)
+        self.assertEqual(document['title'], 'Explicit')
+        self.assertEqual(document['detail'], 'Ihr Guthaben beträgt 5.')
+
+    def test_that_compile_encodes_translations(self):
+        self.translations.add('fr', 'out-of-credit', title='Pas de crédit.')
+        self.translations.add('fr', 'missing', title='Absent')
+        self.assertEqual(self.translations.locales, ('en', 'de', 'fr'))
+        self.assertIn('missing', self.translations)
+        self.assertEqual(
+            self.translations.compile(problem_catalog,
+                                      [serializers.StdlibSerializer()]), 2)
+        problem_type = problem_catalog['out-of-credit']
+        localized = self.translations.lookup(problem_type, 'fr')
+        self.assertIs(localized, self.translations.lookup(problem_type, 'fr'))
+        self.assertEqual(localized.title, 'Pas de crédit.')
+        self.assertIsNone(localized.detail_template)
+        self.assertIsNone(self.translations.lookup(problem_type, 'es'))
+        self.assertEqual(self.translations.select_locale('fr-CA'), 'fr')
+        self.assertEqual(self.translations.select_locale(None), 'en')
+
+
+class BinarySerializerTests(unittest.TestCase):
+    @unittest.skipIf(serializers.cbor2 is None, 'cbor2 is not installed')
+    def test_cbor_default_hook(self):
+        serializer = serializers.CborSerializer()
+        serializer.register_default(lambda obj: 'converted')
+        self.assertEqual(
+            serializers.cbor2.loads(serializer.dumps({'value': object()})),
+            {'value': 'converted'})
+        self.assertNotEqual(serializer.fingerprint(),
+                            serializers.CborSerializer().fingerprint())
+
+    @unittest.skipIf(serializers.msgpack is None, 'msgpack is not installed')
+    def test_msgpack_default_hook(self):
+        serializer = serializers.MsgpackSerializer()
+        serializer.register_default(lambda obj: 'converted')
+        self.assertEqual(
+            serializers.msgpack.unpackb(serializer.dumps({'value': object()})),
+            {'value': 'converted'})
+
+    def test_that_binary_serializers_are_found(self):
+        available = serializers.find_binary_serializers()
+        self.assertEqual(serializers.cbor2 is not None,
+                         serializers.CBOR_MIME_TYPE in available)
+        self.assertEqual(serializers.msgpack is not None,
+                         serializers.MSGPACK_MIME_TYPE in available)
+
+
+class ProblemLogSamplerTests(testing.AsyncHTTPTestCase):
+    def setUp(self):
+        super(ProblemLogSamplerTests, self).setUp()
+        self.now = 0.0
+        self.sampler = problemdetails.ProblemLogSampler(
+            rate=2, interval=10.0, clock=lambda: self.now)
+        handlers.ErrorWriter.problem_log_sampler = self.sampler
+
+    def tearDown(self):
+        super(ProblemLogSamplerTests, self).tearDown()
+        handlers.ErrorWriter.problem_log_sampler = None
+
+    def get_app(self):
+        return Application()
+
+    def send_query(self, **query):
+        query.setdefault('raise_error', True)
+        return self.fetch('/?{0}'.format(urlencode(query)))
+
+    def test_that_messages_are_rate_limited(self):
+        with self.assertLogs('tornado.general', logging.WARNING) as context:
+            for _ in range(5):
+                self.send_query(status=429, log_message='throttled')
+            self.now = 11.0
+            self.send_query(status=429, log_message='throttled')
+        messages = [record.getMessage() for record in context.records]
+        self.assertEqual(len(messages), 4, messages)
+        self.assertEqual(
+            messages[0], '429 GET /?status=429&log_message='
+            'throttled&raise_error=True (127.0.0.1): throttled')
+        self.assertEqual(
+            messages[2], '429 -: suppressed 3 messages in the last 11 seconds')
+        self.assertTrue(messages[3].endswith(': throttled'))
+
+    def test_that_status_and_type_are_limited_separately(self):
+        with self.assertLogs('tornado.general', logging.WARNING) as context:
+            for _ in range(3):
+                self.send_query(status=429, log_message='throttled')
+                self.send_query(status=404, log_message='missing')
+                self.send_query(
+                    status=404, log_message='missing', type='/errors#other')
+        self.assertEqual(len(context.records), 6)
+
+    def test_that_unhandled_exceptions_are_always_logged(self):
+        with self.assertLogs('tornado.application', logging.ERROR):
+            self.send_query(raise_error='unhandled')
+
+
+class ProblemLogSamplerUnitTests(unittest.TestCase):
+    def setUp(self):
+        super(ProblemLogSamplerUnitTests, self).setUp()
+        self.now = 0.0
+        self.logger = mock.Mock(spec=logging.Logger)
+        self.sampler = problemdetails.ProblemLogSampler(
+            rate=1, interval=10.0, logger=self.logger, clock=lambda: self.now)
+        self.handler = mock.Mock()
+        self.handler._request_summary.return_value = 'GET /'
+
+    def test_that_formatting_is_deferred(self):
+        error = problemdetails.Problem(404, 'missing %s', 'thing')
+        self.sampler.log(self.handler, error)
+        self.sampler.log(self.handler, error)
+        self.logger.warning.assert_called_once()
+        self.handler._request_summary.assert_not_called()
+        fmt, *args = self.logger.warning.call_args[0]
+        self.assertNotIsInstance(args[2], str)
+        self.assertEqual(fmt % tuple(args), '404 GET /: missing thing')
+        self.handler._request_summary.assert_called_once_with()
+
+    def test_that_messages_are_formatted_without_get_message(self):
+        # Tornado before 6.5 does not implement HTTPError.get_message
+        error = mock.Mock(
+            spec=['status_code', 'log_message', 'args'],
+            status_code=404,
+            log_message='missing %s',
+            args=('thing', ))
+        self.sampler.log(self.handler, error)
+        fmt, *args = self.logger.warning.call_args[0]
+        self.assertEqual(fmt % tuple(args), '404 GET /: missing thing')
+
+    def test_that_errors_without_messages_are_ignored(self):
+        self.sampler.log(self.handler, problemdetails.Problem(404))
+        self.logger.warning.assert_not_called()
+
+    def test_that_flush_summarizes_expired_windows(self):
+        error = problemdetails.Problem(404, 'missing')
+        for _ in range(3):
+            self.sampler.log(self.handler, error)
+        self.sampler.flush()
+        self.assertEqual(self.logger.warning.call_count, 1)
+        self.now = 10.0
+        self.sampler.flush()
+        self.assertEqual(self.logger.warning.call_count, 2)
+        self.assertEqual(self.logger.warning.call_args[0][1:],
+                         (404, '-', 2, 10.0))
+
+    def test_that_catalog_type_is_used_for_sampling(self):
+        error = problem_catalog['out-of-credit']('broke')
+        self.assertEqual(
+            sampling.problem_key(error),
+            (403, 'https://example.com/probs/out-of-credit'))
+
+    def test_that_stop_logs_pending_summaries(self):
+        error = problemdetails.Problem(404, 'missing')
+        self.sampler.log(self.handler, error)
+        self.sampler.log(self.handler, error)
+        self.sampler.stop()
+        self.assertEqual(self.logger.warning.call_count, 2)
+
+
+class ProblemMetricsTests(testing.AsyncHTTPTestCase):
+    def setUp(self):
+        super(ProblemMetricsTests, self).setUp()
+        problem_metrics.reset()
+        problem_metrics.enabled = True
+        handlers.ErrorWriter.problem_metrics = problem_metrics
+
+    def tearDown(self):
+        super(ProblemMetricsTests, self).tearDown()
+        handlers.ErrorWriter.problem_metrics = None
+        problem_metrics.enabled = True
+
+    def get_app(self):
+        return Application()
+
+    def test_that_responses_are_counted(self):
+        self.fetch('/?status=404')
+        self.fetch('/?status=404')
+        self.fetch('/?status=600')
+        response = self.fetch('/catalog/out-of-credit')
+        self.assertEqual(
+            problem_metrics.responses, {
+                (404, handlers.type_link_map[404]): 2,
+                (600, None): 1,
+                (403, 'https://example.com/probs/out-of-credit'): 1,
+            })
+        self.assertEqual(problem_metrics.render_seconds.count, 4)
+        self.assertEqual(problem_metrics.body_bytes.count, 4)
+        self.assertGreaterEqual(problem_metrics.body_bytes.sum,
+                                len(response.body))
+
+    def test_that_metrics_can_be_disabled(self):
+        problem_metrics.enabled = False
+        self.fetch('/?status=404')
+        self.assertEqual(problem_metrics.responses, {})
+        self.assertEqual(problem_metrics.render_seconds.count, 0)
+
+    def test_that_metrics_are_exposed(self):
+        self.fetch('/?status=404&type=%22quoted%22')
+        self.fetch('/?status=600')
+        response = self.fetch('/metrics')
+        self.assertEqual(response.headers['Content-Type'],
+                         'text/plain; version=0.0.4; charset=utf-8')
+        lines = response.body.decode('utf-8').splitlines()
+        self.assertIn(
+            'problemdetails_responses_total{status="404",'
+            'type="\\"quoted\\""} 1', lines)
+        self.assertIn('problemdetails_responses_total{status="600",type=""} 1',
+                      lines)
+        self.assertIn('# TYPE problemdetails_render_seconds histogram', lines)
+        self.assertIn('problemdetails_render_seconds_count 2', lines)
+        self.assertIn('problemdetails_body_bytes_bucket{le="+Inf"} 2', lines)
+
+
+class HistogramTests(unittest.TestCase):
+    def test_that_buckets_are_cumulative(self):
+        histogram = problemdetails.metrics.Histogram([1, 10])
+        for value in (0.5, 1, 5, 50):
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative(), [('1.0', 2), ('10.0', 3),
+                                                  ('+Inf', 4)])
+        self.assertEqual(histogram.sum, 56.5)
+
+
+class PrometheusFormatTests(unittest.TestCase):
+    def test_that_samples_are_formatted(self):
+        self.assertEqual(
+            problemdetails.metrics.format_metrics(
+                'app', [('up', 'gauge', 'Is it up?', 1)]),
+            ['# HELP app_up Is it up?', '# TYPE app_up gauge', 'app_up 1'])
+
+    def test_that_responses_are_labelled_and_sorted(self):
+        self.assertEqual(
+            problemdetails.metrics.format_responses(
+                'app_total', 'Responses.', {
+                    (500, None): 1,
+                    (404, 'say "hi"'): 2
+                }), [
+                    '# HELP app_total Responses.',
+                    '# TYPE app_total counter',
+                    'app_total{status="404",type="say \\"hi\\""} 2',
+                    'app_total{status="500",type=""} 1',
+                ])
+
+
+class StreamingTests(testing.AsyncHTTPTestCase):
+    def setUp(self):
+        super(StreamingTests, self).setUp()
+        handlers.ErrorWriter.problem_stream_threshold = 100
+        handlers.ErrorWriter.problem_stream_chunk_size = 1024
+        LargeProblemHandler.flushes = 0
+
+    def tearDown(self):
+        super(StreamingTests, self).tearDown()
+        handlers.ErrorWriter.problem_stream_threshold = None
+        handlers.ErrorWriter.problem_stream_chunk_size = 64 * 1024
+        handlers.ErrorWriter.problem_metrics = None
+
+    def get_app(self):
+        return Application()
+
+    def test_that_large_documents_are_streamed(self):
+        response = self.fetch('/large?count=500')
+        self.assertEqual(response.code, 422)
+        self.assertEqual(response.headers['Content-Type'],
+                         'application/problem+json')
+        self.assertNotIn('Content-Length', response.headers)
+        body = json.loads(response.body.decode('utf-8'))
+        self.assertEqual(body['title'], 'Validation failed')
+        self.assertEqual(body['type'], handlers.type_link_map[422])
+        self.assertEqual(len(body['failure']), 500)
+        self.assertEqual(body['failure'][499], {
+            'index': 499,
+            'message': 'bad value'
+        })
+        self.assertEqual(body['other'], [0, 1, 2])
+        self.assertGreater(LargeProblemHandler.flushes,
+                           len(response.body) // 1024 - 1)
+
+    def test_that_nested_documents_are_streamed(self):
+        response = self.fetch('/large?count=0&text=20000')
+        self.assertEqual(response.code, 422)
+        self.assertNotIn('Content-Length', response.headers)
+        body = json.loads(response.body.decode('utf-8'))
+        self.assertEqual(body['failure'], {'summary': {'detail': 'x' * 20000}})
+
+    def test_that_small_documents_are_not_streamed(self):
+        response = self.fetch('/large?count=10')
+        self.assertEqual(response.code, 422)
+        self.assertEqual(
+            int(response.headers['Content-Length']), len(response.body))
+        self.assertEqual(LargeProblemHandler.flushes, 1)
+
+    def test_that_catalog_problems_are_streamed(self):
+        response = self.fetch('/large?count=500&catalog=out-of-credit')
+        self.assertEqual(response.code, 403)
+        self.assertNotIn('Content-Length', response.headers)
+        body = json.loads(response.body.decode('utf-8'))
+        self.assertEqual(body['title'], 'You do not have enough credit.')
+        self.assertEqual(len(body['failure']), 500)
+
+    def test_that_streamed_documents_are_measured(self):
+        problem_metrics.reset()
+        handlers.ErrorWriter.problem_metrics = problem_metrics
+        response = self.fetch('/large?count=500')
+        self.assertEqual(problem_metrics.body_bytes.sum, len(response.body))
+        self.assertEqual(problem_metrics.responses,
+                         {(422, handlers.type_link_map[422]): 1})
+
+    def test_that_prepare_can_stream_problems(self):
+        response = self.fetch('/prepared?count=500')
+        self.assertEqual(response.code, 422)
+        self.assertNotIn('Content-Length', response.headers)
+        body = json.loads(response.body.decode('utf-8'))
+        self.assertEqual(body['failure'], list(range(500)))
+
+    @testing.gen_test
+    async def test_that_disconnects_finish_the_request(self):
+        shedder = problemdetails.LoadShedder(max_lag=None)
+        PreparedProblemHandler.load_shedder = shedder
+        self.addCleanup(setattr, PreparedProblemHandler, 'load_shedder', None)
+        stream = await tcpclient.TCPClient().connect('127.0.0.1',
+                                                     self.get_http_port())
+        await stream.write(b'GET /prepared?count=1000000 HTTP/1.1\r\n'
+                           b'Host: localhost\r\n\r\n')
+        await stream.read_bytes(1024, partial=True)
+        self.assertEqual(shedder.in_flight, 1)
+        stream.close()
+        for _ in range(100):
+            if not shedder.in_flight:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(shedder.in_flight, 0)
+
+
+class IterDumpsTests(unittest.TestCase):
+    def test_that_output_is_equivalent(self):
+        document = {
+            'status': 400,
+            'empty': [],
+            'tuple': (1, 2),
+            'nested': [{
+                'a': [1, 2]
+            }, None],
+            'text': 'caf\u00e9',
+        }
+        for serializer in (serializers.StdlibSerializer(),
+                           handlers.ErrorWriter.serializer):
+            encoded = b''.join(serializers.iterdumps(document, serializer))
+            self.assertEqual(
+                json.loads(encoded.decode('utf-8')),
+                json.loads(json.dumps(document)))
+
+
+class ProblemBudgetTests(testing.AsyncHTTPTestCase):
+    def setUp(self):
+        super(ProblemBudgetTests, self).setUp()
+        handlers.ErrorWriter.problem_budget = problemdetails.ProblemBudget(
+            max_bytes=2048, max_elements=100)
+
+    def tearDown(self):
+        super(ProblemBudgetTests, self).tearDown()
+        handlers.ErrorWriter.problem_budget = None
+        handlers.ErrorWriter.problem_cache = None
+
+    def get_app(self):
+        return Application()
+
+    def test_that_large_lists_are_trimmed(self):
+        response = self.fetch('/large?count=500')
+        self.assertEqual(response.code, 422)
+        self.assertLessEqual(len(response.body), 2048 + 128)
+        body = json.loads(response.body.decode('utf-8'))
+        self.assertEqual(body['status'], 422)
+        self.assertEqual(body['title'], 'Validation failed')
+        kept = body['truncated']['failure']['kept']
+        self.assertEqual(body['truncated']['failure']['total'], 500)
+        self.assertEqual(len(body['failure']), kept)
+        self.assertEqual(body['failure'][0], {
+            'index': 0,
+            'message': 'bad value'
+        })
+
+    def test_that_small_documents_are_unchanged(self):
+        response = self.fetch('/large?count=2')
+        body = json.loads(response.body.decode('utf-8'))
+        self.assertEqual(len(body['failure']), 2)
+        self.assertEqual(body['other'], [0, 1, 2])
+        self.assertNotIn('truncated', body)
+
+    def test_that_catalog_problems_are_trimmed(self):
+        response = self.fetch('/large?count=500&catalog=out-of-credit')
+        self.assertEqual(response.code, 403)
+        body = json.loads(response.body.decode('utf-8'))
+        self.assertEqual(body['type'],
+                         'https://example.com/probs/out-of-credit')
+        self.assertEqual(body['truncated']['failure']['total'], 500)
+
+    def test_that_budget_changes_invalidate_cache(self):
+        handlers.ErrorWriter.problem_cache = problemdetails.ProblemCache()
+        response = self.fetch('/large?count=80')
+        self.assertIn(b'"truncated"', response.body)
+        handlers.ErrorWriter.problem_budget.max_bytes = None
+        response = self.fetch('/large?count=80')
+        self.assertNotIn(b'"truncated"', response.body)
+
+
+class ProblemBudgetUnitTests(unittest.TestCase):
+    def setUp(self):
+        super(ProblemBudgetUnitTests, self).setUp()
+        self.serializer = serializers.StdlibSerializer()
+
+    def encode(self, document, **kwargs):
+        budget = problemdetails.ProblemBudget(**kwargs)
+        encoded = budget.encode(document, self.serializer)
+        return encoded, json.loads(encoded.decode('utf-8'))
+
+    def test_that_unlimited_budget_matches_dumps(self):
+        document = {'status': 400, 'errors': [1, 2], 'detail': 'x'}
+        encoded, body = self.encode(document)
+        self.assertEqual(body, document)
+        self.assertEqual(list(body), list(document))
+
+    def test_that_element_budget_spans_members(self):
+        _, body = self.encode({
+            'status': 400,
+            'a': [1, 2, 3],
+            'b': (4, 5, 6)
+        },
+                              max_elements=4)
+        self.assertEqual(body['a'], [1, 2, 3])
+        self.assertEqual(body['b'], [4])
+        self.assertEqual(body['truncated'], {'b': {'kept': 1, 'total': 3}})
+
+    def test_that_long_strings_are_shortened(self):
+        _, body = self.encode({
+            'status': 400,
+            'detail': 'x' * 100
+        },
+                              max_string_length=10)
+        self.assertEqual(body['detail'], 'x' * 10)
+        self.assertEqual(body['truncated'],
+                         {'detail': {
+                             'kept': 10,
+                             'total': 100
+                         }})
+
+    def test_that_strings_are_shortened_to_fit_bytes(self):
+        encoded, body = self.encode({
+            'status': 400,
+            'detail': 'é' * 100
+        },
+                                    max_bytes=64)
+        self.assertEqual(body['truncated']['detail']['total'], 100)
+        self.assertLessEqual(
+            len(encoded) - len(b',"truncated":') - len(
+                self.serializer.dumps(body['truncated'])), 64)
+
+    def test_that_required_members_are_kept(self):
+        _, body = self.encode({
+            'type': 'https://example.com/' + 'a' * 100,
+            'status': 400,
+            'extra': {
+                'nested': True
+            }
+        },
+                              max_bytes=10)
+        self.assertEqual(body['status'], 400)
+        self.assertTrue(body['type'].endswith('a' * 100))
+        self.assertEqual(body['truncated'], {'extra': {'omitted': True}})
+
+    def test_that_nested_values_are_trimmed(self):
+        _, body = self.encode({
+            'status':
+            400,
+            'failure': [{
+                'index': 0,
+                'detail': 'x' * 100
+            }, {
+                'index': 1,
+                'tags': ['a', 'b', 'c']
+            }]
+        },
+                              max_elements=3,
+                              max_string_length=10)
+        self.assertEqual(body['failure'], [{
+            'index': 0,
+            'detail': 'x' * 10
+        }, {
+            'index': 1,
+            'tags': ['a']
+        }])
+        self.assertEqual(
+            body['truncated'], {
+                'failure/0/detail': {
+                    'kept': 10,
+                    'total': 100
+                },
+                'failure/1/tags': {
+                    'kept': 1,
+                    'total': 3
+                }
+            })
+
+    def test_that_encoding_stops_when_the_budget_is_exhausted(self):
+        failure = [{'index': n, 'detail': 'x' * 10000} for n in range(2000)]
+        serializer = mock.Mock(wraps=self.serializer)
+        budget = problemdetails.ProblemBudget(max_bytes=1000)
+        encoded = budget.encode({
+            'status': 400,
+            'failure': failure
+        }, serializer)
+        body = json.loads(encoded.decode('utf-8'))
+        self.assertEqual(body['truncated']['failure'], {
+            'kept': 1,
+            'total': 2000
+        })
+        self.assertEqual(body['truncated']['failure/0/detail']['total'], 10000)
+        self.assertLessEqual(
+            len(encoded) - len(b',"truncated":') - len(
+                self.serializer.dumps(body['truncated'])), 1000)
+        self.assertLess(
+            sum(
+                len(self.serializer.dumps(call.args[0]))
+                for call in serializer.dumps.call_args_list), 50000)
+
+    def test_that_path_keys_are_escaped(self):
+        _, body = self.encode({
+            'status': 400,
+            'a': {
+                'b/c~d': 'x' * 20
+            }
+        },
+                              max_string_length=5)
+        self.assertEqual(body['truncated'],
+                         {'a/b~1c~0d': {
+                             'kept': 5,
+                             'total': 20
+                         }})
+
+    @unittest.skipIf(serializers.msgpack is None, 'msgpack is not installed')
+    def test_that_binary_serializers_are_trimmed(self):
+        serializer = serializers.MsgpackSerializer()
+        budget = problemdetails.ProblemBudget(max_elements=2)
+        encoded = budget.encode({'status': 400, 'a': [1, 2, 3]}, serializer)
+        body = serializers.msgpack.unpackb(encoded)
+        self.assertEqual(body['a'], [1, 2])
+        self.assertEqual(body['truncated'], {'a': {'kept': 2, 'total': 3}})
+
+
+class TracebackReleaseTests(testing.AsyncHTTPTestCase):
+    def setUp(self):
+        super(TracebackReleaseTests, self).setUp()
+        RetainingHandler.problems.clear()
+        RetainingHandler.payloads.clear()
+
+    def tearDown(self):
+        super(TracebackReleaseTests, self).tearDown()
+        handlers.ErrorWriter.release_problem_tracebacks = None
+        handlers.ErrorWriter.capture_problem_stacks = False
+
+    def get_app(self):
+        return Application(**self.get_settings())
+
+    def get_settings(self):
+        return {}
+
+    def test_that_tracebacks_are_released(self):
+        response = self.fetch('/retained')
+        self.assertEqual(response.code, 400)
+        problem = RetainingHandler.problems[0]
+        self.assertIsNone(problem.__traceback__)
+        self.assertIsNone(problem.__context__.__traceback__)
+        self.assertIsNone(problem.stack)
+        self.assertIsNone(RetainingHandler.payloads[0]())
+
+    def test_that_stacks_are_captured(self):
+        handlers.ErrorWriter.capture_problem_stacks = True
+        self.fetch('/retained')
+        problem = RetainingHandler.problems[0]
+        self.assertIsNone(problem.__traceback__)
+        self.assertEqual(problem.stack[-1].name, 'get')
+        self.assertIsNone(RetainingHandler.payloads[0]())
+
+    def test_that_problems_can_keep_tracebacks(self):
+        self.fetch('/retained?keep=1')
+        problem = RetainingHandler.problems[0]
+        self.assertIsNotNone(problem.__traceback__)
+        self.assertIsNotNone(RetainingHandler.payloads[0]())
+
+    def test_that_release_can_be_disabled(self):
+        handlers.ErrorWriter.release_problem_tracebacks = False
+        self.fetch('/retained')
+        self.assertIsNotNone(RetainingHandler.problems[0].__traceback__)
+
+    @testing.gen_test
+    async def test_that_suspended_coroutines_survive_release(self):
+        captured, resume = [], asyncio.Event()
+
+        async def background():
+            try:
+                raise KeyError('missing')
+            except KeyError as error:
+                captured.append(error)
+                await resume.wait()
+            return 'finished'
+
+        task = asyncio.ensure_future(background())
+        while not captured:
+            await asyncio.sleep(0)
+        try:
+            raise problemdetails.Problem(400) from captured[0]
+        except problemdetails.Problem as problem:
+            problem.release_traceback()
+        self.assertIsNone(captured[0].__traceback__)
+        resume.set()
+        self.assertEqual(await task, 'finished')
+
+
+class DebugTracebackReleaseTests(TracebackReleaseTests):
+    def get_settings(self):
+        return {'serve_traceback': True}
+
+    def test_that_tracebacks_are_released(self):
+        self.fetch('/retained')
+        self.assertIsNotNone(RetainingHandler.problems[0].__traceback__)
+
+    def test_that_release_can_be_forced(self):
+        handlers.ErrorWriter.release_problem_tracebacks = True
+        self.fetch('/retained')
+        self.assertIsNone(RetainingHandler.problems[0].__traceback__)
+
+    test_that_stacks_are_captured = None
+
+
+class SendProblemTests(testing.AsyncHTTPTestCase):
+    def get_app(self):
+        return Application()
+
+    def assert_same_response(self, sent, raised):
+        self.assertEqual(sent.code, raised.code)
+        self.assertEqual(sent.reason, raised.reason)
+        self.assertEqual(sent.headers['Content-Type'],
+                         raised.headers['Content-Type'])
+        self.assertEqual(sent.body, raised.body)
+
+    def test_that_output_matches_raised_problem(self):
+        with mock.patch.object(SendingHandler,
+                               '_handle_request_exception') as handle:
+            sent = self.fetch('/send/409')
+            handle.assert_not_called()
+        raised = self.fetch('/?' + urlencode({
+            'raise_error': '',
+            'status': '409',
+            'detail': 'sent',
+            'extra': '[1, 2]'
+        }))
+        self.assertEqual(sent.code, 409)
+        self.assertEqual(sent.reason, 'Sent')
+        self.assertEqual(sent.body, raised.body)
+
+    def test_that_catalog_output_matches_raised_problem(self):
+        for name in ('out-of-credit', 'throttled'):
+            self.assert_same_response(
+                self.fetch('/send/' + name),
+                self.fetch('/catalog/' + name + '?detail=sent'))
+
+    def test_that_async_methods_are_supported(self):
+        response = self.fetch('/send/404', method='POST', body=b'')
+        self.assertEqual(response.code, 404)
+        self.assertEqual(
+            json.loads(response.body.decode('utf-8')), {
+                'type': handlers.type_link_map[404],
+                'status': 404,
+                'detail': 'sent'
+            })
+
+    def test_that_log_message_is_logged(self):
+        with self.assertLogs('tornado.general', 'WARNING') as context:
+            self.fetch('/send/409')
+        self.assertIn('sent 409', context.output[0])
+
+
+class CompressionTests(testing.AsyncHTTPTestCase):
+    def setUp(self):
+        super(CompressionTests, self).setUp()
+        self.compressor = problemdetails.ProblemCompressor(min_size=256)
+        handlers.ErrorWriter.problem_compressor = self.compressor
+
+    def tearDown(self):
+        super(CompressionTests, self).tearDown()
+        handlers.ErrorWriter.problem_compressor = None
+
+    def get_app(self):
+        return Application()
+
+    def fetch_large(self, count, accept_encoding='gzip', catalog=None):
+        headers = {}
+        if accept_encoding is not None:
+            headers['Accept-Encoding'] = accept_encoding
+        url = f'/large?count={count}'
+        if catalog is not None:
+            url += f'&catalog={catalog}'
+        return self.fetch(url, headers=headers, decompress_response=False)
+
+    def test_that_large_bodies_are_compressed(self):
+        response = self.fetch_large(50)
+        self.assertEqual(response.code, 422)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        body = json.loads(gzip.decompress(response.body).decode('utf-8'))
+        self.assertEqual(len(body['failure']), 50)
+
+    def test_that_small_bodies_are_not_compressed(self):
+        response = self.fetch_large(1)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertNotIn('Accept-Encoding', response.headers.get('Vary', ''))
+        json.loads(response.body.decode('utf-8'))
+
+    def test_that_identity_is_used_when_not_acceptable(self):
+        for accept_encoding in (None, 'identity', 'gzip;q=0', 'deflate'):
+            response = self.fetch_large(50, accept_encoding)
+            self.assertNotIn('Content-Encoding', response.headers)
+            self.assertIn('Accept-Encoding', response.headers['Vary'])
+            json.loads(response.body.decode('utf-8'))
+
+    def test_that_compressed_bodies_are_reused(self):
+        first = self.fetch_large(50, catalog='out-of-credit')
+        second = self.fetch_large(50, catalog='out-of-credit')
+        self.assertEqual(first.body, second.body)
+        self.assertEqual(self.compressor.misses, 1)
+        self.assertEqual(self.compressor.hits, 1)
+
+    def test_that_cached_problem_bodies_are_reused(self):
+        handlers.ErrorWriter.problem_cache = problemdetails.ProblemCache()
+        self.addCleanup(setattr, handlers.ErrorWriter, 'problem_cache', None)
+        self.fetch_large(50)
+        self.fetch_large(50)
+        self.assertEqual(self.compressor.hits, 1)
+
+    def test_that_uncached_bodies_are_not_stored(self):
+        self.fetch_large(50)
+        self.fetch_large(50)
+        self.assertEqual(self.compressor.misses, 2)
+        self.assertEqual(len(self.compressor), 0)
+
+    @unittest.skipIf(compression.brotli is None, 'brotli is not installed')
+    def test_that_brotli_is_preferred(self):
+        response = self.fetch_large(50, 'gzip, br')
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        json.loads(compression.brotli.decompress(response.body))
+
+
+class ProblemCompressorTests(unittest.TestCase):
+    def test_that_cache_is_bounded(self):
+        compressor = problemdetails.ProblemCompressor(maxsize=2)
+        for body in (b'one', b'two', b'three', b'one'):
+            compressor.compress(body, 'gzip')
+        self.assertEqual(len(compressor), 2)
+        self.assertEqual(compressor.misses, 4)
+        compressor.clear()
+        self.assertEqual(len(compressor), 0)
+
+    def test_that_caching_can_be_disabled(self):
+        compressor = problemdetails.ProblemCompressor(maxsize=0)
+        compressor.compress(b'body', 'gzip')
+        self.assertEqual(len(compressor), 0)
+        compressor = problemdetails.ProblemCompressor()
+        compressor.compress(b'body', 'gzip', cache=False)
+        self.assertEqual(len(compressor), 0)
+
+    def test_that_cache_is_bounded_by_size(self):
+        compressor = problemdetails.ProblemCompressor(max_bytes=200)
+        for body in (b'a' * 50, b'b' * 50, b'c' * 50):
+            compressor.compress(body, 'gzip')
+        self.assertEqual(len(compressor), 2)
+        self.assertLessEqual(compressor.size, 200)
+        compressor.compress(b'd' * 500, 'gzip')
+        self.assertEqual(len(compressor), 2)
+        compressor.clear()
+        self.assertEqual(compressor.size, 0)
+
+    def test_that_gzip_output_is_deterministic(self):
+        compressor = problemdetails.ProblemCompressor(maxsize=0)
+        self.assertEqual(
+            compressor.compress(b'body', 'gzip'),
+            compressor.compress(b'body', 'gzip'))
+
+    def test_content_coding_selection(self):
+        select = negotiation.select_content_coding
+        self.assertEqual(select('gzip, br', ('br', 'gzip')), 'br')
+        self.assertEqual(select('gzip, br;q=0.5', ('br', 'gzip')), 'gzip')
+        self.assertEqual(select('*', ('br', 'gzip')), 'br')
+        self.assertEqual(select('*;q=0.1, gzip', ('br', 'gzip')), 'gzip')
+        self.assertIsNone(select('identity', ('br', 'gzip')))
+        self.assertIsNone(select('GZIP;q=0', ('gzip', )))
+
+
+class CachingTests(testing.AsyncHTTPTestCase):
+    def tearDown(self):
+        super(CachingTests, self).tearDown()
+        handlers.ErrorWriter.problem_cache_control = {}
+        handlers.ErrorWriter.problem_compressor = None
+
+    def get_app(self):
+        return Application()
+
+    def test_that_catalog_policy_sets_validators(self):
+        response = self.fetch('/catalog/cached-missing')
+        self.assertEqual(response.code, 404)
+        self.assertEqual(response.headers['Cache-Control'],
+                         'public, max-age=300')
+        etag = response.headers['Etag']
+        digest = hashlib.sha1(response.body).hexdigest()
+        self.assertEqual(etag, '"{0}"'.format(digest))
+        self.assertEqual(
+            self.fetch('/catalog/cached-missing').headers['Etag'], etag)
+
+    def test_that_matching_etag_returns_not_modified(self):
+        etag = self.fetch('/catalog/cached-missing').headers['Etag']
+        response = self.fetch(
+            '/catalog/cached-missing', headers={'If-None-Match': etag})
+        self.assertEqual(response.code, 304)
+        self.assertEqual(response.body, b'')
+        self.assertEqual(response.headers['Etag'], etag)
+        self.assertEqual(response.headers['Cache-Control'],
+                         'public, max-age=300')
+
+    def test_that_different_documents_have_different_etags(self):
+        first = self.fetch('/catalog/cached-missing?detail=one')
+        second = self.fetch(
+            '/catalog/cached-missing?detail=two',
+            headers={'If-None-Match': first.headers['Etag']})
+        self.assertEqual(second.code, 404)
+        self.assertNotEqual(first.headers['Etag'], second.headers['Etag'])
+
+    def test_that_status_policies_apply_to_send_error(self):
+        handlers.ErrorWriter.problem_cache_control = {404: 'max-age=60'}
+        response = self.fetch('/?status=404')
+        self.assertEqual(response.headers['Cache-Control'], 'max-age=60')
+        self.assertIn('Etag', response.headers)
+        response = self.fetch('/?status=400')
+        self.assertNotIn('Cache-Control', response.headers)
+        self.assertNotIn('Etag', response.headers)
+
+    def test_that_uncached_problems_have_no_validators(self):
+        response = self.fetch('/catalog/throttled')
+        self.assertNotIn('Cache-Control', response.headers)
+        self.assertNotIn('Etag', response.headers)
+
+    def test_that_only_safe_methods_are_cached(self):
+        handlers.ErrorWriter.problem_cache_control = {405: 'max-age=60'}
+        response = self.fetch('/', method='POST', body=b'')
+        self.assertEqual(response.code, 405)
+        self.assertNotIn('Cache-Control', response.headers)
+
+    def test_that_compressed_variants_have_distinct_etags(self):
+        handlers.ErrorWriter.problem_compressor = (
+            problemdetails.ProblemCompressor(min_size=0))
+        plain = self.fetch(
+            '/catalog/cached-missing', decompress_response=False)
+        compressed = self.fetch(
+            '/catalog/cached-missing',
+            headers={'Accept-Encoding': 'gzip'},
+            decompress_response=False)
+        self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed.headers['Vary'])
+        self.assertNotEqual(plain.headers['Etag'], compressed.headers['Etag'])
+
+
+class LoadSheddingTests(testing.AsyncHTTPTestCase):
+    def setUp(self):
+        super(LoadSheddingTests, self).setUp()
+        self.shedder = problemdetails.LoadShedder(
+            max_lag=0.5, max_in_flight=1, retry_after=5)
+        SheddingHandler.load_shedder = self.shedder
+        SheddingHandler.release = asyncio.Event()
+
+    def tearDown(self):
+        self.shedder.stop()
+        super(LoadSheddingTests, self).tearDown()
+        SheddingHandler.load_shedder = None
+
+    def get_app(self):
+        return Application()
+
+    def assert_shed(self, response):
+        self.assertEqual(response.code, 503)
+        self.assertEqual(response.headers['Retry-After'], '5')
+        self.assertEqual(response.headers['Content-Type'],
+                         'application/problem+json')
+        self.assertEqual(
+            json.loads(response.body.decode('utf-8')), {
+                'type': handlers.type_link_map[503],
+                'title': 'Service overloaded',
+                'status': 503,
+            })
+
+    def test_that_requests_are_admitted(self):
+        response = self.fetch('/shed')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(self.shedder.state(),
+                         shedding.SheddingState(False, 0.0, 0, 0))
+
+    @testing.gen_test
+    async def test_that_in_flight_requests_are_limited(self):
+        client = self.http_client
+        pending = client.fetch(self.get_url('/shed?wait=1'))
+        while self.shedder.in_flight == 0:
+            await asyncio.sleep(0.001)
+        self.assertTrue(self.shedder.shedding)
+
+        response = await client.fetch(self.get_url('/shed'), raise_error=False)
+        self.assert_shed(response)
+        self.assertEqual(self.shedder.shed, 1)
+
+        SheddingHandler.release.set()
+        response = await pending
+        self.assertEqual(response.code, 200)
+        self.assertEqual(self.shedder.in_flight, 0)
+        self.assertFalse(self.shedder.shedding)
+
+    def test_that_lag_sheds_requests(self):
+        self.shedder.lag = 0.75
+        self.assert_shed(self.fetch('/shed'))
+        self.assertEqual(self.shedder.in_flight, 0)
+
+    def test_that_rejections_are_counted_in_metrics(self):
+        problem_metrics.reset()
+        handlers.ErrorWriter.problem_metrics = problem_metrics
+        try:
+            self.shedder.lag = 0.75
+            response = self.fetch('/shed')
+        finally:
+            handlers.ErrorWriter.problem_metrics = None
+        self.assertEqual(problem_metrics.responses,
+                         {(503, handlers.type_link_map[503]): 1})
+        self.assertEqual(problem_metrics.body_bytes.sum, len(response.body))
+
+    @testing.gen_test
+    async def test_that_lag_is_measured(self):
+        self.shedder.interval = 0.01
+        self.shedder.start()
+        self.io_loop.add_callback(time.sleep, 0.05)
+        await asyncio.sleep(0.1)
+        self.assertGreater(self.shedder.lag, 0.0)
+        self.shedder.stop()
+        self.assertEqual(self.shedder.lag, 0.0)
+
+    def test_that_state_is_exposed_as_metrics(self):
+        self._app.add_handlers('.*$', [
+            web.url('/shed-metrics', problemdetails.MetricsHandler,
+                    {'metrics': self.shedder})
+        ])
+        self.shedder.lag = 0.75
+        self.fetch('/shed')
+        response = self.fetch('/shed-metrics')
+        self.assertEqual(response.code, 200)
+        text = response.body.decode('utf-8')
+        self.assertIn('problemdetails_shedding 1\n', text)
+        self.assertIn('problemdetails_ioloop_lag_seconds 0.75\n', text)
+        self.assertIn('problemdetails_shed_requests_total 1\n', text)
+
+
+class RecordingSerializer(serializers.StdlibSerializer):
+    def __init__(self):
+        super(RecordingSerializer, self).__init__()
+        self.threads = []
+
+    def dumps(self, document):
+        self.threads.append(threading.get_ident())
+        return super(RecordingSerializer, self).dumps(document)
+
+
+class ExecutorRenderingTests(testing.AsyncHTTPTestCase):
+    def setUp(self):
+        super(ExecutorRenderingTests, self).setUp()
+        self.executor = concurrent.futures.ThreadPoolExecutor(1)
+        self.serializer = RecordingSerializer()
+        self.original_serializer = handlers.ErrorWriter.serializer
+        handlers.ErrorWriter.serializer = self.serializer
+        handlers.ErrorWriter.problem_executor = self.executor
+        handlers.ErrorWriter.problem_executor_threshold = 100
+
+    def tearDown(self):
+        super(ExecutorRenderingTests, self).tearDown()
+        self.executor.shutdown()
+        handlers.ErrorWriter.serializer = self.original_serializer
+        handlers.ErrorWriter.problem_executor = None
+        handlers.ErrorWriter.problem_executor_threshold = 1000
+        handlers.ErrorWriter.problem_cache_control = {}
+
+    def get_app(self):
+        return Application()
+
+    def test_that_large_documents_are_rendered_off_loop(self):
+        response = self.fetch('/large?count=500')
+        self.assertEqual(response.code, 422)
+        self.assertEqual(response.headers['Content-Type'],
+                         'application/problem+json')
+        self.assertNotIn(threading.get_ident(), self.serializer.threads)
+        body = json.loads(response.body.decode('utf-8'))
+        self.assertEqual(len(body['failure']), 500)
+
+        handlers.ErrorWriter.problem_executor = None
+        self.assertEqual(self.fetch('/large?count=500').body, response.body)
+
+    def test_that_nested_strings_are_rendered_off_loop(self):
+        response = self.fetch('/large?count=0&text=20000')
+        self.assertEqual(response.code, 422)
+        self.assertNotIn(threading.get_ident(), self.serializer.threads)
+        body = json.loads(response.body.decode('utf-8'))
+        self.assertEqual(body['failure'], {'summary': {'detail': 'x' * 20000}})
+
+    def test_that_small_documents_are_rendered_inline(self):
+        response = self.fetch('/large?count=10')
+        self.assertEqual(response.code, 422)
+        self.assertEqual(self.serializer.threads, [threading.get_ident()])
+
+    def test_that_catalog_problems_are_rendered_off_loop(self):
+        response = self.fetch('/large?count=500&catalog=out-of-credit')
+        self.assertEqual(response.code, 403)
+        self.assertNotIn(threading.get_ident(), self.serializer.threads)
+        body = json.loads(response.body.decode('utf-8'))
+        self.assertEqual(body['type'],
+                         'https://example.com/probs/out-of-credit')
+
+    def test_that_cache_policies_apply(self):
+        handlers.ErrorWriter.problem_cache_control = {422: 'max-age=5'}
+        response = self.fetch('/large?count=500')
+        self.assertEqual(response.headers['Cache-Control'], 'max-age=5')
+        response = self.fetch(
+            '/large?count=500',
+            headers={'If-None-Match': response.headers['Etag']})
+        self.assertEqual(response.code, 304)
+
+    def test_that_encoding_failures_finish_the_response(self):
+        with mock.patch.object(
+                self.serializer, 'dumps', side_effect=TypeError('boom')):
+            with self.assertLogs('tornado.application', 'ERROR'):
+                response = self.fetch('/large?count=500')
+        self.assertEqual(response.code, 500)
+        self.assertEqual(response.body, b'')
+        self.assertNotEqual(
+            response.headers.get('Content-Type'), 'application/problem+json')
+
+    def test_that_prepare_can_defer_problems(self):
+        response = self.fetch('/prepared?count=500')
+        self.assertEqual(response.code, 422)
+        self.assertNotIn(threading.get_ident(), self.serializer.threads)
+        body = json.loads(response.body.decode('utf-8'))
+        self.assertEqual(body['failure'], list(range(500)))
+
+
+class UpstreamHandler(web.RequestHandler):
+    calls = collections.Counter()
+    release = None
+
+    async def get(self, name):
+        UpstreamHandler.calls[name] += 1
+        if name == 'slow':
+            await UpstreamHandler.release.wait()
+            name = 'cached'
+        if name in ('cached', 'no-store', 'retry'):
+            self.set_status(503 if name == 'retry' else 404)
+            self.set_header('Content-Type', 'application/problem+json')
+            if name == 'retry':
+                self.set_header('Retry-After', '30')
+            else:
+                self.set_header(
+                    'Cache-Control',
+                    'no-store' if name == 'no-store' else 'max-age=60')
+            self.write(json.dumps({'status': self.get_status(), 'n': 1}))
+        elif name == 'problem':
+            self.set_status(404)
+            self.set_header('Content-Type', 'application/problem+json')
+            self.write(
+                json.dumps({
+                    'type': 'https://example.com/probs/missing',
+                    'title': 'Missing',
+                    'status': 404,
+                    'detail': 'gone',
+                    'item': 'x',
+                }))
+        elif name == 'ok':
+            self.write('ok')
+        else:
+            self.set_status(int(name))
+            self.write('failed')
+
+    post = get
+
+
+class ProxyHandler(problemdetails.ErrorWriter, web.RequestHandler):
+    problem_client = None
+
+    async def get(self):
+        response = await self.problem_client.fetch(
+            self.get_query_argument('url'))
+        self.write(response.body)
+
+
+class ProblemClientTests(testing.AsyncHTTPTestCase):
+    def setUp(self):
+        super(ProblemClientTests, self).setUp()
+        self.now = 1000.0
+        self.problem_client = problemdetails.ProblemClient(
+            failure_threshold=2, reset_timeout=10, clock=lambda: self.now)
+        ProxyHandler.problem_client = self.problem_client
+        sock, port = testing.bind_unused_port()
+        sock.close()
+        self.dead_url = f'http://127.0.0.1:{port}/'
+
+    def get_app(self):
+        return web.Application([
+            web.url('/upstream/(?P<name>.*)', UpstreamHandler),
+            web.url('/proxy', ProxyHandler),
+        ])
+
+    def proxy(self, url):
+        response = self.fetch('/proxy?' + urlencode({'url': url}))
+        body = None
+        if response.headers.get('Content-Type') == 'application/problem+json':
+            body = json.loads(response.body.decode('utf-8'))
+        return response, body
+
+    def test_that_successful_responses_are_returned(self):
+        response, _ = self.proxy(self.get_url('/upstream/ok'))
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, b'ok')
+
+    def test_that_upstream_problems_are_propagated(self):
+        response, body = self.proxy(self.get_url('/upstream/problem'))
+        self.assertEqual(response.code, 404)
+        self.assertEqual(
+            body, {
+                'type': 'https://example.com/probs/missing',
+                'title': 'Missing',
+                'status': 404,
+                'detail': 'gone',
+                'item': 'x',
+            })
+
+    def test_that_other_errors_are_propagated(self):
+        response, body = self.proxy(self.get_url('/upstream/409'))
+        self.assertEqual(response.code, 409)
+        self.assertEqual(body, {
+            'type': handlers.type_link_map[409],
+            'status': 409
+        })
+
+    def test_that_upstream_problems_can_be_wrapped(self):
+        self.problem_client.propagate = False
+        with self.assertLogs('tornado.general', 'WARNING') as context:
+            response, body = self.proxy(self.get_url('/upstream/problem'))
+        self.assertIn('/upstream/problem returned 404', context.output[0])
+        self.assertEqual(response.code, 502)
+        self.assertEqual(body['title'], 'Bad Gateway')
+        self.assertEqual(body['upstream']['status'], 404)
+        self.assertEqual(body['upstream']['problem']['item'], 'x')
+
+    def test_that_connection_failures_are_bad_gateways(self):
+        response, body = self.proxy(self.dead_url)
+        self.assertEqual(response.code, 502)
+        self.assertEqual(
+            body, {
+                'type': handlers.type_link_map[502],
+                'title': 'Bad Gateway',
+                'status': 502,
+            })
+
+    def test_that_circuit_opens_after_failures(self):
+        self.assertEqual(self.proxy(self.dead_url)[0].code, 502)
+        self.assertEqual(self.proxy(self.dead_url)[0].code, 502)
+        breaker = self.problem_client.breaker(self.dead_url)
+        self.assertEqual(breaker.state, client.CircuitBreaker.OPEN)
+        response, body = self.proxy(self.dead_url + 'other')
+        self.assertEqual(breaker.failures, 2)
+        self.assertEqual(response.code, 503)
+        self.assertEqual(body['title'], 'Upstream Unavailable')
+
+        # other upstreams are not affected
+        self.assertEqual(self.proxy(self.get_url('/upstream/ok'))[0].code, 200)
+
+    def test_that_circuit_closes_after_successful_trial(self):
+        url = self.get_url('/upstream/503')
+        self.proxy(url)
+        self.proxy(url)
+        self.assertEqual(self.proxy(url)[0].code, 503)
+        breaker = self.problem_client.breaker(url)
+        self.assertEqual(breaker.state, client.CircuitBreaker.OPEN)
+
+        self.now += 10
+        self.assertEqual(breaker.state, client.CircuitBreaker.HALF_OPEN)
+        self.assertEqual(self.proxy(self.get_url('/upstream/ok'))[0].code, 200)
+        self.assertEqual(breaker.state, client.CircuitBreaker.CLOSED)
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def setUp(self):
+        super(CircuitBreakerTests, self).setUp()
+        self.now = 0.0
+        self.breaker = client.CircuitBreaker(
+            failure_threshold=2, reset_timeout=5, clock=lambda: self.now)
+
+    def test_that_successes_reset_failure_count(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+
+    def test_that_only_one_trial_is_allowed(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.allow())
+        self.now = 5.0
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+
+    def test_that_failed_trial_reopens_circuit(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now = 5.0
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, client.CircuitBreaker.OPEN)
+        self.now = 9.0
+        self.assertFalse(self.breaker.allow())
+        self.now = 10.0
+        self.assertTrue(self.breaker.allow())
+
+
+class CircuitBreakerTrialTests(testing.AsyncTestCase):
+    def setUp(self):
+        super(CircuitBreakerTrialTests, self).setUp()
+        self.now = 0.0
+        self.http_client = mock.Mock()
+        self.problem_client = problemdetails.ProblemClient(
+            self.http_client,
+            failure_threshold=1,
+            reset_timeout=5,
+            clock=lambda: self.now)
+        self.url = 'http://upstream.example.com/'
+        self.breaker = self.problem_client.breaker(self.url)
+        self.breaker.record_failure()
+        self.now = 5.0
+
+    @testing.gen_test
+    async def test_that_cancelled_trials_reopen_circuit(self):
+        blocked = asyncio.Event()
+        self.http_client.fetch.side_effect = (
+            lambda request, raise_error: blocked.wait())
+        pending = asyncio.ensure_future(self.problem_client.fetch(self.url))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(self.breaker.state, client.CircuitBreaker.OPEN)
+        self.now = 10.0
+        self.assertTrue(self.breaker.allow())
+
+    @testing.gen_test
+    async def test_that_unexpected_errors_reopen_circuit(self):
+        self.http_client.fetch.side_effect = RuntimeError('boom')
+        with self.assertRaises(RuntimeError):
+            await self.problem_client.fetch(self.url)
+        self.now = 10.0
+        self.assertTrue(self.breaker.allow())
+
+
+class UpstreamProblemCacheTests(testing.AsyncHTTPTestCase):
+    def setUp(self):
+        super(UpstreamProblemCacheTests, self).setUp()
+        self.now = 1000.0
+        self.cache = client.UpstreamProblemCache(
+            maxsize=2, clock=lambda: self.now)
+        self.problem_client = problemdetails.ProblemClient(
+            problem_cache=self.cache)
+        UpstreamHandler.calls.clear()
+        UpstreamHandler.release = asyncio.Event()
+
+    def get_app(self):
+        return web.Application([
+            web.url('/upstream/(?P<name>.*)', UpstreamHandler),
+        ])
+
+    async def fetch_problem(self, name, **kwargs):
+        with self.assertRaises(problemdetails.Problem) as context:
+            await self.problem_client.fetch(
+                self.get_url('/upstream/' + name), **kwargs)
+        return context.exception
+
+    @testing.gen_test
+    async def test_that_problems_are_cached(self):
+        first = await self.fetch_problem('cached')
+        second = await self.fetch_problem('cached')
+        self.assertEqual(UpstreamHandler.calls['cached'], 1)
+        self.assertIsNot(first, second)
+        self.assertEqual(second.status_code, 404)
+        self.assertEqual(second.extensions, {'n': 1})
+        self.assertEqual(first.build_document(), second.build_document())
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    @testing.gen_test
+    async def test_that_entries_expire(self):
+        await self.fetch_problem('cached')
+        self.now += 60
+        await self.fetch_problem('cached')
+        self.assertEqual(UpstreamHandler.calls['cached'], 2)
+
+    @testing.gen_test
+    async def test_that_retry_after_is_honored(self):
+        await self.fetch_problem('retry')
+        self.now += 29
+        problem = await self.fetch_problem('retry')
+        self.assertEqual(problem.status_code, 503)
+        self.assertEqual(UpstreamHandler.calls['retry'], 1)
+        self.now += 1
+        await self.fetch_problem('retry')
+        self.assertEqual(UpstreamHandler.calls['retry'], 2)
+
+    @testing.gen_test
+    async def test_that_uncacheable_responses_are_not_cached(self):
+        for _ in range(2):
+            await self.fetch_problem('no-store')
+            await self.fetch_problem('problem')
+            await self.fetch_problem('cached', method='POST', body=b'')
+        self.assertEqual(UpstreamHandler.calls['no-store'], 2)
+        self.assertEqual(UpstreamHandler.calls['problem'], 2)
+        self.assertEqual(UpstreamHandler.calls['cached'], 2)
+        self.assertEqual(len(self.cache), 0)
+
+    @testing.gen_test
+    async def test_that_cached_problems_are_wrapped(self):
+        self.problem_client.propagate = False
+        await self.fetch_problem('cached')
+        problem = await self.fetch_problem('cached')
+        self.assertEqual(problem.status_code, 502)
+        self.assertEqual(problem.extensions['upstream'], {
+            'status': 404,
+            'problem': {
+                'status': 404,
+                'n': 1
+            }
+        })
+        self.assertEqual(UpstreamHandler.calls['cached'], 1)
+
+    @testing.gen_test
+    async def test_that_concurrent_requests_are_coalesced(self):
+        pending = [
+            asyncio.ensure_future(self.fetch_problem('slow')) for _ in range(3)
+        ]
+        while not UpstreamHandler.calls['slow']:
+            await asyncio.sleep(0.001)
+        self.assertEqual(len(self.cache.in_flight), 1)
+        UpstreamHandler.release.set()
+        problems = await asyncio.gather(*pending)
+        self.assertEqual(UpstreamHandler.calls['slow'], 1)
+        self.assertEqual([p.status_code for p in problems], [404] * 3)
+        self.assertEqual(len({id(p) for p in problems}), 3)
+        self.assertEqual(self.cache.in_flight, {})
+
+    @testing.gen_test
+    async def test_that_credentials_are_part_of_the_key(self):
+        pending = [
+            asyncio.ensure_future(
+                self.fetch_problem('slow', headers={'Authorization': auth}))
+            for auth in ('Bearer one', 'Bearer two')
+        ]
+        while UpstreamHandler.calls['slow'] < 2:
+            await asyncio.sleep(0.001)
+        self.assertEqual(len(self.cache.in_flight), 2)
+        UpstreamHandler.release.set()
+        await asyncio.gather(*pending)
+
+        for auth in ('Bearer one', 'Bearer two', 'Bearer one'):
+            await self.fetch_problem('cached', headers={'Authorization': auth})
+        self.assertEqual(UpstreamHandler.calls['cached'], 2)
+        await self.fetch_problem(
+            'cached', auth_username='user', auth_password='secret')
+        self.assertEqual(UpstreamHandler.calls['cached'], 3)
+
+    def test_that_cache_is_bounded(self):
+        response = httpclient.HTTPResponse(
+            httpclient.HTTPRequest('http://example.com/'),
+            404,
+            headers=httputil.HTTPHeaders({'Cache-Control': 'max-age=5'}))
+        for key in ('one', 'two', 'three'):
+            self.cache.store(key, response)
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.lookup('one'))
+        self.assertIsNotNone(self.cache.lookup('three'))
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_ttl_calculation(self):
+        def ttl(**headers):
+            response = httpclient.HTTPResponse(
+                httpclient.HTTPRequest('http://example.com/'),
+                404,
+                headers=httputil.HTTPHeaders(headers))
+            return self.cache.ttl(response)
+
+        self.assertIsNone(ttl())
+        self.assertEqual(ttl(**{'Cache-Control': 'public, max-age=10'}), 10)
+        self.assertIsNone(ttl(**{'Cache-Control': 'no-cache, max-age=10'}))
+        self.assertEqual(ttl(**{'Retry-After': '120'}), 120)
+        when = datetime.datetime.now(
+            datetime.timezone.utc) + datetime.timedelta(seconds=300)
+        self.assertAlmostEqual(
+            ttl(**{
+                'Retry-After': email.utils.format_datetime(when, usegmt=True)
+            }),
+            300,
+            delta=2)
+        self.assertIsNone(ttl(**{'Retry-After': 'soon'}))
+        self.cache.default_ttl = 15
+        self.assertEqual(ttl(), 15)
+
+
+@unittest.skipIf(validation.jsonschema is None, 'jsonschema is not installed')
+class SchemaValidatorTests(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = {
+            'components': {
+                'schemas': {
+                    'Item': {
+                        'type': 'object',
+                        'properties': {
+                            'name': {
+                                'type': 'string'
+                            },
+                            'tags': {
+                                'type': 'array',
+                                'items': {
+                                    '$ref': '#/components/schemas/Tag'
+                                }
+                            },
+                        },
+                        'required': ['name'],
+                    },
+                    'Tag': {
+                        'type': 'string',
+                        'maxLength': 4
+                    },
+                }
+            }
+        }
+        self.validator = validation.SchemaValidator(self.root, max_errors=3)
+
+    def test_valid_instance(self):
+        self.validator.validate({
+            'name': 'x',
+            'tags': ['a']
+        }, '#/components/schemas/Item')
+        self.assertTrue(
+            self.validator.is_valid({'name': 'x'},
+                                    '#/components/schemas/Item'))
+
+    def test_invalid_instance_raises_problem(self):
+        with self.assertRaises(problemdetails.Problem) as context:
+            self.validator.validate({'tags': ['toolong', 'a/b~cd']},
+                                    '#/components/schemas/Item')
+        problem = context.exception
+        self.assertEqual(problem.status_code, 422)
+        self.assertEqual(problem.document['title'],
+                         'Request validation failed')
+        self.assertEqual(problem.document['detail'],
+                         "'name' is a required property")
+        self.assertEqual(
+            sorted(p['name'] for p in problem.document['invalid-params']),
+            ['', '/tags/0', '/tags/1'])
+
+    def test_error_collection_is_limited(self):
+        instance = {'name': 'x', 'tags': ['toolong'] * 100}
+        errors = list(
+            self.validator.iter_errors(instance, '#/components/schemas/Item'))
+        self.assertEqual(len(errors), 3)
+
+    def test_validators_are_cached(self):
+        compiled = self.validator.compile('#/components/schemas/Item')
+        self.assertIs(
+            self.validator.compile('#/components/schemas/Item'), compiled)
+        schema = {'type': 'integer'}
+        compiled = self.validator.compile(schema)
+        self.assertIs(self.validator.compile(schema), compiled)
+        self.assertIsNot(self.validator.compile({'type': 'integer'}), compiled)
+        with_id = {'$id': 'urn:example:thing', 'type': 'integer'}
+        compiled = self.validator.compile(with_id)
+        self.assertIs(self.validator.compile(dict(with_id)), compiled)
+
+    def test_cache_is_bounded(self):
+        self.validator.maxsize = 2
+        for name in ('Item', 'Tag', 'Item', 'Tag'):
+            self.validator.compile('#/components/schemas/' + name)
+        self.validator.compile({'type': 'null'})
+        self.assertEqual(len(self.validator), 2)
+
+    def test_references_require_root(self):
+        with self.assertRaises(ValueError):
+            validation.SchemaValidator().compile('#/components/schemas/Tag')
+
+    def test_custom_problem_members(self):
+        validator = validation.SchemaValidator(
+            type='/errors#invalid', title='Invalid', member='failures')
+        with self.assertRaises(problemdetails.Problem) as context:
+            validator.validate('x', {'type': 'integer'})
+        document = context.exception.document
+        self.assertEqual(document['type'], '/errors#invalid')
+        self.assertEqual(document['title'], 'Invalid')
+        self.assertEqual(document['failures'],
+                         [{
+                             'name': '',
+                             'reason': "'x' is not of type 'integer'"
+                         }])
+
+
+class NotFoundHandlerTests(testing.AsyncHTTPTestCase):
+    def get_app(self):
+        return Application(
+            default_handler_class=problemdetails.NotFoundHandler,
+            log_function=problemdetails.NotFoundHandler.log_function)
+
+    def test_unmatched_urls_receive_problem_documents(self):
+        with mock.patch.object(handlers, 'access_log') as access_log:
+            response = self.fetch('/no/such/path')
+            self.assertEqual(response.code, 404)
+            self.assertEqual(response.headers['Content-Type'],
+                             'application/problem+json')
+            self.assertEqual(
+                json.loads(response.body.decode('utf-8')), {
+                    'type': handlers.type_link_map[404],
+                    'title': 'Not Found',
+                    'status': 404,
+                })
+            access_log.warning.assert_not_called()
+
+    def test_that_encoded_documents_are_reused(self):
+        first = self.fetch('/one')
+        with mock.patch.object(handlers.ErrorWriter.serializer,
+                               'dumps') as dumps:
+            second = self.fetch('/two', method='POST', body=b'')
+            dumps.assert_not_called()
+        self.assertEqual(second.code, 404)
+        self.assertEqual(first.body, second.body)
+
+    def test_that_requests_can_be_logged(self):
+        problemdetails.NotFoundHandler.log_requests = True
+        try:
+            with self.assertLogs('tornado.access', 'WARNING') as context:
+                self.fetch('/no/such/path')
+        finally:
+            problemdetails.NotFoundHandler.log_requests = False
+        self.assertEqual(len(context.records), 1)
+        self.assertTrue(context.records[0].getMessage().startswith(
+            '404 GET /no/such/path (127.0.0.1) '))
+
+    def test_that_other_requests_are_logged(self):
+        with self.assertLogs('tornado.access', 'INFO') as context:
+            self.fetch('/')
+        self.assertEqual(len(context.records), 1)
+        self.assertTrue(context.records[0].getMessage().startswith('200 '))
+
+
+class ConfiguredNotFoundHandlerTests(testing.AsyncHTTPTestCase):
+    def get_app(self):
+        return Application(
+            default_handler_class=problemdetails.NotFoundHandler,
+            default_handler_args={
+                'status_code': 410,
+                'type': '/errors#gone',
+                'title': 'Nothing to see here'
+            })
+
+    def test_configured_document(self):
+        response = self.fetch('/no/such/path')
+        self.assertEqual(response.code, 410)
+        self.assertEqual(
+            json.loads(response.body.decode('utf-8')), {
+                'type': '/errors#gone',
+                'title': 'Nothing to see here',
+                'status': 410,
+            })
+
+
+class OpenAPICatalogTests(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        problem_content = {
+            'application/problem+json': {
+                'example': {
+                    'type': '/errors#missing',
+                    'title': 'Item does not exist',
+                    'status': 404,
+                }
+            }
+        }
+        self.specification = {
+            'openapi': '3.0.2',
+            'paths': {
+                '/items/{id}': {
+                    'get': {
+                        'operationId': 'getItem',
+                        'responses': {
+                            '200': {
+                                'content': {
+                                    'application/json': {}
+                                }
+                            },
+                            '404': {
+                                'content': problem_content
+                            },
+                            '429': {
+                                '$ref': '#/components/responses/Throttled'
+                            },
+                        }
+                    },
+                    'delete': {
+                        'responses': {
+                            '409': {
+                                'content': {
+                                    'application/problem+json': {
+                                        'examples': {
+                                            'locked': {
+                                                'value': {
+                                                    'title': 'Locked'
+                                                }
+                                            }
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    },
+                }
+            },
+            'components': {
+                'responses': {
+                    'Throttled': {
+                        'content': {
+                            'application/problem+json': {
+                                'schema': {
+                                    'type': 'object'
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+
+    def test_problem_types_are_compiled(self):
+        with mock.patch.object(openapi.app_log, 'info') as info:
+            problems = openapi.OpenAPICatalog(self.specification)
+        info.assert_called_once()
+        self.assertEqual(problems.pending, 0)
+        self.assertEqual(problems.operations,
+                         {'getItem', 'DELETE /items/{id}'})
+        self.assertEqual(
+            sorted(problem_type.name for problem_type in problems),
+            ['DELETE /items/{id}:409', 'getItem:404', 'getItem:429'])
+        self.assertEqual(problems.report.operations, 2)
+        self.assertEqual(problems.report.problem_types, 3)
+        self.assertGreater(problems.report.seconds, 0.0)
+        self.assertIsNone(problems.report.memory_bytes)
+
+        problem = problems['getItem:404'](instance='/items/1')
+        self.assertEqual(problem.status_code, 404)
+        self.assertEqual(
+            problem.document, {
+                'type': '/errors#missing',
+                'title': 'Item does not exist',
+                'status': 404,
+                'instance': '/items/1',
+            })
+        self.assertEqual(problems['getItem:429']().document, {'status': 429})
+        self.assertEqual(problems['DELETE /items/{id}:409'].title, 'Locked')
+
+    def test_templates_are_encoded(self):
+        serializer = serializers.StdlibSerializer()
+        problems = openapi.OpenAPICatalog(
+            self.specification, serializers=[serializer])
+        problem_type = problems['getItem:404']
+        with mock.patch.object(serializer, 'dumps') as dumps:
+            template = problem_type.template(serializer,
+                                             handlers.type_link_map[404])
+            dumps.assert_not_called()
+        self.assertIsNotNone(template)
+
+    def test_lazy_compilation(self):
+        problems = openapi.OpenAPICatalog(
+            self.specification, lazy=True, measure_memory=True)
+        self.assertEqual(problems.pending, 2)
+        self.assertEqual(problems.report.problem_types, 0)
+
+        self.assertIn('getItem:404', problems)
+        self.assertEqual(problems.pending, 1)
+        self.assertEqual(problems.report.operations, 1)
+        self.assertEqual(problems.report.problem_types, 2)
+        self.assertGreaterEqual(problems.report.memory_bytes, 0)
+
+        problems.compile('getItem')
+        self.assertEqual(problems.report.operations, 1)
+        with self.assertRaises(KeyError):
+            problems.compile('unknown')
+        self.assertNotIn('unknown:404', problems)
+
+        self.assertEqual(len(problems), 3)
+        self.assertEqual(problems.pending, 0)
+
+    def test_invalid_references(self):
+        self.specification['paths']['/items/{id}']['get']['responses']['429'][
+            '$ref'] = 'https://example.com/openapi.json#/Throttled'
+        with self.assertRaises(ValueError):
+            openapi.OpenAPICatalog(self.specification)
+
+
+class ImportTests(unittest.TestCase):
+    def test_import_time_budget(self):
+        result = benchmarks.measure_import_time(repeat=3)
+        self.assertLess(result['min'], benchmarks.IMPORT_TIME_BUDGET)
+
+    def test_optional_modules_are_imported_lazily(self):
+        script = ('import sys, problemdetails\n'
+                  'sys.stdout.write(" ".join(sorted(sys.modules)))\n')
+        modules = subprocess.run([sys.executable, '-c', script],
+                                 capture_output=True,
+                                 check=True,
+                                 text=True).stdout.split()
+        for name in ('cbor2', 'jsonschema', 'msgpack', 'orjson',
+                     'problemdetails.client', 'problemdetails.openapi',
+                     'problemdetails.shedding', 'problemdetails.validation',
+                     'tornado.httpclient', 'ujson'):
+            self.assertNotIn(name, modules)
+
+    def test_lazy_attributes(self):
+        self.assertIs(problemdetails.SchemaValidator,
+                      validation.SchemaValidator)
+        self.assertEqual(problemdetails.version_info[0],
+                         int(problemdetails.version.split('.')[0]))
+        self.assertIn('ProblemClient', dir(problemdetails))
+        with self.assertRaises(AttributeError):
+            problemdetails.does_not_exist
+
+
+class MemorySink:
+    def __init__(self):
+        self.batches = []
+        self.error = None
+
+    async def write(self, batch):
+        await asyncio.sleep(0)
+        if self.error is not None:
+            raise self.error
+        self.batches.append(list(batch))
+
+
+class ProblemEventTests(testing.AsyncHTTPTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sink = MemorySink()
+        self.recorder = events.ProblemEventRecorder(
+            self.sink, batch_size=2, interval=0.01)
+        handlers.ErrorWriter.problem_events = self.recorder
+
+    def tearDown(self):
+        handlers.ErrorWriter.problem_events = None
+        super().tearDown()
+
+    def get_app(self):
+        return Application()
+
+    def test_that_problem_responses_are_recorded(self):
+        self.fetch('/?status=404', headers={'X-Request-Id': 'abc'})
+        self.fetch('/?status=409&raise_error=1&instance=/things/1')
+        self.io_loop.run_sync(self.recorder.flush)
+
+        self.assertEqual(len(self.sink.batches), 1)
+        first, second = self.sink.batches[0]
+        self.assertEqual(first.status, 404)
+        self.assertEqual(first.type, handlers.type_link_map[404])
+        self.assertIsNone(first.instance)
+        self.assertEqual(first.request_id, 'abc')
+        self.assertGreaterEqual(first.elapsed, 0.0)
+        self.assertEqual((second.status, second.instance), (409, '/things/1'))
+        self.assertIsNone(second.request_id)
+        self.assertEqual(self.recorder.written, 2)
+
+    @testing.gen_test
+    async def test_that_events_are_written_in_the_background(self):
+        self.recorder.start()
+        for _ in range(3):
+            await self.http_client.fetch(
+                self.get_url('/?status=400'), raise_error=False)
+        while self.recorder.written < 2:
+            await asyncio.sleep(0.001)
+        await self.recorder.stop()
+        self.assertEqual([len(batch) for batch in self.sink.batches], [2, 1])
+        self.assertEqual(len(self.recorder), 0)
+
+    def test_that_full_buffers_drop_the_oldest_events(self):
+        recorder = events.ProblemEventRecorder(self.sink, maxsize=2)
+        for status in (400, 401, 402):
+            recorder.record(
+                events.ProblemEvent(0.0, status, None, None, None, 0.0))
+        self.assertEqual(recorder.recorded, 3)
+        self.assertEqual(recorder.dropped, 1)
+        self.io_loop.run_sync(recorder.flush)
+        self.assertEqual([event.status for event in self.sink.batches[0]],
+                         [401, 402])
+
+    def test_that_sink_failures_are_counted(self):
+        self.sink.error = OSError('disk full')
+        self.fetch('/?status=404')
+        with mock.patch.object(events.app_log, 'error') as error:
+            self.io_loop.run_sync(self.recorder.flush)
+        error.assert_called_once()
+        self.assertEqual(self.recorder.failed, 1)
+        self.assertEqual(self.recorder.written, 0)
+
+    def test_that_counters_are_exposed_as_metrics(self):
+        self._app.add_handlers('.*$', [
+            web.url('/event-metrics', problemdetails.MetricsHandler,
+                    {'metrics': self.recorder})
+        ])
+        self.fetch('/?status=404')
+        body = self.fetch('/event-metrics').body.decode('utf-8')
+        self.assertIn('problemdetails_events_recorded_total 1\n', body)
+        self.assertIn('problemdetails_events_dropped_total 0\n', body)
+        self.assertIn('problemdetails_events_buffered 1\n', body)
+
+
+class JSONLinesSinkTests(testing.AsyncTestCase):
+    @testing.gen_test
+    async def test_that_events_are_appended(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'events.jsonl')
+            sink = events.JSONLinesSink(path)
+            await sink.write([
+                events.ProblemEvent(1.5, 404, '/errors#missing', '/x', 'id',
+                                    0.25)
+            ])
+            await sink.write(
+                [events.ProblemEvent(2.5, 500, None, None, None, 0.5)])
+            with open(path, encoding='utf-8') as input_file:
+                lines = [json.loads(line) for line in input_file]
+        self.assertEqual(lines, [{
+            'timestamp': 1.5,
+            'status': 404,
+            'type': '/errors#missing',
+            'instance': '/x',
+            'request_id': 'id',
+            'elapsed': 0.25,
+        },
+                                 {
+                                     'timestamp': 2.5,
+                                     'status': 500,
+                                     'type': None,
+                                     'instance': None,
+                                     'request_id': None,
+                                     'elapsed': 0.5,
+                                 }])
+
+
+class SharedProblemCountersTests(testing.AsyncHTTPTestCase):
+    def setUp(self):
+        super().setUp()
+        self.counters = problemdetails.SharedProblemCounters(
+            workers=3, types=plain_catalog)
+        handlers.ErrorWriter.problem_counters = self.counters
+
+    def tearDown(self):
+        handlers.ErrorWriter.problem_counters = None
+        super().tearDown()
+
+    def get_app(self):
+        return Application()
+
+    def test_that_responses_are_counted(self):
+        self.fetch('/?status=404')
+        self.fetch('/?status=404&type=/errors%23unknown')
+        self.fetch('/?status=700')
+        self.fetch('/catalog/throttled')
+        self.assertEqual(
+            self.counters.snapshot(), {
+                (404, handlers.type_link_map[404]): 1,
+                (404, None): 1,
+                (0, None): 1,
+                (429, handlers.type_link_map[429]): 1,
+            })
+        self.assertEqual(self.counters.snapshot(),
+                         self.counters.worker_snapshot(0))
+
+    def test_that_totals_are_exposed_as_metrics(self):
+        self._app.add_handlers('.*$', [
+            web.url('/shared-metrics', problemdetails.MetricsHandler,
+                    {'metrics': self.counters})
+        ])
+        self.fetch('/?status=404')
+        body = self.fetch('/shared-metrics').body.decode('utf-8')
+        self.assertIn(
+            'problemdetails_shared_responses_total{status="404",'
+            f'type="{handlers.type_link_map[404]}"}} 1\n', body)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'requires os.fork')
+    def test_that_workers_share_the_counters(self):
+        type_ = handlers.type_link_map[404]
+        pids = []
+        for task_id in (1, 2):
+            pid = os.fork()
+            if pid == 0:  # pragma: no cover
+                try:
+                    with mock.patch.object(
+                            counters.process, 'task_id', return_value=task_id):
+                        for _ in range(task_id):
+                            self.counters.increment(404, type_)
+                finally:
+                    os._exit(0)
+            pids.append(pid)
+        for pid in pids:
+            os.waitpid(pid, 0)
+        self.counters.increment(404, type_)
+
+        self.assertEqual(self.counters.snapshot(), {(404, type_): 4})
+        self.assertEqual(self.counters.worker_snapshot(2), {(404, type_): 2})
+
+    def test_that_extra_workers_are_counted_as_overflows(self):
+        with mock.patch.object(counters.process, 'task_id', return_value=3):
+            with self.assertLogs('tornado.application', 'WARNING'):
+                response = self.fetch('/?status=404')
+            self.fetch('/?status=404')
+        self.assertEqual(response.code, 404)
+        self.assertEqual(
+            json.loads(response.body.decode('utf-8'))['status'], 404)
+        self.assertEqual(self.counters.overflows, 2)
+        self.assertEqual(self.counters.snapshot(), {})
+
+    def test_that_rows_being_updated_are_read(self):
+        self.counters.increment(500, None)
+        self.counters._counts[0] += 1  # simulate an interrupted update
+        self.assertEqual(self.counters.worker_snapshot(0), {(500, None): 1})